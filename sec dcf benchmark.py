@@ -0,0 +1,620 @@
+# Benchmarks for "sec dcf v3 with user key and mail blank.py". Like the main program, this was written as a Python
+# learning exercise and is not intended for stock trading or any other purpose.
+#
+# The IRR benchmark compares the batched IRR routine (batchIRR) with calling npf.irr once per stock, on randomly
+# generated share purchase cashflows of the same form the main program builds: minus the share price in year 0 and
+# then the newest EPS growing at a constant rate for yrsDiscted years. It reports the largest difference between the
+# two sets of results and the number of stocks per second each can value. The solver benchmark does the same for the
+# breakeven growth solver.
+#
+# The end-to-end benchmark runs the whole main program on a few hundred made-up tickers without touching the SEC or
+# financial modeling prep. The fixtures (company facts, submissions, split histories, share prices and the ticker
+# list) were generated from a fixed random seed and are recorded in the zip archive fixtureFile, which is kept with
+# this script, so every run replays the same data. They are only generated again if the archive is missing or was
+# made with other settings. They include the awkward cases: missing frames, negative EPS, negative growth, splits,
+# splits with a zero denominator, fiscal years ending in January and in June, quarterly as well as annual net income
+# frames, companies without comprehensive income, tickers unknown to the SEC, missing company facts and missing
+# prices. A local stand-in server serves them over http with a configurable latency and share of 429 (too many
+# requests) responses, and the main program's base urls are pointed at it. The server runs in a process of its own
+# so it doesn't compete with the program for the interpreter. The program runs twice, first with an empty cache and
+# store (cold) and then again with them (warm), and a third time, cold, to measure the peak memory allocated by
+# Python (tracemalloc slows the program down too much to time it in the same run). Last come cold runs sharded over
+# the numbers of processes in benchmarkShards, to show how the throughput scales with the shards.
+#
+# Reported are tickers per second, the time spent in each stage, the peak memory and the responses served. These
+# depend on the machine, so they are compared with those of an earlier run on the same machine, stored in
+# throughputFile (not kept with this script), and any that are worse by more than regressionTolerance are flagged.
+# The warm and sharded runs must value every ticker as the cold run did, and the cold run as recorded in baselineFile,
+# which is kept with this script; tickers valued differently are listed. The stand-in server's url, which changes
+# from run to run, is taken out of the results before they are compared. Both files are written when they don't
+# exist yet, or when updateBaseline is set.
+#
+# The main program's functions are loaded from its file without running the program itself.
+
+# For Python 3.0 and later
+import ast
+import contextlib
+import hashlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time as time
+import tracemalloc
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+import numpy as np
+import numpy_financial as npf
+
+
+# ---------------------------------------------------------------------------------------------------
+# load the main program as a module. Its valuation loop only runs when it is started as a script, so this just
+# defines its functions and reads its user input section. The module is registered as "secdcf" so that the shard
+# processes of a sharded run can find its functions.
+def loadMainProgram():
+    here = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location("secdcf", os.path.join(here, mainProgramFile))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["secdcf"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# ---------------------------------------------------------------------------------------------------
+# the program's printing to the null device, at the file descriptor level, so that the shard processes of a sharded
+# run, which are started afresh with their own sys.stdout, are quiet too
+@contextlib.contextmanager
+def quietOutput():
+    sys.stdout.flush()
+    savedStdout = os.dup(1)
+    with open(os.devnull, "w") as devNull:
+        os.dup2(devNull.fileno(), 1)
+        try:
+            with contextlib.redirect_stdout(devNull):
+                yield
+        finally:
+            os.dup2(savedStdout, 1)
+            os.close(savedStdout)
+
+
+# ---------------------------------------------------------------------------------------------------
+# run the main program's 'if __name__ == "__main__":' block inside a module from loadMainProgram, so the module's user
+# inputs can be changed beforehand and its functions wrapped for timing
+def runMainBlock(secdcf):
+    with open(secdcf.__file__, "r", encoding="utf-8") as sourceFile:
+        tree = ast.parse(sourceFile.read())
+    mainBlock = [node for node in tree.body if isinstance(node, ast.If) and "__main__" in ast.unparse(node.test)]
+    code = compile(ast.Module(body=mainBlock[0].body, type_ignores=[]), secdcf.__file__, "exec")
+    try:
+        exec(code, secdcf.__dict__)
+    except SystemExit:
+        pass
+
+
+# ---------------------------------------------------------------------------------------------------
+# random share purchase cashflows, one row per stock, for prices, EPS and growth rates in a realistic range
+def randomCashflows(secdcf, nStocks, years, seed):
+    rng = np.random.default_rng(seed)
+    price = rng.uniform(5.0, 1000.0, nStocks)
+    epsNewest = price / rng.uniform(5.0, 80.0, nStocks)  # price/earnings ratios of 5 to 80
+    growthPct = rng.uniform(-20.0, 40.0, nStocks)
+    return secdcf.projectCashflows(price, epsNewest, growthPct, years)
+
+
+# ---------------------------------------------------------------------------------------------------
+# times batchIRR against npf.irr on the same cashflows. Returns a dictionary of the results.
+def benchmarkIRR(secdcf, nStocks, years, seed=0):
+    cashflows = randomCashflows(secdcf, nStocks, years, seed)
+
+    startTime = time.perf_counter()
+    reference = np.array([npf.irr(cashflows[row]) for row in range(nStocks)])
+    npfSeconds = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    batched = secdcf.batchIRR(cashflows)
+    batchSeconds = time.perf_counter() - startTime
+
+    bothFound = ~np.isnan(reference) & ~np.isnan(batched)
+    return {"stocks": nStocks, "years": years,
+            "max abs diff": float(np.max(np.abs(batched[bothFound] - reference[bothFound]))),
+            "nan mismatches": int(np.sum(np.isnan(reference) != np.isnan(batched))),
+            "npf.irr stocks/sec": nStocks / npfSeconds, "batchIRR stocks/sec": nStocks / batchSeconds,
+            "speed-up": npfSeconds / batchSeconds}
+
+
+# ---------------------------------------------------------------------------------------------------
+# times the breakeven growth solver on random stocks. Returns a dictionary of the results.
+def benchmarkSolver(secdcf, nStocks, years, seed=0):
+    rng = np.random.default_rng(seed)
+    price = rng.uniform(5.0, 1000.0, nStocks)
+    epsNewest = price / rng.uniform(5.0, 80.0, nStocks)
+    startTime = time.perf_counter()
+    growth, status, iterations, residual = secdcf.breakevenGrowth(price, epsNewest, secdcf.disctFactor, years)
+    seconds = time.perf_counter() - startTime
+    return {"stocks": nStocks, "years": years, "solved": int(np.sum(status == secdcf.SOLVER_OK)),
+            "max iterations": int(np.max(iterations)), "solver stocks/sec": nStocks / seconds}
+
+
+# ---------------------------------------------------------------------------------------------------
+# the last day of a month, as a date string. month may run past 12 into the following years.
+def monthEnd(year, month):
+    nextMonth = np.datetime64("2000-01") + np.timedelta64((year - 2000) * 12 + month, "M")
+    return str(nextMonth.astype("datetime64[D]") - 1)
+
+
+# the duration records of one fiscal year, labelled year, and of its four quarters, with the frames the SEC gives them:
+# the calendar year or quarter that most of the period falls in. A fiscal year ending in January 2021 or June 2021 is
+# CY2020, its quarter ending in March 2021 CY2021Q1. Values are filled in later.
+def fiscalRecords(year, yearEndMonth):
+    lastMonth = yearEndMonth + (0 if yearEndMonth >= 7 else 12)  # months from the start of year to the year end
+    end = monthEnd(year, lastMonth)
+    filed = str(np.datetime64(end) + 45)
+    annual = {"start": str(np.datetime64(monthEnd(year, lastMonth - 12)) + 1), "end": end,
+              "accn": "0000000000-" + filed[2:4] + "-000001", "fy": year, "fp": "FY", "form": "10-K",
+              "filed": filed, "frame": "CY" + str(year)}
+    quarters = []
+    for quarter in range(1, 5):
+        quarterEnd = lastMonth - 12 + 3 * quarter
+        middle = quarterEnd - 1  # the month in the middle of the quarter decides its frame
+        frame = "CY" + str(year + (middle - 1) // 12) + "Q" + str((middle - 1) % 12 // 3 + 1)
+        quarters.append(dict(annual, start=str(np.datetime64(monthEnd(year, quarterEnd - 3)) + 1),
+                             end=monthEnd(year, quarterEnd), fp="Q" + str(quarter), form="10-Q", frame=frame))
+    return [annual, quarters]
+
+
+# ---------------------------------------------------------------------------------------------------
+# the company facts of one made-up filer, in the form of the SEC companyfacts api. growth is the annual EPS growth
+# as a fraction, yearEndMonth the month its fiscal years end in (1 to 12), splitDate a date string or "", and
+# fillerConcepts the number of unused concepts added so the payload is closer to the size of a real filer's. EPS
+# comes with annual and quarterly frames, net income with quarterly ones only if quarterlyIncome is set.
+def fixtureFacts(cik, name, epsOldest, growth, shares, yearEndMonth, splitDate, splitRatio, skipYears,
+                 quarterlyIncome, noComprehensiveIncome, fillerConcepts, rng):
+    eps, income, filler = [], [], {}
+    for year in range(2008, 2024):
+        if year in skipYears:
+            continue
+        epsYear = epsOldest * (1 + growth) ** (year - 2008)
+        incomeYear = epsYear * shares * (1 - 0.01 * (year - 2008))
+        annual, quarters = fiscalRecords(year, yearEndMonth)
+        for record, share in [[annual, 1]] + [[quarter, 4] for quarter in quarters]:
+            splitFactor = splitRatio if splitDate != "" and record["end"] < splitDate else 1.0  # as reported
+            eps.append(dict(record, val=round(epsYear * splitFactor / share, 4)))
+            if share == 1 or quarterlyIncome:
+                income.append(dict(record, val=round(incomeYear / share)))
+    usGaap = {"EarningsPerShareDiluted": {"label": "Earnings Per Share, Diluted", "description": "EPS",
+                                          "units": {"USD/shares": eps}},
+              "NetIncomeLoss": {"label": "Net Income (Loss)", "description": "NI", "units": {"USD": income}}}
+    if not noComprehensiveIncome:
+        usGaap["ComprehensiveIncomeNetOfTax"] = {"label": "Comprehensive Income", "description": "CI",
+                                                 "units": {"USD": income}}
+    for number in range(fillerConcepts):
+        filler["FillerConcept" + str(number)] = {"label": "Filler " + str(number), "description": "unused",
+                                                 "units": {"USD": [{"end": str(year) + "-12-31",
+                                                                    "val": int(rng.integers(0, 10 ** 9)),
+                                                                    "fy": year, "fp": "FY", "form": "10-K",
+                                                                    "filed": str(year + 1) + "-02-15"}
+                                                                   for year in range(2004, 2024)]}}
+    usGaap.update(filler)
+    return {"cik": int(cik), "entityName": name, "facts": {"us-gaap": usGaap}}
+
+
+# ---------------------------------------------------------------------------------------------------
+# records the fixtures for nTickers made-up tickers in the zip archive fileName, unless it holds fixtures with the
+# same settings already. The archive has the layout of the two hosts' paths, e.g.
+# sec/api/xbrl/companyfacts/CIK0001000000.json, plus "fixture settings.json" with the settings and the tickers.
+def makeFixtures(fileName, nTickers, fillerConcepts, seed):
+    settings = {"tickers": nTickers, "filler concepts": fillerConcepts, "seed": seed}
+    if os.path.exists(fileName):
+        with zipfile.ZipFile(fileName, "r") as existing:
+            if json.loads(existing.read("fixture settings.json"))["settings"] == settings:
+                return
+
+    tickers = ["B" + "".join(chr(65 + (i // 26 ** place) % 26) for place in (2, 1, 0)) for i in range(nTickers)]
+    rng = np.random.default_rng(seed)
+    tickerList, prices = {}, {}
+    with zipfile.ZipFile(fileName, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for i, ticker in enumerate(tickers):
+            cik = str(1000000 + i).zfill(10)
+            growth = rng.uniform(-0.05, 0.2)
+            epsOldest = rng.uniform(0.5, 5.0)
+            splitDate, splitRatio, splits = "", 1.0, []
+            if i % 11 == 3 or i % 31 == 5:
+                splitDate = str(rng.integers(2012, 2023)) + "-06-15"
+                splitRatio = float(rng.choice([2.0, 3.0, 4.0]))
+                splits = [{"date": splitDate, "label": "split", "numerator": splitRatio,
+                           "denominator": 0.0 if i % 31 == 5 else 1.0}]
+            skipYears = set(rng.choice(range(2008, 2024), 3, replace=False).tolist()) if i % 13 == 4 else set()
+            if i % 17 == 6:
+                growth = -0.3  # EPS falls until it is negative in the newest year
+                epsOldest = -epsOldest if i % 34 == 6 else epsOldest
+            yearEndMonth = {2: 1, 5: 6}.get(i % 7, 12)  # retailers' January and June fiscal years besides December
+            facts = fixtureFacts(cik, ticker + " Holdings", epsOldest, growth, rng.uniform(5e7, 5e9), yearEndMonth,
+                                 splitDate, splitRatio, skipYears, i % 3 == 1, i % 19 == 7, fillerConcepts, rng)
+
+            if i % 23 != 8:  # the others are unknown to the SEC ticker list and to financial modeling prep
+                tickerList[str(len(tickerList))] = {"cik_str": int(cik), "ticker": ticker,
+                                                    "title": ticker + " Holdings"}
+            if i % 29 != 9:  # the others have no company facts
+                archive.writestr("sec/api/xbrl/companyfacts/CIK" + cik + ".json", json.dumps(facts))
+            archive.writestr("sec/submissions/CIK" + cik + ".json",
+                             json.dumps({"cik": cik, "name": ticker + " Holdings",
+                                         "filings": {"recent": {"accessionNumber": ["0000000000-24-" + cik[-6:]],
+                                                                "form": ["10-K"], "filingDate": ["2024-02-15"]}}}))
+            archive.writestr("fmp/api/v3/historical-price-full/stock_split/" + ticker + ".json",
+                             json.dumps({"symbol": ticker, "historical": splits} if splits else {}))
+            archive.writestr("fmp/api/v3/income-statement/" + ticker + ".json", json.dumps([]))
+            if i % 37 != 10:  # the others have no share price
+                epsNewest = abs(epsOldest) * (1 + growth) ** 15
+                prices[ticker] = round(float(epsNewest * rng.uniform(8.0, 40.0)), 2)
+
+        archive.writestr("sec/files/company_tickers.json", json.dumps(tickerList))
+        archive.writestr("fmp/prices.json", json.dumps(prices))
+        archive.writestr("fixture settings.json", json.dumps({"settings": settings, "tickers": tickers}))
+
+
+# the list of tickers recorded in the fixture archive fileName, including those the stand-in knows nothing about
+def recordedTickers(fileName):
+    with zipfile.ZipFile(fileName, "r") as archive:
+        return json.loads(archive.read("fixture settings.json"))["tickers"]
+
+
+# ---------------------------------------------------------------------------------------------------
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves the fixtures in the archive from makeFixtures in place of the SEC and financial modeling prep. Paths
+    starting /api/v3/ are financial modeling prep's, the rest the SEC's. Every response waits latency seconds first,
+    and a share rate429 of the requests get a 429 (too many requests) instead. Unknown files get a 404. Responses
+    carry an ETag, and a request whose If-None-Match matches it gets a 304 (not modified). /stand-in/counts returns
+    the number of responses by status code since it was last asked, and isn't counted itself.
+    """
+
+    fixtures = None  # the zip archive, open for reading
+    prices = {}
+    latency = 0.0
+    rate429 = 0.0
+    rng = np.random.default_rng(0)
+    lock = threading.Lock()
+    counts = {}
+
+    def count(self, status):
+        with self.lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+    def respond(self, status, body=b"", headers=None):
+        self.count(status)
+        self.send_response(status)
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stand-in/counts":
+            with self.lock:
+                body = json.dumps(self.counts).encode()
+                self.counts.clear()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        time.sleep(self.latency)
+        with self.lock:
+            tooMany = self.rng.random() < self.rate429
+        if tooMany:
+            self.respond(429, b"", {"Retry-After": "1"})
+            return
+
+        path = urlsplit(self.path).path
+        if path.startswith("/api/v3/quote/"):
+            body = json.dumps([{"symbol": ticker, "price": self.prices[ticker]}
+                               for ticker in path[len("/api/v3/quote/"):].split(",") if ticker in self.prices]).encode()
+        else:
+            member = ("fmp/" if path.startswith("/api/v3/") else "sec/") + path.lstrip("/")
+            if not member.endswith(".json"):
+                member = member + ".json"
+            with self.lock:
+                try:
+                    body = self.fixtures.read(member)
+                except KeyError:
+                    body = None
+            if body is None:
+                self.respond(404)
+                return
+
+        etag = '"' + hashlib.sha256(body).hexdigest()[0:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.respond(304, b"", {"ETag": etag})
+            return
+        self.respond(200, body, {"Content-Type": "application/json", "ETag": etag})
+
+    def log_message(self, format, *args):  # no log line per request
+        pass
+
+
+# ---------------------------------------------------------------------------------------------------
+# the stand-in server process: serves the fixture archive fileName on a free local port, which it puts on portQueue
+def serveStandIn(fileName, latency, rate429, portQueue):
+    StandInHandler.fixtures = zipfile.ZipFile(fileName, "r")
+    StandInHandler.prices = json.loads(StandInHandler.fixtures.read("fmp/prices.json"))
+    StandInHandler.latency = latency
+    StandInHandler.rate429 = rate429
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    portQueue.put(server.server_address[1])
+    server.serve_forever()
+
+
+# starts the stand-in server process. Returns the process and the server's base url.
+def startStandIn(fileName, latency, rate429):
+    portQueue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serveStandIn, args=(fileName, latency, rate429, portQueue), daemon=True)
+    process.start()
+    return process, "http://127.0.0.1:" + str(portQueue.get(timeout=60))
+
+
+# the responses the stand-in server has sent since last asked, as a dictionary of status code -> count
+def standInCounts(baseURL):
+    with urlopen(baseURL + "/stand-in/counts") as response:
+        return json.loads(response.read())
+
+
+# ---------------------------------------------------------------------------------------------------
+# wraps a function of the main program so the seconds spent in it add up in stageSeconds[stage]. Calls from the
+# fetch threads add up too, so a stage run in threads can take more seconds than the whole run.
+def timeStage(stageSeconds, stage, function):
+    lock = threading.Lock()
+
+    def timed(*args, **kwargs):
+        startTime = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            with lock:
+                stageSeconds[stage] = stageSeconds.get(stage, 0.0) + time.perf_counter() - startTime
+    return timed
+
+
+# the time the valuation loop waits for the fetch pipeline to hand it the next stock
+def timePipeline(stageSeconds, function):
+    def timed(stocks, maxInFlight):
+        pipeline = function(stocks, maxInFlight)
+        while True:
+            startTime = time.perf_counter()
+            try:
+                item = next(pipeline)
+            except StopIteration:
+                return
+            finally:
+                stageSeconds["waiting for fetch"] = stageSeconds.get("waiting for fetch", 0.0) + \
+                                                    time.perf_counter() - startTime
+            yield item
+    return timed
+
+
+# ---------------------------------------------------------------------------------------------------
+# one run of the whole main program against the stand-in server, in workDirectory (where its cache, store, journal
+# and Excel file go), with the program's own printing switched off. With trackMemory the peak memory is measured
+# as well, which makes the run much slower. With shards > 1 the run is sharded over that many processes; the stage
+# seconds then only cover the coordinator. Returns a dictionary of the results.
+def benchmarkEndToEnd(baseURL, tickers, workDirectory, trackMemory=False, shards=1):
+    secdcf = loadMainProgram()
+    secdcf.myApiKey = "benchmark"
+    secdcf.myEmail = "benchmark@example.com"
+    secdcf.stockListInput = tickers
+    secdcf.listDescription = "benchmark"
+    secdcf.secDataURL = secdcf.secWebURL = secdcf.fmpURL = baseURL
+    secdcf.secRequestsPerSec = secdcf.fmpRequestsPerSec = benchmarkRequestsPerSec
+    secdcf.offlineMode = False
+    secdcf.sensitivityMode = False
+    secdcf.shardCount = shards
+
+    stageSeconds: dict = {}
+    for stage, functionName in [["ticker map", "loadTickerMap"], ["share prices", "fetchQuotes"],
+                                ["fetch (thread seconds)", "fetchStock"], ["valuation", "valueGathered"]]:
+        setattr(secdcf, functionName, timeStage(stageSeconds, stage, getattr(secdcf, functionName)))
+    secdcf.fetchPipeline = timePipeline(stageSeconds, secdcf.fetchPipeline)
+    secdcf.ResultJournal.append = timeStage(stageSeconds, "journal", secdcf.ResultJournal.append)
+
+    here = os.getcwd()
+    os.chdir(workDirectory)
+    if trackMemory:
+        tracemalloc.start()
+    startTime = time.perf_counter()
+    try:
+        with quietOutput():
+            runMainBlock(secdcf)
+    finally:
+        seconds = time.perf_counter() - startTime
+        peakBytes = tracemalloc.get_traced_memory()[1] if trackMemory else 0
+        tracemalloc.stop()
+        os.chdir(here)
+
+    results = valuationResults(secdcf, workDirectory, baseURL)
+    return {"tickers": len(tickers), "seconds": seconds, "tickers/sec": len(tickers) / seconds,
+            "valued": sum("IRR %" in row for row in results.values()),
+            "with warnings": sum("Warnings if any" in row for row in results.values()),
+            "peak MB": peakBytes / 2 ** 20, "stage seconds": stageSeconds, "responses": standInCounts(baseURL),
+            "results": results}
+
+
+# ---------------------------------------------------------------------------------------------------
+# the checkedColumns of the results of a run in workDirectory, read from its journal(s), as a dictionary of ticker ->
+# {column: value}, leaving out empty cells and with numbers rounded to 6 places, so they can be stored as json. The
+# stand-in server's url in a text, e.g. a warning, becomes "<stand-in>".
+def valuationResults(secdcf, workDirectory, baseURL):
+    results = {}
+    for journalName in secdcf.journalFiles:
+        journalPath = os.path.join(workDirectory, journalName)
+        if not os.path.exists(journalPath):
+            continue
+        for ticker, row in secdcf.ResultJournal.rows(journalPath):
+            results[ticker] = {}
+            for column in checkedColumns:
+                value = row.get(column)
+                if isinstance(value, float):
+                    if not np.isfinite(value):
+                        continue
+                    value = round(value, 6)
+                if isinstance(value, str):
+                    value = value.replace(baseURL, "<stand-in>")
+                if value is not None:
+                    results[ticker][column] = value
+    return results
+
+
+# the tickers valued differently in two runs' valuationResults: with a cell empty in one of them, another text, or
+# numbers further apart than the rounding
+def differingTickers(expected, actual):
+    def same(a, b):
+        if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+            return abs(a - b) <= 2e-6 * max(1.0, abs(a))
+        return a == b
+
+    return [ticker for ticker in sorted(set(expected) | set(actual))
+            if set(expected.get(ticker, {})) != set(actual.get(ticker, {}))
+            or not all(same(value, actual[ticker][column]) for column, value in expected[ticker].items())]
+
+
+# ---------------------------------------------------------------------------------------------------
+# compares the benchmark metrics with the baseline. metrics is a dictionary of name -> [value, True if higher is
+# better]. Returns the list of metrics worse than the baseline by more than the tolerance.
+def compareBaseline(metrics, baseline, tolerance):
+    regressions = []
+    for name, (value, higherIsBetter) in metrics.items():
+        if name not in baseline:
+            continue
+        base = baseline[name][0]
+        worse = value < base * (1 - tolerance) if higherIsBetter else value > base * (1 + tolerance)
+        if worse:
+            regressions.append([name, base, value])
+    return regressions
+
+
+# -----------------------------------------------------user input//////////////////////////////////////////////////
+mainProgramFile: str = "sec dcf v3 with user key and mail blank.py"
+
+# number of random stocks and the horizons (yrsDiscted) to benchmark
+irrStocks: int = 5000
+irrHorizons: list = [5, 15, 30]
+solverStocks: int = 100000
+
+# the end-to-end benchmark: number of made-up tickers, unused concepts per filer (payload size), the stand-in
+# server's latency per request in seconds and share of 429 responses, and the request rate allowed to the program
+fixtureFile: str = "sec dcf benchmark fixtures.zip"
+fixtureTickers: int = 300
+fixtureFillerConcepts: int = 20
+fixtureSeed: int = 2023
+standInLatency: float = 0.02
+standIn429Rate: float = 0.01
+benchmarkRequestsPerSec: float = 1000.0
+# cold runs sharded over each of these numbers of processes (see shardCount in the main program)
+benchmarkShards: list = [2, 4]
+
+# stored results to compare with: the valuations (the columns of the results table in checkedColumns), which must
+# come out the same in every run, and this machine's throughput, which may be worse by regressionTolerance (as a
+# fraction) before it is flagged
+baselineFile: str = "sec dcf benchmark baseline.json"
+throughputFile: str = "sec dcf benchmark throughput.json"
+checkedColumns: list = ["Newest yr history", "Net income concept", "EPS gr % pa", "Req gr % pa for NPV break-even",
+                        "IRR %", "Warnings if any"]
+regressionTolerance: float = 0.25
+updateBaseline: bool = False
+
+# the shard processes of a sharded run are started afresh and run this script as "__mp_main__". They find the shard
+# functions they are handed under the main program's module name, so it is loaded for them here.
+if __name__ == "__mp_main__":
+    loadMainProgram()
+
+if __name__ == "__main__":
+    secdcf = loadMainProgram()
+    metrics: dict = {}  # name -> [value, True if higher is better]
+
+    print("IRR: batchIRR vs. npf.irr per stock")
+    for horizon in irrHorizons:
+        result = benchmarkIRR(secdcf, irrStocks, horizon)
+        print("{:6d} stocks x {:2d} yrs:  max abs diff = {:.2e}  nan mismatches = {:d}  npf.irr = {:9,.0f} stocks/s  "
+              "batchIRR = {:11,.0f} stocks/s  speed-up = {:6.1f}x".format(
+                  result["stocks"], result["years"], result["max abs diff"], result["nan mismatches"],
+                  result["npf.irr stocks/sec"], result["batchIRR stocks/sec"], result["speed-up"]))
+        metrics["batchIRR stocks/sec, " + str(horizon) + " yrs"] = [result["batchIRR stocks/sec"], True]
+
+    print("\nBreakeven growth solver")
+    result = benchmarkSolver(secdcf, solverStocks, secdcf.yrsDiscted)
+    print("{:6d} stocks x {:2d} yrs:  solved = {:d}  max iterations = {:d}  {:11,.0f} stocks/s".format(
+        result["stocks"], result["years"], result["solved"], result["max iterations"], result["solver stocks/sec"]))
+    metrics["solver stocks/sec"] = [result["solver stocks/sec"], True]
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    fixturePath = os.path.join(here, fixtureFile)
+    makeFixtures(fixturePath, fixtureTickers, fixtureFillerConcepts, fixtureSeed)
+    fixtureTickerList = recordedTickers(fixturePath)
+    standIn, baseURL = startStandIn(fixturePath, standInLatency, standIn429Rate)
+    workDirectory = tempfile.mkdtemp(prefix="sec dcf benchmark ")
+    memoryDirectory = tempfile.mkdtemp(prefix="sec dcf benchmark ")
+    endToEnd: dict = {"cold": benchmarkEndToEnd(baseURL, fixtureTickerList, workDirectory),
+                      "warm": benchmarkEndToEnd(baseURL, fixtureTickerList, workDirectory)}
+    peakMB = benchmarkEndToEnd(baseURL, fixtureTickerList, memoryDirectory, trackMemory=True)["peak MB"]
+    sharded: dict = {}
+    for shards in benchmarkShards:
+        shardDirectory = tempfile.mkdtemp(prefix="sec dcf benchmark ")
+        sharded[shards] = benchmarkEndToEnd(baseURL, fixtureTickerList, shardDirectory, shards=shards)
+        shutil.rmtree(shardDirectory, ignore_errors=True)
+    standIn.terminate()
+    shutil.rmtree(workDirectory, ignore_errors=True)
+    shutil.rmtree(memoryDirectory, ignore_errors=True)
+
+    print("\nEnd to end, ", fixtureTickers, " tickers from the stand-in server at ", standInLatency,
+          " s latency and ", "{:.0%}".format(standIn429Rate), " 429 responses")
+    for runName, result in endToEnd.items():
+        print("{:5s}: {:7.2f} s  {:8.1f} tickers/s  valued = {:d}  with warnings = {:d}  responses = {}".format(
+            runName, result["seconds"], result["tickers/sec"], result["valued"], result["with warnings"],
+            result["responses"]))
+        for stage, seconds in result["stage seconds"].items():
+            print("         {:24s} {:8.2f} s".format(stage, seconds))
+        metrics[runName + " tickers/sec"] = [result["tickers/sec"], True]
+        metrics[runName + " valuation seconds"] = [result["stage seconds"].get("valuation", 0.0), False]
+    print("peak memory allocated by Python in a cold run = {:7.1f} MB".format(peakMB))
+    metrics["cold peak MB"] = [peakMB, False]
+    for shards, result in sharded.items():
+        print("cold, {:2d} shards: {:7.2f} s  {:8.1f} tickers/s  valued = {:d}  responses = {}".format(
+            shards, result["seconds"], result["tickers/sec"], result["valued"], result["responses"]))
+        metrics["cold tickers/sec, " + str(shards) + " shards"] = [result["tickers/sec"], True]
+
+    # the warm and sharded runs take their data from the cache and store, or split the stocks up, but must come to
+    # the same valuations as the cold run
+    coldResults = endToEnd["cold"]["results"]
+    repeats = [["warm", endToEnd["warm"]]] + [[str(shards) + " shards", result] for shards, result in sharded.items()]
+    for runName, result in repeats:
+        differing = differingTickers(coldResults, result["results"])
+        print(runName, "run valued", len(differing), "ticker(s) differently from the cold run", differing[0:20])
+
+    throughputPath = os.path.join(here, throughputFile)
+    if os.path.exists(throughputPath) and not updateBaseline:
+        with open(throughputPath, "r") as throughputIn:
+            regressions = compareBaseline(metrics, json.load(throughputIn), regressionTolerance)
+        print("\nCompared with the throughput in ", throughputFile, ": ", len(regressions), " regression(s)")
+        for name, base, value in regressions:
+            print("   ", name, ": baseline {:,.3f}, now {:,.3f}".format(base, value))
+    else:
+        with open(throughputPath, "w") as throughputOut:
+            json.dump(metrics, throughputOut, indent=1)
+        print("\nThroughput of this machine written to ", throughputFile)
+
+    baselinePath = os.path.join(here, baselineFile)
+    if os.path.exists(baselinePath) and not updateBaseline:
+        with open(baselinePath, "r") as baselineIn:
+            differing = differingTickers(json.load(baselineIn), coldResults)
+        print(len(differing), " ticker(s) valued differently from the baseline in ", baselineFile, differing[0:20])
+    else:
+        with open(baselinePath, "w") as baselineOut:
+            json.dump(coldResults, baselineOut, indent=1)
+        print("Valuations written to ", baselineFile)
@@ -2,31 +2,45 @@
 # or intended for any other purpose and should not be used for stock trading. Parts of the
 # program were based on code samples suggested by financialmodelingprep.com
 #
-# The program takes a user-defined stock list of large US ticker symbols & looks up both the SEC's CIK (central index
-# key), the current stock price, and the stock split history on Financial Modeling Prep (see
-# https://financialmodelingprep.com/developer/docs/). Access to Financial Modeling Prep is available with an
-# API key which the user must enter into the program code. The user can also vary a number of other program
+# The program takes a user-defined stock list of large US ticker symbols & looks up the SEC's CIK (central index
+# key) in the SEC's list of company tickers, and the current stock price and the stock split history on Financial
+# Modeling Prep (see https://financialmodelingprep.com/developer/docs/). Share prices are requested for many stocks at
+# a time. Access to Financial Modeling Prep is available with an API key which the user must enter into the program
+# code. The user can also vary a number of other program
 # parameters (discussed below) in the code.
 
 # For each stock in the stock list, the program calculates the compound annual growth rate (CAGR) for the diluted
 # earnings per share (EPS) over the past x (usually 10) years. Because Financial Modeling Prep limits free EPS data to
-# five years, the program takes its EPS history from the SEC's Edgar database of company filings. The program then
+# five years, the program takes its EPS history from the SEC's Edgar database of company filings. Optionally the EPS
+# growth is instead fitted by regression to every year of the history (see growthMethod below). The program then
 # calculates the internal rate of return (IRR) and net present value (NPV) for someone purchasing a single unit of the
 # stock at the current share price, assuming the EPS growth continues unchanged for a user-defined number of years
 # after the purchase. The program also calculates the minimum EPS growth needed for the NPV of the purchaser's
 # share earnings to break even with the share purchase.
 #
-# This last calculation is performed iteratively up to a maximum of 20 steps. If no minimmum EPS growth can be found for
-# the NPV to break even, the iteration attempts are output to a .csv file for inspection and a warning is printed.
+# This last calculation is done for all stocks at once after the per-stock loop, using the closed form of the NPV of a
+# geometrically growing EPS stream and a bracketed Newton/bisection search. If no minimmum EPS growth can be found for
+# the NPV to break even, a warning is printed and the solver's end state goes, with that of every other stock it
+# failed on, to one "SEC DCF solver failures" file (Parquet, or gzipped csv) for inspection.
 
 # The user is able to alter the discount rate for the NPV in the code, and to alter the number of years over which the
-# NPV and IRR are calculated.
+# NPV and IRR are calculated. In sensitivity mode the program also calculates the results over a whole grid of discount
+# rates, years and reductions to the historic growth in one pass and saves them to a separate file.
 #
 # The share purchaser's personal taxes are ignored. Terminal values for the stock are ignored. The EPS in the year of
 # purchase is ignored. Additional assumptions not listed here may be implicit in the code.
 #
-# The program prints results both to the terminal console and to an Excel file. The file is saved in the same directory
-# as the program. In the case of an early end to the program a partial output file is provided.
+# Responses from both data providers are kept in an on-disk cache (see cacheDir in the user input section), so a
+# re-run with e.g. a different discount rate takes its data from disk rather than from the network. With offlineMode
+# set the program runs purely from that cache. The annual facts taken from the SEC are also kept in a local sqlite file
+# and a company's facts are only downloaded again once the SEC shows it has filed a new report. Several stocks are
+# downloaded at the same time, ahead of the stock being valued, within the request rates each data provider allows
+# (see secRequestsPerSec and fmpRequestsPerSec), over one pooled keep-alive connection set per host. Requests the
+# data provider turns away as too many (429) or fails on (5xx) are retried after the wait it asks for.
+#
+# The program prints results both to the terminal console and to an Excel file (or csv/Parquet files, see
+# reportFormats). The file is saved in the same directory as the program. In the case of an early end to the program
+# a partial output file is provided.
 #
 # As mentioned, the program takes some data from financial modeling prep and some from the SEC in order to obtain
 # x (usually 10) years EPS history. If 5 years history is sufficient an alternative, simpler Python program is
@@ -37,24 +51,499 @@
 # Comments, corrections and suggestions are welcome.
 
 # For Python 3.0 and later
+import csv
+import gzip
 import json
 import sys
 import numpy as np
 import numpy_financial as npf
 import pandas as pd
 from datetime import datetime
-from urllib.request import urlopen
 from colorama import Fore
-import copy
-import ssl
+import xlsxwriter
 import requests
+import requests.adapters
 import time as time
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import multiprocessing
+import mmap
+import struct
+import zipfile
+import zlib
+import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.error import HTTPError
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+
+# ---------------------------------------------------------------------------------------------------
+class RunMetrics:
+    """
+    Timers and counters for one run, kept per run and per ticker and written out at the end as a json summary and a
+    Prometheus text format file. Each event is one lock and a couple of dictionary updates, cheap enough to leave on.
+
+    count() adds to a counter. observe() records one value of a summary (count, sum and max), e.g. the seconds of one
+    request. Both take labels, e.g. endpoint="companyfacts", and add to the ticker set for the calling thread by
+    setTicker(), or given as ticker=.
+    """
+
+    helpTexts = {"http_requests_total": "Requests sent to the data providers, by endpoint and status code.",
+                 "http_request_seconds": "Seconds from sending a request to having the whole response, by endpoint.",
+                 "http_bytes_total": "Response bytes downloaded (compressed), by endpoint.",
+                 "http_retries_total": "Requests retried after a 429, 5xx or dropped connection, by endpoint.",
+                 "cache_lookups_total": "Response cache lookups, by endpoint and result.",
+                 "ratelimit_wait_seconds": "Seconds spent waiting for a rate limiter token, by limiter.",
+                 "parse_seconds": "Seconds spent parsing responses, by kind.",
+                 "stage_seconds": "Seconds spent in each stage of the run (fetch is summed over the fetch threads).",
+                 "solver_iterations": "Breakeven growth solver iterations per stock.",
+                 "solver_results_total": "Breakeven growth solver results, by status.",
+                 "stocks_total": "Stocks in the run, by outcome.",
+                 "service_request_seconds": "Seconds to answer a valuation service request, by whether it was cached."}
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.time()
+        self.counters = {}  # (name, labels) -> value
+        self.summaries = {}  # (name, labels) -> [count, sum, max]
+        self.tickers = {}  # ticker -> {name: value}, counters and summary sums without labels
+
+    # the ticker the calling thread is working on, or None
+    def setTicker(self, ticker):
+        self.local.ticker = ticker
+
+    def count(self, name, value=1, ticker=None, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        ticker = ticker if ticker is not None else getattr(self.local, "ticker", None)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            if ticker is not None:
+                tickerMetrics = self.tickers.setdefault(ticker, {})
+                tickerMetrics[name] = tickerMetrics.get(name, 0) + value
+
+    def observe(self, name, value, ticker=None, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        ticker = ticker if ticker is not None else getattr(self.local, "ticker", None)
+        with self.lock:
+            summary = self.summaries.setdefault(key, [0, 0.0, value])
+            summary[0], summary[1], summary[2] = summary[0] + 1, summary[1] + value, max(summary[2], value)
+            if ticker is not None:
+                tickerMetrics = self.tickers.setdefault(ticker, {})
+                tickerMetrics[name] = tickerMetrics.get(name, 0.0) + value
+
+    # add the counters, summaries and ticker figures of another run's summary(), e.g. of a shard of a sharded run
+    def merge(self, summary):
+        with self.lock:
+            for counter in summary["counters"]:
+                key = (counter["name"], tuple(sorted(counter["labels"].items())))
+                self.counters[key] = self.counters.get(key, 0) + counter["value"]
+            for other in summary["summaries"]:
+                key = (other["name"], tuple(sorted(other["labels"].items())))
+                mine = self.summaries.setdefault(key, [0, 0.0, other["max"]])
+                mine[0], mine[1], mine[2] = mine[0] + other["count"], mine[1] + other["sum"], max(mine[2], other["max"])
+            for ticker, values in summary["tickers"].items():
+                tickerMetrics = self.tickers.setdefault(ticker, {})
+                for name, value in values.items():
+                    tickerMetrics[name] = tickerMetrics.get(name, 0) + value
+
+    # the run as a dictionary, for the json summary
+    def summary(self):
+        with self.lock:
+            return {"started": datetime.fromtimestamp(self.started).isoformat(),
+                    "seconds": time.time() - self.started,
+                    "counters": [{"name": name, "labels": dict(labels), "value": value}
+                                 for (name, labels), value in sorted(self.counters.items())],
+                    "summaries": [{"name": name, "labels": dict(labels), "count": count, "sum": total, "max": most}
+                                  for (name, labels), (count, total, most) in sorted(self.summaries.items())],
+                    "tickers": {ticker: dict(values) for ticker, values in self.tickers.items()}}
+
+    # the run in the Prometheus text exposition format. Per ticker metrics are left out (one series per ticker is
+    # too many for Prometheus), they are in the json summary.
+    def prometheus(self):
+        def labelText(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if len(pairs) == 0:
+                return ""
+            return "{" + ",".join(key + '="' + str(value).replace('"', "'") + '"' for key, value in pairs) + "}"
+
+        lines = []
+        with self.lock:
+            for kind, series in [["counter", self.counters], ["summary", self.summaries]]:
+                for name in sorted(set(name for name, labels in series)):
+                    lines.append("# HELP secdcf_" + name + " " + self.helpTexts.get(name, name))
+                    lines.append("# TYPE secdcf_" + name + " " + kind)
+                    for (seriesName, labels), value in sorted(series.items()):
+                        if seriesName != name:
+                            continue
+                        if kind == "counter":
+                            lines.append("secdcf_" + name + labelText(labels) + " " + repr(float(value)))
+                        else:
+                            lines.append("secdcf_" + name + "_count" + labelText(labels) + " " + str(value[0]))
+                            lines.append("secdcf_" + name + "_sum" + labelText(labels) + " " + repr(float(value[1])))
+                    if kind == "summary":
+                        lines.append("# TYPE secdcf_" + name + "_max gauge")
+                        for (seriesName, labels), value in sorted(series.items()):
+                            if seriesName == name:
+                                lines.append("secdcf_" + name + "_max" + labelText(labels) + " " +
+                                             repr(float(value[2])))
+        return "\n".join(lines) + "\n"
+
+    def write(self, jsonFileName, prometheusFileName):
+        if jsonFileName != "":
+            with open(jsonFileName, "w") as jsonFile:
+                json.dump(self.summary(), jsonFile, indent=1, default=lambda value: value.item())
+        if prometheusFileName != "":
+            with open(prometheusFileName, "w") as prometheusFile:
+                prometheusFile.write(self.prometheus())
+
+
+# the endpoint an url belongs to, for the metric labels, e.g. "companyfacts" or "quote"
+metricEndpoints = ["companyfacts", "companyconcept", "submissions", "company_tickers", "frames", "quote",
+                   "stock_split", "income-statement"]
+
+
+def endpointOf(url):
+    path = urlsplit(url).path
+    for endpoint in metricEndpoints:
+        if endpoint in path:
+            return endpoint
+    return "other"
+
+
+# ---------------------------------------------------------------------------------------------------
+# raised by the response cache when offlineMode is on and the requested url has never been cached
+class OfflineCacheMiss(Exception):
+    pass
+
+
+# ---------------------------------------------------------------------------------------------------
+class ResponseCache:
+    """
+    Content-addressed on-disk cache for the raw bytes of SEC and financial modeling prep responses.
+
+    Entries are keyed by url with the api key removed, so a changed key doesn't invalidate the cache. The response
+    bodies are stored once per sha256 of their content under ``cacheDir/blobs`` and an sqlite index maps each url key
+    to its blob together with the ETag/Last-Modified validators, the fetch time and the last access time. The size
+    of the blobs is kept as a running total, and once it exceeds ``maxBytes`` the least recently used entries are
+    evicted until the blobs fit into ``evictTo`` of it, so that eviction doesn't run again on the next insert.
+    """
+
+    evictTo = 0.9
+
+    def __init__(self, cacheDirectory, maxBytes, ttlByEndpoint, defaultTTL, offline=False):
+        self.cacheDirectory = cacheDirectory
+        self.maxBytes = maxBytes
+        self.ttlByEndpoint = ttlByEndpoint
+        self.defaultTTL = defaultTTL
+        self.offline = offline
+        os.makedirs(os.path.join(cacheDirectory, "blobs"), exist_ok=True)
+        # one connection shared by the fetch threads, every use of it is under self.lock. In WAL mode the shards of a
+        # sharded run (see runShards) read the index while another shard writes, and wait up to a minute for a write.
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(cacheDirectory, "index.sqlite"), timeout=60, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # a cache can be fetched again, so a commit needn't wait for the disk, only the WAL checkpoints do
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, url TEXT, blob TEXT, "
+                        "size INTEGER, etag TEXT, lastModified TEXT, fetchedAt REAL, lastAccess REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responsesBlob ON responses (blob)")
+        self.db.commit()
+        self.totalBytes = self.blobBytes()
+
+    # size of the blobs referenced by the index, each blob counted once however many urls share it
+    def blobBytes(self):
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM "
+                               "(SELECT blob, MAX(size) AS size FROM responses GROUP BY blob)").fetchone()[0]
+
+    def blobReferenced(self, blob):
+        return self.db.execute("SELECT 1 FROM responses WHERE blob = ? LIMIT 1", (blob,)).fetchone() is not None
+
+    # the cache key is the url with any apikey query parameter removed
+    @staticmethod
+    def keyUrl(url):
+        parts = urlsplit(url)
+        query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() != "apikey"]
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+    # time to live of a url: the first cacheTTL entry whose text appears in the url, else the default
+    def ttl(self, url):
+        for endpoint, seconds in self.ttlByEndpoint.items():
+            if endpoint in url:
+                return seconds
+        return self.defaultTTL
+
+    def blobPath(self, blob):
+        return os.path.join(self.cacheDirectory, "blobs", blob[0:2], blob)
+
+    def readBlob(self, blob):
+        try:
+            with open(self.blobPath(blob), "rb") as blobFile:
+                return blobFile.read()
+        except OSError:
+            return None
+
+    def writeBlob(self, body):
+        blob = hashlib.sha256(body).hexdigest()
+        path = self.blobPath(blob)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # one temporary file per thread, as threads fetching alike responses write the same blob at the same time
+            tmpPath = path + ".tmp" + str(os.getpid()) + "-" + str(threading.get_ident())
+            with open(tmpPath, "wb") as blobFile:
+                blobFile.write(body)
+            os.replace(tmpPath, path)  # a half written blob is never visible under its final name
+        return blob
+
+    def store(self, key, url, body, respHeaders):
+        blob = self.writeBlob(body)
+        now = time.time()
+        with self.lock:
+            old = self.db.execute("SELECT blob, size FROM responses WHERE key = ?", (key,)).fetchone()
+            if not self.blobReferenced(blob):
+                self.totalBytes = self.totalBytes + len(body)
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (key, url, blob, len(body), respHeaders.get("ETag"), respHeaders.get("Last-Modified"),
+                             now, now))
+            if old is not None and old[0] != blob and not self.blobReferenced(old[0]):
+                self.totalBytes = self.totalBytes - old[1]
+            self.db.commit()
+            if self.totalBytes > self.maxBytes:
+                self.evict()
+
+    # drop least recently used entries, and any blob no longer referenced, until the blobs fit into evictTo of
+    # maxBytes. The shards of a sharded run each keep their own running total, so the total is first counted afresh.
+    # Called with self.lock held.
+    def evict(self):
+        self.totalBytes = self.blobBytes()
+        if self.totalBytes <= self.maxBytes:
+            return
+        rows = self.db.execute("SELECT key, blob, size FROM responses ORDER BY lastAccess").fetchall()
+        for key, blob, size in rows:
+            if self.totalBytes <= self.evictTo * self.maxBytes:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            if not self.blobReferenced(blob):
+                try:
+                    os.remove(self.blobPath(blob))
+                except OSError:
+                    pass
+                self.totalBytes = self.totalBytes - size
+        self.db.commit()
+
+    def get(self, url, transport, revalidate=False):
+        """
+        Return the response body for ``url`` from the cache if it is still fresh, revalidate it with the server if
+        it is stale, or fetch it if it isn't cached at all.
+
+        Parameters
+        ----------
+        url : str
+        transport : function(url, headers) returning (status code, body bytes, response headers)
+        revalidate : if True, a cached response is treated as stale whatever its age (except in offline mode)
+
+        Returns
+        -------
+        list of [status code, body bytes]
+        """
+
+        key = hashlib.sha256(self.keyUrl(url).encode("utf-8")).hexdigest()
+        with self.lock:
+            row = self.db.execute("SELECT blob, etag, lastModified, fetchedAt FROM responses WHERE key = ?",
+                                  (key,)).fetchone()
+        body = self.readBlob(row[0]) if row is not None else None
+        now = time.time()
+
+        if body is not None and (self.offline or (now - row[3] < self.ttl(url) and not revalidate)):
+            metrics.count("cache_lookups_total", endpoint=endpointOf(url), result="hit")
+            with self.lock:
+                self.db.execute("UPDATE responses SET lastAccess = ? WHERE key = ?", (now, key))
+                self.db.commit()
+            return [200, body]
+
+        if self.offline:
+            metrics.count("cache_lookups_total", endpoint=endpointOf(url), result="offline miss")
+            raise OfflineCacheMiss("Not in the offline cache: " + self.keyUrl(url))
+
+        # stale entry: ask the server whether it has changed since we fetched it
+        condHeaders = {}
+        if body is not None:
+            if row[1]:
+                condHeaders["If-None-Match"] = row[1]
+            if row[2]:
+                condHeaders["If-Modified-Since"] = row[2]
+            else:
+                condHeaders["If-Modified-Since"] = formatdate(row[3], usegmt=True)
+
+        status, newBody, respHeaders = transport(url, condHeaders)
+        metrics.count("cache_lookups_total", endpoint=endpointOf(url), result="miss" if body is None else
+                      ("revalidated" if status == 304 else "changed"))
+        if status == 304 and body is not None:
+            with self.lock:
+                self.db.execute("UPDATE responses SET fetchedAt = ?, lastAccess = ? WHERE key = ?", (now, now, key))
+                self.db.commit()
+            return [200, body]
+        if status == 200:
+            self.store(key, self.keyUrl(url), newBody, respHeaders)
+        return [status, newBody]
+
+
+# ---------------------------------------------------------------------------------------------------
+class TokenBucket:
+    """
+    Thread safe token bucket rate limiter. Tokens refill continuously at ``ratePerSec`` up to ``capacity``, and each
+    request to the data provider takes one token, waiting for it if the bucket is empty. Only the waiting thread
+    sleeps, so other threads answered from the cache carry on.
+    """
+
+    def __init__(self, ratePerSec, capacity=None):
+        self.rate = ratePerSec
+        self.capacity = capacity if capacity is not None else max(1.0, ratePerSec)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # take one token, returns the seconds spent waiting for it
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens = self.tokens - 1.0
+                    return waited
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited = waited + wait
+
+
+# ---------------------------------------------------------------------------------------------------
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket shared by the worker processes of a sharded run (see runShards), so that all shards together stay
+    within one request rate per data provider however the stocks are spread between them. The tokens and the time
+    they were last topped up live in a multiprocessing.Array made by newState() in the coordinator, from the
+    multiprocessing context the shards are started with, and handed to each shard when it starts.
+    """
+
+    def __init__(self, ratePerSec, state):
+        super().__init__(ratePerSec)
+        self.state = state
+
+    @staticmethod
+    def newState(ratePerSec, context=multiprocessing):
+        return context.Array("d", [max(1.0, ratePerSec), time.monotonic()])
+
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self.state.get_lock():
+                now = time.monotonic()
+                tokens = min(self.capacity, self.state[0] + (now - self.state[1]) * self.rate)
+                self.state[1] = now
+                if tokens >= 1.0:
+                    self.state[0] = tokens - 1.0
+                    return waited
+                self.state[0] = tokens
+                wait = (1.0 - tokens) / self.rate
+            time.sleep(wait)
+            waited = waited + wait
+
+
+# ---------------------------------------------------------------------------------------------------
+# one pooled keep-alive requests.Session per host, shared by all threads, so requests to the same host reuse their
+# connections instead of paying a new TCP and TLS setup each time. requests asks for gzip/deflate by default and
+# decompresses the responses.
+hostSessions: dict = {}
+hostSessionsLock = threading.Lock()
+
+
+def hostSession(url):
+    host = urlsplit(url).netloc
+    with hostSessionsLock:
+        if host not in hostSessions:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(fetchInFlight, 1))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            hostSessions[host] = session
+        return hostSessions[host]
+
+
+# seconds to wait before retrying a response, from its Retry-After header (seconds or an http date) if it has one,
+# else an exponential backoff with jitter
+def retryDelay(headers, attempt):
+    retryAfter = headers.get("Retry-After", "")
+    if retryAfter.strip().isdigit():
+        return float(retryAfter)
+    if retryAfter != "":
+        try:
+            return max(0.0, parsedate_to_datetime(retryAfter).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    return httpBackoff * 2 ** attempt * (0.5 + random.random())
+
+
+# ---------------------------------------------------------------------------------------------------
+# sends a GET through the host's pooled session, taking a token from limiter for every attempt. 429 (too many
+# requests) and 5xx responses and dropped connections are retried up to httpRetries times before the last response
+# (or error) is handed back. Returns (status, body, headers).
+def send(url, headers, limiter, limiterName):
+    endpoint = endpointOf(url)
+    attempt = 0
+    while True:
+        metrics.observe("ratelimit_wait_seconds", limiter.acquire(), limiter=limiterName)
+        startTime = time.perf_counter()
+        try:
+            r = hostSession(url).get(url, headers=headers, timeout=httpTimeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= httpRetries:
+                raise
+            metrics.count("http_retries_total", endpoint=endpoint, status="connection")
+            time.sleep(retryDelay({}, attempt))
+            attempt = attempt + 1
+            continue
+        metrics.observe("http_request_seconds", time.perf_counter() - startTime, endpoint=endpoint)
+        metrics.count("http_requests_total", endpoint=endpoint, status=r.status_code)
+        metrics.count("http_bytes_total", r.raw.tell(), endpoint=endpoint)  # compressed bytes off the wire
+        if (r.status_code == 429 or r.status_code >= 500) and attempt < httpRetries:
+            metrics.count("http_retries_total", endpoint=endpoint, status=r.status_code)
+            time.sleep(retryDelay(r.headers, attempt))
+            attempt = attempt + 1
+            continue
+        return r.status_code, r.content, dict(r.headers)
+
+
+# ---------------------------------------------------------------------------------------------------
+# transport for financial modeling prep. Only requests that actually go to the network take a token from the
+# financial modeling prep rate limiter. Error responses are raised as HTTPError.
+def fmp_transport(url, extraHeaders):
+    status, body, headers = send(url, extraHeaders, fmpLimiter, "fmp")
+    if status >= 400:
+        raise HTTPError(url, status, "financial modeling prep returned status " + str(status), headers, None)
+    return status, body, headers
+
+
+# ---------------------------------------------------------------------------------------------------
+# transport for the SEC, adding the SEC-required url headers.
+def sec_transport(url, extraHeaders):
+    head = {"User-Agent": myEmail}
+    head.update(extraHeaders)
+    return send(url, head, secLimiter, "sec")
 
 
 # ---------------------------------------------------------------------------------------------------
 def get_jsonparsed_data(url):
     """
-    Receive the content of ``url``, parse it as JSON and return the object.
+    Receive the content of ``url`` (from the response cache if possible), parse it as JSON and return the object.
 
     Parameters
     ----------
@@ -65,43 +554,260 @@ def get_jsonparsed_data(url):
     dict
     """
 
-    #   response = urlopen(url, cafile=certifi.where())
-    #   in the above line cafile is now deprecated. Have used the below ssl line instead
-    #   although the ssl line may not even be needed - I'm merely following documentation.
-    delay(oldTimeStamp)  # calls for a delay between repeat calls to data providers.
-    myContext = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH)
-    response = urlopen(url, context=myContext)
-    data = response.read().decode("utf-8")
-    return json.loads(data)
+    data = responseCache.get(url, fmp_transport)[1]
+    startTime = time.perf_counter()
+    parsed = json.loads(data)
+    metrics.observe("parse_seconds", time.perf_counter() - startTime, kind="json")
+    return parsed
 
 
 # ---------------------------------------------------------------------------------------------------
-def get_sec_json(url):
+def get_sec_bytes(url, revalidate=False):
     """
-    Receive the content of ``url``, add SEC-required url headers, parse response as JSON and return the object.
+    Receive the raw content of ``url`` (from the response cache if possible), adding SEC-required url headers.
 
     Parameters
     ----------
     url : str
+    revalidate : bool, check with the SEC that a cached response is still current whatever its age
 
     Returns
     -------
-    string that can be used as dictionary
+    list of [error flag, response body bytes or, if the error flag is set, the error message]
     """
 
-    errorFlag = False
-    head = {"Accept-Encoding": "gzip, deflate", "User-Agent": myEmail, "Host": "data.sec.gov"}
-    r = requests.get(url, headers=head)
-    if r.status_code == 404:
-        errorFlag = True
-        print("CIK not found in ", url)
-        pdResults.loc[stock, "Warnings if any"] = "CIK not found in " + url
-        returnDict: dict = {"error": "error"}
-    else:
-        returnDict = dict(json.loads(r.text))
+    try:
+        status, body = responseCache.get(url, sec_transport, revalidate)
+    except OfflineCacheMiss as missErr:
+        return [True, str(missErr)]
+    except requests.RequestException as sendErr:  # still unreachable or timing out after httpRetries retries
+        return [True, "SEC not reachable (" + type(sendErr).__name__ + ") for " + url]
+    if status == 404:
+        return [True, "CIK not found in " + url]
+    if status != 200:
+        return [True, "SEC returned status " + str(status) + " for " + url]
+    return [False, body]
+
+
+# ---------------------------------------------------------------------------------------------------
+class FactColumns:
+    """
+    The fact records of one concept in one unit, packed into typed arrays with one element per record in the order
+    filed: the frame as an integer code (see frameCode), the period end date, the value (float64), the date filed and
+    the fiscal period the record was reported for, i.e. the fiscal year (-1 if none) and the fp and form as integer
+    codes (see labelCode). The other fields of a record (accn, start) are not kept.
+    """
+
+    __slots__ = ["frames", "ends", "values", "filed", "fy", "fp", "form"]
+    framePattern = re.compile(r"^CY(\d{4})(?:Q([1-4]))?(I?)$")
+    frameCodes = {}  # frame -> code, shared by every filer since they all use the same few frames
+    labelCodes = {"": 0}  # fp or form -> code, shared like frameCodes. "" (not reported) is 0
+    labelNames = [""]  # code -> fp or form
+    labelLock = threading.Lock()  # codes are handed out in the order labels are first seen, by any thread
+
+    def __init__(self, frames, ends, values, filed, fy, fp, form):
+        self.frames, self.ends, self.values, self.filed = frames, ends, values, filed
+        self.fy, self.fp, self.form = fy, fp, form
+
+    # CY2012 -> 201200, CY2012Q3 -> 201230, CY2012Q3I (an instant) -> 201231. -1 for a record without a frame.
+    @classmethod
+    def frameCode(cls, frame):
+        code = cls.frameCodes.get(frame)
+        if code is None:
+            match = cls.framePattern.match(frame)
+            code = -1 if match is None else \
+                int(match.group(1)) * 100 + int(match.group(2) or 0) * 10 + (1 if match.group(3) else 0)
+            cls.frameCodes[frame] = code
+        return code
+
+    @staticmethod
+    def frameName(code):
+        return "CY" + str(code // 100) + ("Q" + str(code // 10 % 10) if code // 10 % 10 else "") + \
+            ("I" if code % 10 else "")
+
+    # FY -> 1, 10-K -> 2, ..., numbered as they are first seen
+    @classmethod
+    def labelCode(cls, label):
+        code = cls.labelCodes.get(label)
+        if code is None:
+            with cls.labelLock:
+                code = cls.labelCodes.get(label)
+                if code is None:
+                    code = len(cls.labelNames)
+                    cls.labelNames.append(label)
+                    cls.labelCodes[label] = code
+        return code
+
+    # packs a list of fact records, e.g. the "USD" list of a concept's "units"
+    @classmethod
+    def fromRecords(cls, records):
+        return cls(np.array([cls.frameCode(record.get("frame", "")) for record in records], dtype=np.int32),
+                   np.array([record.get("end", "NaT")[0:10] for record in records], dtype="datetime64[D]"),
+                   np.array([record["val"] for record in records], dtype=float),
+                   np.array([record.get("filed", "NaT")[0:10] for record in records], dtype="datetime64[D]"),
+                   np.array([record.get("fy") or -1 for record in records], dtype=np.int16),
+                   np.array([cls.labelCode(record.get("fp") or "") for record in records], dtype=np.int16),
+                   np.array([cls.labelCode(record.get("form") or "") for record in records], dtype=np.int16))
+
+
+# ---------------------------------------------------------------------------------------------------
+class CompanyFacts:
+    """
+    Every XBRL fact a filer has reported, from one download of the SEC's companyfacts api.
 
-    getSecList = [errorFlag, returnDict]
-    return getSecList
+    The payload is kept as the bytes it arrived in and is not parsed up front. Building the object only locates where
+    each concept's json object starts and ends in the payload. A concept is decoded the first time it is asked for,
+    and its records are packed into one FactColumns per unit straight away, so the decoded records don't stay around.
+    Concepts nobody reads are never decoded. select() then keeps the packed concepts the valuation needs and lets go
+    of the payload.
+    """
+
+    # a concept object always starts with its label, e.g. "EarningsPerShareDiluted":{"label":"Earnings Per Share..
+    # The payload is searched for "label", a plain substring search, and the name is matched in the bytes before it.
+    namePattern = re.compile(rb'"([^"\\]+)"\s*:\s*\{\s*$')
+
+    def __init__(self, body):
+        startTime = time.perf_counter()
+        self.body = body if isinstance(body, bytes) else body.encode("utf-8")
+        self.decoder = json.JSONDecoder()
+        self.packed = {}  # (taxonomy, concept, unit) -> FactColumns
+        self.unitLists = {}  # (taxonomy, concept) -> units, for the concepts packed so far
+        self.indexes = {}
+        head = self.body[0:self.body.find(b'"facts"')]
+        cikMatch = re.search(rb'"cik"\s*:\s*"?(\d+)', head)
+        self.cik = cikMatch.group(1).decode("ascii").zfill(10) if cikMatch else ""
+        nameMatch = re.search(rb'"entityName"\s*:\s*("(?:[^"\\]|\\.)*")', head)
+        self.entityName = json.loads(nameMatch.group(1)) if nameMatch else ""
+
+        # [start, end] of each concept object in the payload, grouped by taxonomy (us-gaap, dei, ifrs-full, ...). A
+        # concept ends where the next one's name starts, decoding stops at the end of the object anyway.
+        self.offsets = {}
+        taxonomy = ""
+        last = None
+        position = self.body.find(b'"label"')
+        while position >= 0:
+            windowStart = max(0, position - 400)
+            match = self.namePattern.search(self.body, windowStart, position)
+            if match is not None:  # else "label" was inside a string, e.g. a description
+                if last is not None:
+                    last[1] = match.start()
+                before = self.body[max(0, match.start() - 200):match.start()].rstrip()
+                if before.endswith(b"{"):  # first concept of a taxonomy, preceded by "us-gaap":{
+                    taxMatch = self.namePattern.search(before)
+                    taxonomy = taxMatch.group(1).decode("utf-8") if taxMatch else taxonomy
+                last = [self.body.index(b"{", match.end(1)), len(self.body)]
+                self.offsets.setdefault(taxonomy, {})[match.group(1).decode("utf-8")] = last
+            position = self.body.find(b'"label"', position + 7)
+        metrics.observe("parse_seconds", time.perf_counter() - startTime, kind="company facts index")
+
+    def taxonomies(self):
+        return list(self.offsets.keys())
+
+    def concepts(self, taxonomy="us-gaap"):
+        return list(self.offsets.get(taxonomy, {}).keys())
+
+    def has(self, taxonomy, concept):
+        return concept in self.offsets.get(taxonomy, {})
+
+    # the concept decoded as a dictionary, or {} if the filer never reported it. Not kept, see unpack
+    def concept(self, taxonomy, concept):
+        if not self.has(taxonomy, concept):
+            return {}
+        start, end = self.offsets[taxonomy][concept]
+        return self.decoder.raw_decode(self.body[start:end].decode("utf-8"))[0]
+
+    # decode a concept and pack its records, once
+    def unpack(self, taxonomy, concept):
+        if (taxonomy, concept) in self.unitLists:
+            return
+        startTime = time.perf_counter()
+        units = self.concept(taxonomy, concept).get("units", {})
+        for unit, records in units.items():
+            self.packed[(taxonomy, concept, unit)] = FactColumns.fromRecords(records)
+        self.unitLists[(taxonomy, concept)] = list(units.keys())
+        metrics.observe("parse_seconds", time.perf_counter() - startTime, kind="company facts concept")
+
+    # list of units (e.g. ["USD/shares"]) of a concept
+    def units(self, taxonomy, concept):
+        self.unpack(taxonomy, concept)
+        return self.unitLists.get((taxonomy, concept), [])
+
+    # the FactColumns of a concept in a given unit, with no records if there are none
+    def columns(self, taxonomy, concept, unit):
+        self.unpack(taxonomy, concept)
+        packed = self.packed.get((taxonomy, concept, unit))
+        if packed is None:
+            return FactColumns.fromRecords([])
+        return packed
+
+    # FrameIndex over the records of a concept in a given unit, built on first use
+    def frameIndex(self, taxonomy, concept, unit):
+        key = (taxonomy, concept, unit)
+        if key not in self.indexes:
+            self.indexes[key] = FrameIndex(self.columns(taxonomy, concept, unit))
+        return self.indexes[key]
+
+    # the packed concepts of a list of [taxonomy, concept] as a StoredFacts, without the payload
+    def select(self, concepts):
+        packed = {}
+        for taxonomy, concept in concepts:
+            for unit in self.units(taxonomy, concept):
+                packed[(taxonomy, concept, unit)] = self.columns(taxonomy, concept, unit)
+        return StoredFacts(self.cik, self.entityName, packed)
+
+
+# ---------------------------------------------------------------------------------------------------
+# all facts of one filer in one request. cikStr is the 10 digit CIK with leading zeros. Returns
+# [error flag, fact store or, if the error flag is set, the error message]
+def get_sec_facts(cikStr, revalidate=False):
+    secFactsURL = secDataURL + "/api/xbrl/companyfacts/CIK" + cikStr + ".json"
+    errorFlag, body = get_sec_bytes(secFactsURL, revalidate)
+    if errorFlag:
+        return [True, body]
+    return [False, CompanyFacts(body)]
+
+
+# ---------------------------------------------------------------------------------------------------
+class FactsArchive:
+    """
+    A local copy of the SEC's nightly companyfacts.zip bulk archive (see
+    https://www.sec.gov/edgar/sec-api-documentation), one CIK##########.json member per filer with the same content as
+    the companyfacts api. Only the zip directory is read up front. The zip is memory mapped and each member is
+    decompressed straight from the mapping when a filer is asked for, nothing is extracted to disk.
+    """
+
+    def __init__(self, fileName):
+        self.file = open(fileName, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.zip = zipfile.ZipFile(self.file)
+        self.lock = threading.Lock()  # the zip's file position is shared, the mapping is not
+        self.members = {}  # cik -> ZipInfo of the member
+        for info in self.zip.infolist():
+            match = re.match(r"^CIK(\d{10})\.json$", info.filename)
+            if match:
+                self.members[match.group(1)] = info
+
+    # the uncompressed content of a member. The compressed data follows the member's 30 byte local header, its name
+    # and its extra field.
+    def read(self, info):
+        nameLength, extraLength = struct.unpack("<HH", self.map[info.header_offset + 26:info.header_offset + 30])
+        start = info.header_offset + 30 + nameLength + extraLength
+        if info.compress_type == zipfile.ZIP_STORED:
+            return self.map[start:start + info.compress_size]
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            return zlib.decompress(self.map[start:start + info.compress_size], -15)  # raw deflate stream
+        with self.lock:  # any other compression through zipfile
+            return self.zip.read(info)
+
+    # CIKs of all filers in the archive
+    def ciks(self):
+        return sorted(self.members.keys())
+
+    # same return as get_sec_facts: [error flag, fact store or, if the error flag is set, the error message]
+    def get(self, cikStr):
+        if cikStr not in self.members:
+            return [True, "CIK " + cikStr + " not found in the company facts archive."]
+        return [False, CompanyFacts(self.read(self.members[cikStr]))]
 
 
 # --------------------------------------------------------------------------------------------------------
@@ -134,510 +840,2252 @@ def strToFloat(x):
         sys.exit()
 
 
-#  --------------------------------------------------------------------------------------------------------------------
-# subroutine to delay between successive calls to a data source url like SEC or fin mod prep, if needed,
-# for using these resource respectfully.
-def delay(priorTimeStamp):
-    global oldTimeStamp
-    elapsedTime = datetime.now() - priorTimeStamp
-    elapsedSec = elapsedTime.seconds + elapsedTime.microseconds / 1000000
-    if elapsedSec < 1.0:
-        addDelay = 1.0 - elapsedSec
-        time.sleep(addDelay)
-        oldTimeStamp = datetime.now()  # after sleeping update the baseline timestamp
-
-
-# --------------------------------------------------------------------------------------------------------------------
-# A subroutine to lookup a value in a python dictionary previously constructed to contain SEC data.
-# Example: in the EPS dictionary find the most recent entry having "frame" = "CY2012" and return the EPS value in
-# the associated "val" field. In this example, "frame" is the lookupkey, "CY2012" is the lookupval, "val" is the target
-# key. # The message_prefix in this example will likely be stock + "EPS", where stock is the ticker symbol of the
-# stock for which the lookup is being conducted. The errorflag will return a value of True if no match is found.
-# If a match is found in the i'th dictionary entry, errorflag = False and the value of i is also returned to the
-# calling program.
-
-def dictsearch(dictParam, lookupkey, lookupval, targetkey, message_prefix):
-    errorFlag = True
-    for ii in range(1, len(dictParam)):
-        if lookupkey in dictParam[ii]:
-            if dictParam[ii][lookupkey] == lookupval:
-                errorFlag = False
-                break  # once a match is found break out of for loop
+# --------------------------------------------------------------------------------------------------------------------
+class FrameIndex:
+    """
+    Index over the fact records of one SEC concept in one unit, e.g. EarningsPerShareDiluted in USD/shares, built from
+    their FactColumns.
+
+    The records are indexed once by their "frame" (e.g. CY2012 for a calendar year, CY2012Q3 for a quarter) and by
+    their fiscal period (fy, fp, form). Where a filer has reported the same frame or period more than once, e.g. in an
+    amendment or as a prior year comparative, the record from the most recently filed report wins. A record is a
+    dictionary of its frame (if it has one), end, val, filed, fy, fp and form. Lookups are dictionary lookups rather
+    than a walk through the list of records.
+    """
+
+    def __init__(self, columns):
+        # the winning record of each frame and of each period: the most recently filed, and of those filed the same day
+        # the later one in the list, like amendments listed after originals. A record without a filed date (NaT, the
+        # smallest int64) loses to any that has one.
+        positions, filed = np.arange(len(columns.frames)), columns.filed.view(np.int64)
+        order = np.lexsort((positions, filed, columns.frames))
+        sortedFrames = columns.frames[order]
+        lastOfFrame = np.append(sortedFrames[1:] != sortedFrames[:-1], True) if len(order) > 0 else order > 0
+        frameWinners = np.sort(order[lastOfFrame & (sortedFrames >= 0)])
+
+        periodOrder = np.lexsort((positions, filed, columns.form, columns.fp, columns.fy))
+        periods = np.stack([columns.fy, columns.fp, columns.form])[:, periodOrder]
+        lastOfPeriod = np.append((periods[:, 1:] != periods[:, :-1]).any(axis=0), True) if len(order) > 0 \
+            else order > 0
+        periodWinners = np.sort(periodOrder[lastOfPeriod & (periods[0] >= 0)])
+
+        # records are only made for the winners, once for a record that wins both its frame and its period
+        self.byFrame = {}
+        self.byPeriod = {}
+        self.annual = {}
+        made = {}
+        for position in frameWinners.tolist():
+            code = int(columns.frames[position])
+            record = made[position] = self.record(columns, position)
+            self.byFrame[record["frame"]] = record
+            if code % 100 == 0:  # full calendar year frame
+                self.annual[code // 100] = record
+        self.annualYears = sorted(self.annual.keys())
+        for position in periodWinners.tolist():
+            record = made.get(position) or self.record(columns, position)
+            self.byPeriod[(record["fy"], record["fp"], record["form"])] = record
+
+    # the record at a position of the columns, as a dictionary
+    @staticmethod
+    def record(columns, position):
+        code = int(columns.frames[position])
+        end, filed = columns.ends[position], columns.filed[position]
+        record = {"frame": FactColumns.frameName(code)} if code >= 0 else {}
+        record.update({"end": "" if np.isnat(end) else str(end), "val": float(columns.values[position]),
+                       "filed": "" if np.isnat(filed) else str(filed)})
+        if columns.fy[position] >= 0:
+            record.update({"fy": int(columns.fy[position]), "fp": FactColumns.labelNames[columns.fp[position]],
+                           "form": FactColumns.labelNames[columns.form[position]]})
+        return record
+
+    # the record for a frame such as "CY2012", or None
+    def frame(self, frame):
+        return self.byFrame.get(frame)
+
+    # the record for a fiscal period, e.g. period(2012) for the 10-K of fiscal 2012, or None
+    def period(self, fy, fp="FY", form="10-K"):
+        return self.byPeriod.get((fy, fp, form))
+
+    # the record of the newest full calendar year frame, or None if there is no annual frame at all
+    def latestAnnual(self):
+        if len(self.annualYears) == 0:
+            return None
+        return self.annual[self.annualYears[-1]]
+
+    # all full calendar year records from firstYear to lastYear (inclusive) as a list of [year, record], oldest first.
+    # Years without a frame are left out.
+    def annualSeries(self, firstYear=None, lastYear=None):
+        return [[year, self.annual[year]] for year in self.annualYears
+                if (firstYear is None or year >= firstYear) and (lastYear is None or year <= lastYear)]
+
+
+# --------------------------------------------------------------------------------------------------------------------
+class StockResult:
+    """
+    The results of one stock, filled in attribute by attribute as the stock goes through the program and turned into
+    one row of the results table when the stock is done. Warnings are collected in a list instead of overwriting each
+    other. Attributes that are never set stay None and leave the cell empty. If the breakeven growth solver fails, its
+    end state goes in solver, for the solver failures file.
+    """
+
+    # attribute -> column of the results table, in table order
+    columns = [["name", "Name"], ["cik", "CIK"], ["currency", "Currency"], ["newestYear", "Newest yr history"],
+               ["oldestYear", "Oldest yr history"], ["epsNewest", "EPS newest"],
+               ["incomeGr", "Comprehensive Net Income gr % pa"], ["incomeConcept", "Net income concept"],
+               ["epsGr", "EPS gr % pa"], ["epsCagr", "EPS CAGR % pa"], ["epsRegrGr", "EPS regression gr % pa"],
+               ["epsRegrErr", "EPS regression std err %"], ["epsRegrYears", "EPS yrs in regression"],
+               ["epsYoyStd", "EPS yoy gr std dev %"],
+               ["reqGr", "Req gr % pa for NPV break-even"], ["sharesGr", "Share gr % pa"], ["price", "Price"],
+               ["sharesOut", "Shares out-standing"], ["mktCap", "Mkt Cap"], ["npv", "NPV of Future EPS"],
+               ["disctRate", "Disct rate %"], ["irr", "IRR %"], ["warnings", "Warnings if any"],
+               ["yrsDiscted", "Yrs discounted after purchase"]]
+    textColumns = ["Name", "CIK", "Currency", "Net income concept", "Warnings if any"]  # the rest are numbers
+    __slots__ = [attribute for attribute, column in columns] + ["solver"]
+
+    def __init__(self):
+        for attribute, column in self.columns:
+            setattr(self, attribute, None)
+        self.warnings = []
+        self.solver = None
+
+    def warn(self, text):
+        self.warnings.append(text)
+
+    # the results as a dictionary of column -> value, leaving out empty cells, plus "Solver diagnostics" if the
+    # solver failed
+    def row(self):
+        row = {}
+        for attribute, column in self.columns:
+            value = getattr(self, attribute)
+            if attribute == "warnings":
+                value = " ".join(value) if len(value) > 0 else None
+            if value is not None:
+                row[column] = value.item() if isinstance(value, np.generic) else value
+        if self.solver is not None:
+            row["Solver diagnostics"] = self.solver
+        return row
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# A subroutine to look up a frame in a FrameIndex previously built from SEC data.
+# Example: in the EPS index find the record having "frame" = "CY2012". The message_prefix in this example will likely
+# be stock + "EPS", where stock is the ticker symbol of the stock for which the lookup is being conducted. Returns the
+# record, or None after printing a warning if no record has that frame.
+
+def framesearch(frameIndex, lookupval, message_prefix, stock):
+    record = frameIndex.frame(lookupval)
+    if record is None:
+        print(Fore.RED, "The SEC data for ", message_prefix, " does not contain frame with value = ", lookupval)
+        print(Fore.BLACK, end="")
+        results[stock].warn("The SEC data for " + message_prefix + " does not contain frame with value = " + lookupval)
+    return record
+
+
+# --------------------------------------------------------------------------------------------------------------------
+class StoredFacts(CompanyFacts):
+    """
+    Some of the concepts of one filer, already packed into FactColumns, with the same methods as CompanyFacts (bar
+    concept()) so the valuation code can't tell the difference. Made by CompanyFacts.select() and by the fundamentals
+    store, which only keeps the concepts in storedConcepts and only full calendar year frames, so the period index of
+    stored facts only has the fiscal periods of those records.
+    """
+
+    def __init__(self, cik, entityName, packed):
+        self.cik = cik
+        self.entityName = entityName
+        self.indexes = {}
+        self.packed = packed  # (taxonomy, concept, unit) -> FactColumns
+        self.unitLists = {}
+        for taxonomy, concept, unit in packed:
+            self.unitLists.setdefault((taxonomy, concept), []).append(unit)
+
+    def taxonomies(self):
+        return list(dict.fromkeys(taxonomy for taxonomy, concept in self.unitLists))
+
+    def concepts(self, taxonomy="us-gaap"):
+        return [concept for conceptTaxonomy, concept in self.unitLists if conceptTaxonomy == taxonomy]
+
+    def has(self, taxonomy, concept):
+        return (taxonomy, concept) in self.unitLists
+
+    def unpack(self, taxonomy, concept):
+        pass
+
+
+# --------------------------------------------------------------------------------------------------------------------
+class FundamentalsStore:
+    """
+    Local sqlite store of the annual facts extracted from each filer's company facts, for the concepts in
+    storedConcepts. Every filer is tagged with the accession number of the newest report seen in its SEC submissions
+    when it was last synced, so a run only downloads the company facts again for filers that have filed since.
+    """
+
+    def __init__(self, fileName, concepts):
+        self.concepts = concepts
+        self.conceptKey = json.dumps(concepts)  # a changed concept list means every filer has to be synced again
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(fileName, timeout=60, check_same_thread=False)  # shared by the shards of a run
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS facts (cik TEXT, taxonomy TEXT, concept TEXT, unit TEXT, "
+                        "frame TEXT, record TEXT, PRIMARY KEY (cik, taxonomy, concept, unit, frame))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS syncs (cik TEXT PRIMARY KEY, entityName TEXT, accession TEXT, "
+                        "concepts TEXT, syncedAt REAL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS resolutions (cik TEXT, chain TEXT, resolution TEXT, "
+                        "PRIMARY KEY (cik, chain))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS valuations (ticker TEXT PRIMARY KEY, row TEXT, valuedAt REAL)")
+        self.db.commit()
+
+    # accession number the filer was last synced at, or "" if never synced with the current concept list
+    def syncedAccession(self, cik):
+        with self.lock:
+            row = self.db.execute("SELECT accession, concepts FROM syncs WHERE cik = ?", (cik,)).fetchone()
+        if row is None or row[1] != self.conceptKey:
+            return ""
+        return row[0]
+
+    # replace the stored facts of a filer with the annual facts of freshly downloaded company facts
+    def save(self, cik, facts, accession):
+        rows = []
+        for taxonomy, concept in self.concepts:
+            for unit in facts.units(taxonomy, concept):
+                for year, record in facts.frameIndex(taxonomy, concept, unit).annual.items():
+                    rows.append((cik, taxonomy, concept, unit, record["frame"], json.dumps(record)))
+        with self.lock:
+            self.db.execute("DELETE FROM facts WHERE cik = ?", (cik,))
+            self.db.execute("DELETE FROM resolutions WHERE cik = ?", (cik,))  # resolved from the replaced facts
+            self.db.executemany("INSERT INTO facts VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.db.execute("INSERT OR REPLACE INTO syncs VALUES (?, ?, ?, ?, ?)",
+                            (cik, facts.entityName, accession, self.conceptKey, time.time()))
+            self.db.commit()
+
+    # the stored facts of a filer as a StoredFacts, or None if the filer was never synced
+    def load(self, cik):
+        with self.lock:
+            sync = self.db.execute("SELECT entityName FROM syncs WHERE cik = ?", (cik,)).fetchone()
+            # in the order save() inserted them, so the units come back in the order of the downloaded facts
+            rows = self.db.execute("SELECT taxonomy, concept, unit, record FROM facts WHERE cik = ? ORDER BY rowid",
+                                   (cik,)).fetchall()
+        if sync is None:
+            return None
+        records = {}
+        for taxonomy, concept, unit, record in rows:
+            records.setdefault((taxonomy, concept, unit), []).append(json.loads(record))
+        return StoredFacts(cik, sync[0], {key: FactColumns.fromRecords(unitRecords)
+                                          for key, unitRecords in records.items()})
+
+    # the resolution of a concept chain (see resolveConcepts) saved for a filer's stored facts, or None
+    def resolution(self, cik, chain):
+        with self.lock:
+            row = self.db.execute("SELECT resolution FROM resolutions WHERE cik = ? AND chain = ?",
+                                  (cik, json.dumps(chain))).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def saveResolution(self, cik, chain, resolution):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO resolutions VALUES (?, ?, ?)",
+                            (cik, json.dumps(chain), json.dumps(resolution)))
+            self.db.commit()
+
+    # keep the result rows (dict of column -> value, see StockResult.row) of valued stocks for price refreshes.
+    # rows is a list of [ticker, row]; a ticker's older row is replaced.
+    def saveValuations(self, rows):
+        valuedAt = time.time()
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO valuations VALUES (?, ?, ?)",
+                                [(ticker, json.dumps(row, default=lambda value: value.item()), valuedAt)
+                                 for ticker, row in rows])
+            self.db.commit()
+
+    # the stored result rows of a list of tickers as a dictionary of ticker -> [row, time valued]. Tickers never
+    # valued are left out.
+    def valuations(self, tickers):
+        wanted = set(tickers)
+        with self.lock:
+            rows = self.db.execute("SELECT ticker, row, valuedAt FROM valuations").fetchall()
+        return {ticker: [json.loads(row), valuedAt] for ticker, row, valuedAt in rows if ticker in wanted}
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# one concept for every filer for one period (e.g. CY2012) in a single request. The unit is written as in the company
+# facts, e.g. "USD/shares". Returns [error flag, list of records or, if the error flag is set, the error message]
+def get_sec_frame(taxonomy, concept, unit, period):
+    url = secDataURL + "/api/xbrl/frames/" + taxonomy + "/" + concept + "/" + unit.replace("/", "-per-") + \
+          "/" + period + ".json"
+    errorFlag, body = get_sec_bytes(url)
+    if errorFlag:
+        return [True, body]
+    # form is {"taxonomy": "us-gaap", "tag": "EarningsPerShareDiluted", "ccp": "CY2012", "uom": "USD-per-shares", ...
+    #          "data": [{"accn": "0001193125-12-444068", "cik": 320193, "entityName": "Apple Inc.", "loc": "US-CA",
+    #                    "end": "2012-09-29", "val": 44.15}, ...
+    return [False, json.loads(body)["data"]]
+
+
+# --------------------------------------------------------------------------------------------------------------------
+def screenFrames(seriesList, years):
+    """
+    Full calendar year figures of every SEC filer from the frames API, one request per concept and year, joined by
+    CIK into (N filers x years) matrices that share the same row order.
+
+    Parameters
+    ----------
+    seriesList : list of [unit, chain], e.g. [["USD/shares", [["us-gaap", "EarningsPerShareDiluted"]]], ...]. Each
+        filer's figure for a year comes from the first concept in the chain that the filer reported for that year,
+        as in resolveConcepts.
+    years : list of calendar years, oldest first
+
+    Returns
+    -------
+    [array of CIKs (int, sorted), list of one matrix per series (nan where not reported), dict CIK -> entity name]
+    """
+
+    columns = []  # [series number, position in chain, year number, CIKs, values]
+    names = {}
+    for seriesNo, (unit, chain) in enumerate(seriesList):
+        for position, (taxonomy, concept) in enumerate(chain):
+            for yearNo, year in enumerate(years):
+                errorFlag, data = get_sec_frame(taxonomy, concept, unit, "CY" + str(year))
+                if errorFlag:
+                    print(Fore.RED, "No SEC frame for ", concept, " CY", year, ": ", data)
+                    print(Fore.BLACK, end="")
+                    continue
+                frameCiks = np.array([record["cik"] for record in data], dtype=np.int64)
+                columns.append([seriesNo, position, yearNo, frameCiks,
+                                np.array([record["val"] for record in data], dtype=float)])
+                for record in data:
+                    names[record["cik"]] = record["entityName"]
+
+    if len(columns) > 0:
+        ciks = np.unique(np.concatenate([column[3] for column in columns]))
+    else:
+        ciks = np.array([], dtype=np.int64)
+    matrices = [np.full((len(ciks), len(years)), np.nan) for series in seriesList]
+    # the last write wins, so write the chain from its end and let the preferred concepts overwrite the fallbacks
+    for seriesNo, position, yearNo, frameCiks, frameValues in sorted(columns, key=lambda column: -column[1]):
+        matrices[seriesNo][np.searchsorted(ciks, frameCiks), yearNo] = frameValues
+    return [ciks, matrices, names]
+
+
+# --------------------------------------------------------------------------------------------------------------------
+def resolveConcepts(facts, chain):
+    """
+    Decide, frame by frame, which of an ordered chain of candidate concepts to take a filer's figures from, e.g.
+    ComprehensiveIncomeNetOfTax, then NetIncomeLoss, then NetIncomeLossAvailableToCommonStockholdersDiluted for net
+    income. Filers switch tags over the years, so each frame takes the first concept in the chain that has it. Only
+    full calendar year frames are resolved, the only ones the fundamentals store keeps.
+
+    The unit is that of the first concept in the chain the filer reports; later concepts only count in the same unit.
+    One pass over the chain, on facts already downloaded.
+
+    Returns
+    -------
+    dict {"unit": unit or "" if the filer has none of the concepts, "frames": {frame: position in the chain}}
+    """
+
+    resolution = {"unit": "", "frames": {}}
+    for position, (taxonomy, concept) in enumerate(chain):
+        units = facts.units(taxonomy, concept)
+        if resolution["unit"] == "" and len(units) > 0:
+            resolution["unit"] = units[0]
+        if resolution["unit"] not in units:
+            continue
+        for record in facts.frameIndex(taxonomy, concept, resolution["unit"]).annual.values():
+            resolution["frames"].setdefault(record["frame"], position)
+    return resolution
+
+
+# FrameIndex over the records a resolution picked, each record tagged with the concept it came from ("concept").
+# Frames the facts don't have, e.g. quarters in a resolution saved by an older version, are skipped.
+def stitchedIndex(facts, chain, resolution):
+    records = []
+    for frame, position in resolution["frames"].items():
+        taxonomy, concept = chain[position]
+        record = facts.frameIndex(taxonomy, concept, resolution["unit"]).frame(frame)
+        if record is not None:
+            records.append(record)
+    index = FrameIndex(FactColumns.fromRecords(records))
+    for frame, record in index.byFrame.items():
+        record["concept"] = chain[resolution["frames"][frame]][1]
+    return index
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# the json array that is the value of the first member called name in a json payload (bytes), from position start
+# on, decoded without parsing the rest of the payload. Only for arrays of plain strings or numbers without a "]" in
+# them. None if there is no such member.
+def jsonArray(body, name, start=0):
+    match = re.compile(rb'"' + re.escape(name.encode("utf-8")) + rb'"\s*:\s*\[').search(body, start)
+    if match is None:
+        return None
+    return json.loads(body[match.end() - 1:body.index(b"]", match.end()) + 1])
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# accession number of the newest financial report (10-K, 10-Q, 20-F, 40-F or an amendment) in a filer's SEC
+# submissions, or "" if it can't be found. The submissions list is revalidated with the SEC on every call.
+reportForms = {"10-K", "10-Q", "10-K/A", "10-Q/A", "20-F", "20-F/A", "40-F", "40-F/A", "10-KT", "10-KT/A"}
+
+
+def get_latest_accession(cikStr):
+    errorFlag, body = get_sec_bytes(secDataURL + "/submissions/CIK" + cikStr + ".json", revalidate=True)
+    if errorFlag:
+        return ""
+    # form is {"cik": "320193", ..., "filings": {"recent": {"accessionNumber": [...], "form": [...], ... newest first
+    # only those two lists are decoded, not the rest of what can be megabytes of filing history
+    recentStart = body.find(b'"recent"')
+    if recentStart < 0:
+        return ""
+    accessions, forms = jsonArray(body, "accessionNumber", recentStart), jsonArray(body, "form", recentStart)
+    for accession, form in zip(accessions or [], forms or []):
+        if form in reportForms:
+            return accession
+    return ""
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# the full calendar year values of a FrameIndex from firstYear to lastYear as two numpy arrays, one element per year:
+# the values (nan where the SEC has no frame for the year) and the period end dates (NaT where missing)
+def annualRow(frameIndex, firstYear, lastYear):
+    values = np.full(lastYear - firstYear + 1, np.nan)
+    ends = np.full(lastYear - firstYear + 1, np.datetime64("NaT"), dtype="datetime64[D]")
+    for year, record in frameIndex.annualSeries(firstYear, lastYear):
+        values[year - firstYear] = record["val"]
+        ends[year - firstYear] = np.datetime64(record["end"][0:10])
+    return values, ends
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# a financial modeling prep split history as two numpy arrays, the split dates and the split ratios (numerator /
+# denominator, nan where either is 0). Parsed once, in the fetch stage.
+def parseSplits(splitBigDict):
+    # form of splitBigDict is
+    # { "symbol": "AAPL", "historical": [{
+    #        "date": "2020-08-31", "label": "August 31, 20", "numerator": 4.0, "denominator": 1.0}, ...
+    history = splitBigDict.get("historical", []) if splitBigDict != {} else []
+    dates = np.array([split["date"][0:10] for split in history], dtype="datetime64[D]")
+    numerators = np.array([strToFloat(split["numerator"]) for split in history], dtype=float)
+    denominators = np.array([strToFloat(split["denominator"]) for split in history], dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = np.where((numerators != 0) & (denominators != 0), numerators / denominators, np.nan)
+    return [dates, ratios]
+
+
+# --------------------------------------------------------------------------------------------------------------------
+class SplitIndex:
+    """
+    The split histories of a list of stocks, for split adjusting any number of (stock, period) pairs at once.
+
+    The splits of all stocks are kept in one array sorted by stock number and then date, together with the running
+    sum of their log split ratios. The product of a stock's splits between two dates is then the difference of the
+    running sum at two positions that searchsorted finds, whatever the number of splits or dates. Splits with a zero
+    numerator or denominator are counted separately so they turn only the factors they fall into to nan.
+    """
+
+    def __init__(self, splitHistories):
+        # splitHistories is a list of [dates, ratios] from parseSplits, one per stock, in stock number order
+        stockNo = np.concatenate([np.full(len(dates), k, dtype=np.int64)
+                                  for k, (dates, ratios) in enumerate(splitHistories)] + [np.zeros(0, np.int64)])
+        days = np.concatenate([dates.astype(np.int64) for dates, ratios in splitHistories] + [np.zeros(0, np.int64)])
+        ratios = np.concatenate([ratios for dates, ratios in splitHistories] + [np.zeros(0)])
+        order = np.lexsort((days, stockNo))
+        bad = ~(ratios[order] > 0)
+        self.keys = self.key(stockNo[order], days[order])
+        self.cumLog = np.concatenate([[0.0], np.cumsum(np.where(bad, 0.0, np.log(np.where(bad, 1.0, ratios[order]))))])
+        self.cumBad = np.concatenate([[0], np.cumsum(bad)])
+
+    # one sortable integer per (stock number, day number)
+    @staticmethod
+    def key(stockNo, days):
+        return stockNo.astype(np.int64) * 2 ** 32 + (days + 2 ** 31)
+
+    # product of the splits of each stock dated after fromDate and before toDate (1 if none, nan if one of them is
+    # bad), for arrays of stock numbers and dates that broadcast together, e.g. (N, 1), (N, years) and (N, 1)
+    def factors(self, stockNo, fromDates, toDates):
+        stockNo, fromDates, toDates = np.broadcast_arrays(np.asarray(stockNo, dtype=np.int64),
+                                                          np.asarray(fromDates, dtype="datetime64[D]"),
+                                                          np.asarray(toDates, dtype="datetime64[D]"))
+        valid = ~np.isnat(fromDates) & ~np.isnat(toDates)
+        first = np.searchsorted(self.keys, self.key(stockNo, np.where(valid, fromDates.astype(np.int64), 0)), "right")
+        last = np.searchsorted(self.keys, self.key(stockNo, np.where(valid, toDates.astype(np.int64), 0)), "left")
+        inWindow = valid & (last > first)
+        logFactor = np.where(inWindow, self.cumLog[last] - self.cumLog[first], 0.0)
+        return np.where(inWindow & (self.cumBad[last] > self.cumBad[first]), np.nan, np.exp(logFactor))
+
+
+# --------------------------------------------------------------------------------------------------------------------
+def growthStats(values):
+    """
+    Growth of every row of an (N stocks x years) matrix of annual values, oldest year in column 0, newest in the last
+    column, nan for missing years.
+
+    Gives the two point compound annual growth rate from the first to the last column, and the growth from a least
+    squares fit of log(value) against the year, using every year with a positive value, together with the standard
+    error of that growth. The regression doesn't need the end years and is less swayed by one unusual year. Also gives
+    the spread of the year over year growth: the standard deviation of log(value) from one year to the next, over the
+    pairs of consecutive years with positive values.
+
+    Returns
+    -------
+    dict of arrays, one element per row: "cagr %", "regression %", "std err %", "points" (years used in the fit),
+    "yoy std %" (nan with fewer than two year over year changes)
+    """
+
+    values = np.asarray(values, dtype=float)
+    nYears = values.shape[1]
+    yearNo = np.arange(nYears, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = values[:, -1] / values[:, 0]
+        cagr = np.where((values[:, 0] > 0) & (values[:, -1] > 0), ratio ** (1.0 / (nYears - 1)) * 100 - 100, np.nan)
+
+        positive = values > 0  # nan compares as False
+        logs = np.log(np.where(positive, values, 1.0))
+        points = positive.sum(axis=1)
+        yearMean = (positive * yearNo).sum(axis=1) / points
+        logMean = (positive * logs).sum(axis=1) / points
+        dYear = np.where(positive, yearNo - yearMean[:, None], 0.0)
+        dLog = np.where(positive, logs - logMean[:, None], 0.0)
+        sxx = (dYear ** 2).sum(axis=1)
+        slope = (dYear * dLog).sum(axis=1) / sxx
+        residuals = np.where(positive, dLog - slope[:, None] * dYear, 0.0)
+        slopeErr = np.sqrt((residuals ** 2).sum(axis=1) / (points - 2) / sxx)
+
+        consecutive = positive[:, 1:] & positive[:, :-1]
+        changes = consecutive.sum(axis=1)
+        yoy = np.where(consecutive, np.diff(logs, axis=1), 0.0)
+        yoyDev = np.where(consecutive, yoy - (yoy.sum(axis=1) / changes)[:, None], 0.0)
+        yoyStd = np.sqrt((yoyDev ** 2).sum(axis=1) / (changes - 1))
+
+    enough = points >= 2
+    return {"cagr %": cagr, "regression %": np.where(enough, np.expm1(slope) * 100, np.nan),
+            "std err %": np.where(points >= 3, np.exp(slope) * slopeErr * 100, np.nan), "points": points,
+            "yoy std %": np.where(changes >= 2, yoyStd * 100, np.nan)}
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# sum of q^t for t = 1..years, with q = (1 + growth) / (1 + disctRate), and its derivative with respect to q,
+# element by element for numpy arrays. This is the NPV factor of an EPS stream growing geometrically: the NPV of the
+# EPS from next year to yrsDiscted years out is EPS newest * geometricSum(growth, disctFactor, yrsDiscted)[0], the
+# same as npf.npv on the projected EPS with a zero in year 0. Growth here is a fraction, not %.
+# The closed form q * (q^n - 1) / (q - 1) is evaluated with expm1/log1p of d = q - 1 so it stays accurate as q
+# approaches 1, i.e. growth approaches the discount rate.
+def geometricSum(growth, disctRate, years):
+    d = (np.asarray(growth, dtype=float) - disctRate) / (1.0 + np.asarray(disctRate, dtype=float))
+    years = np.asarray(years, dtype=float)
+    q = 1.0 + d
+    isZero = d == 0.0
+    dSafe = np.where(isZero, 1.0, d)  # avoids 0/0 where q = 1, those elements are replaced below
+    with np.errstate(invalid="ignore", over="ignore"):
+        qPowNm1 = np.expm1(years * np.log1p(dSafe))  # q^n - 1
+        total = np.where(isZero, years, q * qPowNm1 / dSafe)
+        # derivative, with a first order expansion where the closed form loses precision close to q = 1
+        slopeClosed = (1.0 + (years * q - years - 1.0) * (qPowNm1 + 1.0)) / dSafe ** 2
+    slopeNearOne = years * (years + 1.0) / 2.0 + (years + 1.0) * years * (years - 1.0) / 3.0 * d
+    slope = np.where(np.abs(d) < 1e-4, slopeNearOne, slopeClosed)
+    return total, slope
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# npv at disctRate of EPS growing at growthPct % per year for yrsDiscted years after the purchase year (no EPS in the
+# purchase year). Works on numpy arrays of any matching (broadcastable) shapes.
+def npvGeometric(epsNewest, growthPct, disctRate, years):
+    return np.asarray(epsNewest, dtype=float) * geometricSum(np.asarray(growthPct, dtype=float) / 100.0, disctRate,
+                                                             years)[0]
+
+
+# solver status codes returned by breakevenGrowth, and the warning text for each
+SOLVER_OK = 0
+SOLVER_EPS_NOT_POSITIVE = 1
+SOLVER_BAD_INPUT = 2
+SOLVER_NO_BRACKET = 3
+SOLVER_MAX_ITER = 4
+solverStatusNames = {SOLVER_OK: "ok", SOLVER_EPS_NOT_POSITIVE: "eps not positive", SOLVER_BAD_INPUT: "bad input",
+                     SOLVER_NO_BRACKET: "no bracket", SOLVER_MAX_ITER: "max iterations"}
+solverStatusText = {SOLVER_OK: "",
+                    SOLVER_EPS_NOT_POSITIVE: "Required growth not found. Newest EPS is not positive.",
+                    SOLVER_BAD_INPUT: "Required growth not found. Price, disct rate or years invalid.",
+                    SOLVER_NO_BRACKET: "Required growth not found. No growth brings the NPV up to the price.",
+                    SOLVER_MAX_ITER: "Required growth not found. Solver did not converge."}
+
+
+# --------------------------------------------------------------------------------------------------------------------
+def breakevenGrowth(price, epsNewest, disctRate, years, maxIter=100):
+    """
+    Minimum EPS growth for the NPV of the purchaser's future EPS to break even with the share price, for many stocks
+    in one call.
+
+    Solves epsNewest * geometricSum(g, disctRate, years) = price for g. The left side rises steadily
+    with g when the EPS is positive, so the root is first bracketed between -100 % and a growth high enough to beat
+    the price, and then found by Newton steps that fall back to bisection whenever a step would leave the bracket.
+    Every stock converges or is flagged with a status code. No stock holds up the others.
+
+    Parameters
+    ----------
+    price, epsNewest, disctRate, years : numpy arrays (or scalars) of matching shapes
+
+    Returns
+    -------
+    list of [growth % pa, status code, iterations used, npv - price at the returned growth], each an array
+    """
+
+    price, epsNewest, disctRate, years = np.broadcast_arrays(np.asarray(price, dtype=float),
+                                                             np.asarray(epsNewest, dtype=float),
+                                                             np.asarray(disctRate, dtype=float),
+                                                             np.asarray(years, dtype=float))
+    status = np.full(price.shape, SOLVER_OK, dtype=int)
+    status[~(epsNewest > 0)] = SOLVER_EPS_NOT_POSITIVE
+    status[~((price > 0) & (disctRate > -1.0) & (years >= 1))] = SOLVER_BAD_INPUT
+    active = status == SOLVER_OK
+
+    def excess(growth):  # npv - price and its derivative with respect to growth (as a fraction, not %)
+        total, slope = geometricSum(growth, disctRate, years)
+        return epsNewest * total - price, epsNewest * slope / (1.0 + disctRate)
+
+    # bracket: at growth -100 % the EPS stream is worth nothing, double the upper end until it beats the price
+    low = np.full(price.shape, -1.0)
+    high = np.maximum(disctRate, 0.0) + 0.1
+    for _ in range(64):
+        needMore = active & (excess(high)[0] < 0)
+        if not needMore.any():
+            break
+        high = np.where(needMore, high * 2.0 + 1.0, high)
+    noBracket = active & (excess(high)[0] < 0)
+    status[noBracket] = SOLVER_NO_BRACKET
+    active = active & ~noBracket
+
+    # start where the stream doesn't grow in real terms, q = 1, clipped into the bracket
+    growth = np.clip(disctRate, low, high)
+    iterations = np.zeros(price.shape, dtype=int)
+    tolerance = 1e-10 * np.maximum(price, 1.0)
+    for _ in range(maxIter):
+        value, slope = excess(growth)
+        converged = np.abs(value) < tolerance
+        stepping = active & ~converged
+        if not stepping.any():
+            break
+        iterations = iterations + stepping
+        low = np.where(stepping & (value < 0), growth, low)
+        high = np.where(stepping & (value > 0), growth, high)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = growth - value / slope
+        inside = (newton > low) & (newton < high) & np.isfinite(newton)
+        nextGrowth = np.where(inside, newton, (low + high) / 2.0)
+        converged = converged | (np.abs(nextGrowth - growth) < 1e-14)
+        growth = np.where(stepping, nextGrowth, growth)
+
+    residual = excess(growth)[0]
+    status[active & ~(np.abs(residual) < np.maximum(tolerance, 1e-6))] = SOLVER_MAX_ITER
+    growthPct = np.where(status == SOLVER_OK, growth * 100.0, np.nan)
+    return [growthPct, status, iterations, residual]
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# share purchaser's cashflow projection for many stocks at once, one row per stock: minus the purchase price in year 0
+# (no earnings in the purchase year) then the newest EPS grown by growthPct % every year for yrsDiscted years.
+def projectCashflows(price, epsNewest, growthPct, years):
+    price = np.atleast_1d(np.asarray(price, dtype=float))
+    epsNewest = np.atleast_1d(np.asarray(epsNewest, dtype=float))
+    growthPct = np.atleast_1d(np.asarray(growthPct, dtype=float))
+    yearNo = np.arange(1, years + 1)
+    cashflows = np.empty((len(price), years + 1))
+    cashflows[:, 0] = -price
+    cashflows[:, 1:] = epsNewest[:, None] * (1.0 + growthPct[:, None] / 100.0) ** yearNo[None, :]
+    return cashflows
+
+
+# --------------------------------------------------------------------------------------------------------------------
+def batchIRR(cashflows, steps=30):
+    """
+    Internal rate of return of every row of an (N stocks x years) cashflow matrix, giving the same results as
+    npf.irr row by row.
+
+    A share purchase is one negative outlay followed by non-negative earnings. For such a row the npv, written as a
+    polynomial in x = 1 / (1 + irr), rises and is convex for x > 0, so it has exactly one root and Newton's method
+    started to the right of that root walks down onto it without overshooting. The start is the smallest x at which
+    a single year's cashflow already repays the outlay. All rows take the same array wide Newton steps, until every
+    row has converged or after steps steps. Rows that are not of that form (e.g. a negative EPS later on) fall back
+    to npf.irr. Rows with a nan or infinite cashflow have no irr; npf.irr would raise LinAlgError on them.
+
+    Parameters
+    ----------
+    cashflows : 2d numpy array, year 0 in column 0. Trailing zero columns are fine, e.g. to pad shorter horizons.
+    steps : maximum number of Newton steps
+
+    Returns
+    -------
+    numpy array of irr as fractions, nan where there is no irr
+    """
+
+    cashflows = np.atleast_2d(np.asarray(cashflows, dtype=float))
+    outlay = cashflows[:, 0]
+    later = cashflows[:, 1:]
+    yearNo = np.arange(1, cashflows.shape[1], dtype=float)
+    finite = np.isfinite(cashflows).all(axis=1)
+    conventional = finite & (outlay < 0) & (later >= 0).all(axis=1) & (later > 0).any(axis=1)
+
+    irr = np.full(len(cashflows), np.nan)
+    if conventional.any():
+        c0 = outlay[conventional]
+        ct = later[conventional]
+        with np.errstate(divide="ignore"):
+            x = np.min((-c0[:, None] / ct) ** (1.0 / yearNo[None, :]), axis=1)
+        for _ in range(steps):
+            powers = np.cumprod(np.broadcast_to(x[:, None], ct.shape), axis=1)  # x, x^2, x^3, ...
+            value = c0 + (ct * powers).sum(axis=1)
+            slope = (ct * yearNo[None, :] * powers).sum(axis=1) / x
+            newtonStep = np.where(slope > 0, value / slope, 0.0)
+            x = x - newtonStep
+            if not (np.abs(newtonStep) > 1e-14 * x).any():
+                break
+        irr[conventional] = 1.0 / x - 1.0
+
+    for row in np.nonzero(finite & ~conventional)[0]:
+        irr[row] = npf.irr(cashflows[row])
+    return irr
+
+
+# --------------------------------------------------------------------------------------------------------------------
+def sensitivityCube(price, epsNewest, growthPct, disctRates, yearsList, haircuts):
+    """
+    NPV, IRR and breakeven growth of every stock at every point of a discount rate x years discounted x growth
+    haircut grid, in one broadcast pass.
+
+    The haircut is the fraction taken off the historic EPS growth, e.g. 0.25 projects the EPS at 75 % of its CAGR.
+    The breakeven growth doesn't depend on the haircut and the IRR doesn't depend on the discount rate, so each is
+    solved once on its own smaller grid and then broadcast to the full cube.
+
+    Parameters
+    ----------
+    price, epsNewest, growthPct : 1d numpy arrays, one element per stock
+    disctRates, yearsList, haircuts : lists of the grid values
+
+    Returns
+    -------
+    dict of 4d numpy arrays (stock x disct rate x yrs discounted x haircut): "growth % pa", "NPV", "IRR %",
+    "Req gr % pa", "solver status"
+    """
+
+    price = np.asarray(price, dtype=float)[:, None, None, None]
+    epsNewest = np.asarray(epsNewest, dtype=float)[:, None, None, None]
+    growthPct = np.asarray(growthPct, dtype=float)[:, None, None, None]
+    rates = np.asarray(disctRates, dtype=float)[None, :, None, None]
+    years = np.asarray(yearsList, dtype=int)[None, None, :, None]
+    cuts = np.asarray(haircuts, dtype=float)[None, None, None, :]
+    shape = np.broadcast_shapes(price.shape, rates.shape, years.shape, cuts.shape)
+
+    projGrowth = growthPct * (1.0 - cuts)
+    npv = npvGeometric(epsNewest, projGrowth, rates, years)
+
+    # irr on the stock x years x haircut grid: cashflows padded with zeros beyond each horizon
+    maxYears = int(np.max(yearsList))
+    yearNo = np.arange(1, maxYears + 1)
+    earnings = epsNewest[..., None] * (1.0 + projGrowth[..., None] / 100.0) ** yearNo
+    earnings = np.where(yearNo <= years[..., None], earnings, 0.0)[:, 0, :, :, :]  # drop the disct rate axis
+    cashflows = np.concatenate([np.broadcast_to(-price[:, 0, :, :, None], earnings.shape[:-1] + (1,)), earnings],
+                               axis=-1)
+    irr = batchIRR(cashflows.reshape(-1, maxYears + 1)).reshape(earnings.shape[:-1])[:, None, :, :]
+
+    # breakeven growth on the stock x disct rate x years grid
+    reqGrowth, status = breakevenGrowth(price, epsNewest, rates, years)[0:2]
 
+    return {"growth % pa": np.broadcast_to(projGrowth, shape), "NPV": np.broadcast_to(npv, shape),
+            "IRR %": np.broadcast_to(irr * 100.0, shape), "Req gr % pa": np.broadcast_to(reqGrowth, shape),
+            "solver status": np.broadcast_to(status, shape)}
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# a sensitivity cube as a long format table, one row per stock and grid point
+def cubeToLong(stocks, cube, disctRates, yearsList, haircuts):
+    axes = np.meshgrid(np.asarray(stocks, dtype=object), np.asarray(disctRates) * 100.0, np.asarray(yearsList),
+                       np.asarray(haircuts) * 100.0, indexing="ij")
+    table = pd.DataFrame({"Ticker": axes[0].ravel(), "Disct rate %": axes[1].ravel(),
+                          "Yrs discounted after purchase": axes[2].ravel(), "Growth haircut %": axes[3].ravel()})
+    for name, values in cube.items():
+        table[name] = values.ravel()
+    return table
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# percentiles of the simulated NPV and IRR given by simulateValuations
+mcPercentiles = [5, 25, 50, 75, 95]
+
+
+def simulateValuations(price, epsNewest, growthPct, growthStdPct, seeds, paths, years, disctRate):
+    """
+    Monte Carlo NPV and IRR of a batch of stocks over simulated EPS paths, all stocks and paths at once as
+    (stocks x paths x years) arrays. Each year's EPS growth is drawn from a lognormal distribution around the stock's
+    EPS growth, i.e. log(1 + growth) is normal with mean log(1 + growthPct / 100) and standard deviation
+    growthStdPct / 100 (the spread of the stock's year over year growth, see growthStats), so the EPS stay positive.
+    Module level with only array arguments, so it can run in a worker process.
+
+    Parameters
+    ----------
+    price, epsNewest, growthPct, growthStdPct : 1d numpy arrays, one element per stock. A nan spread counts as 0.
+    seeds : one random seed per stock, so a stock's paths don't depend on which other stocks share its batch
+    paths, years : paths per stock and years projected
+    disctRate : discount rate as a fraction
+
+    Returns
+    -------
+    dict of 1d arrays, one element per stock: "NPV p5" ... "NPV p95", "IRR % p5" ... "IRR % p95", "P(NPV > price)"
+    """
+
+    nStocks = len(price)
+    logGrowth = np.empty((nStocks, paths, years))
+    for k in range(nStocks):
+        logGrowth[k] = np.random.default_rng(seeds[k]).standard_normal((paths, years))
+    logGrowth *= np.nan_to_num(np.asarray(growthStdPct, dtype=float) / 100.0)[:, None, None]
+    logGrowth += np.log1p(np.asarray(growthPct, dtype=float) / 100.0)[:, None, None]
+    eps = np.asarray(epsNewest, dtype=float)[:, None, None] * np.exp(np.cumsum(logGrowth, axis=2, out=logGrowth))
+
+    npv = eps @ (1.0 + disctRate) ** -np.arange(1, years + 1, dtype=float)  # stocks x paths
+    cashflows = np.concatenate([np.broadcast_to(-np.asarray(price, dtype=float)[:, None, None], (nStocks, paths, 1)),
+                                eps], axis=2)
+    irr = batchIRR(cashflows.reshape(nStocks * paths, years + 1)).reshape(nStocks, paths) * 100
+
+    simulated = {}
+    for name, values in [["NPV", npv], ["IRR %", irr]]:
+        for percentile, row in zip(mcPercentiles, np.nanpercentile(values, mcPercentiles, axis=1)):
+            simulated[name + " p" + str(percentile)] = row
+    simulated["P(NPV > price)"] = (npv > np.asarray(price, dtype=float)[:, None]).mean(axis=1)
+    return simulated
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# Monte Carlo mode: simulateValuations for a list of stocks, in batches small enough for the simulation arrays of one
+# batch to stay within memoryMB, spread over a pool of worker processes. Returns a dataframe indexed by ticker.
+def monteCarlo(stocks, price, epsNewest, growthPct, growthStdPct, paths, years, disctRate, workers, memoryMB):
+    # about eight (paths x years + 1) float arrays per stock are alive at once, mostly in batchIRR
+    batchSize = max(1, int(memoryMB * 2 ** 20 / (8 * 8 * paths * (years + 1))))
+    seeds = [[mcSeed, zlib.crc32(stock.encode("utf-8"))] for stock in stocks]
+    batches = [[np.asarray(values)[start:start + batchSize] for values in [price, epsNewest, growthPct, growthStdPct]] +
+               [seeds[start:start + batchSize], paths, years, disctRate] for start in range(0, len(stocks), batchSize)]
+    workers = min(workers, os.cpu_count() or 1, len(batches))  # extra processes on a single core only cost start-up
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(simulateValuations, *zip(*batches)))
+    else:
+        parts = [simulateValuations(*batch) for batch in batches]
+    simulated = pd.DataFrame({name: np.concatenate([part[name] for part in parts]) for name in parts[0]},
+                             index=pd.Index(stocks, name="Ticker"))
+    simulated.insert(0, "Price", price)
+    simulated.insert(1, "EPS gr % pa", growthPct)
+    simulated.insert(2, "EPS yoy gr std dev %", growthStdPct)
+    return simulated
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# dictionary of ticker -> 10 digit CIK for every company in the SEC's company_tickers.json. The file goes through the
+# response cache, so it is downloaded at most once a day (see cacheTTL).
+def loadTickerMap():
+    if companyTickersFile != "":  # a local copy, for runs without a network
+        with open(companyTickersFile, "rb") as tickerFile:
+            errorFlag, body = [False, tickerFile.read()]
+    else:
+        errorFlag, body = get_sec_bytes(secWebURL + "/files/company_tickers.json")
     if errorFlag:
-        print(Fore.RED, "The SEC data for ", message_prefix, " does not contain ", lookupkey, " with value = ",
-              lookupval)
+        print(Fore.RED, "SEC ticker list not available, CIKs will come from financial modeling prep. ", body)
         print(Fore.BLACK, end="")
-        pdResults.loc[stock, "Warnings if any"] = "The SEC data for " + message_prefix + " does not contain " + \
-                                                  lookupkey + " with value = " + lookupval
-    '''else:
-        print("The SEC data for ", message_prefix, " with ", lookupkey, " = ", lookupval, " has ",
-              targetkey, ' = ', dictParam[ii][targetkey])'''
+        return {}
+    # form is {"0": {"cik_str": 320193, "ticker": "AAPL", "title": "Apple Inc."}, "1": {...
+    tickers = json.loads(body)
+    return {entry["ticker"].upper(): str(entry["cik_str"]).zfill(10) for entry in tickers.values()}
 
-    list1 = list([ii, dictParam[ii][targetkey], errorFlag])
-    return list1
 
+# --------------------------------------------------------------------------------------------------------------------
+# current share prices for a list of stocks, chunkSize symbols per financial modeling prep request, as a dictionary
+# of ticker -> price. Stocks without a quote are left out.
+def fetchQuotes(stocks, chunkSize):
+    prices = {}
+    for start in range(0, len(stocks), chunkSize):
+        chunk = stocks[start:start + chunkSize]
+        urlQuotes = fmpURL + "/api/v3/quote/" + ",".join(chunk) + "?apikey=" + myApiKey
+        try:
+            quoteList = get_jsonparsed_data(urlQuotes)
+        except (OfflineCacheMiss, HTTPError) as quoteErr:
+            print(Fore.RED, "Share prices not found for ", chunk[0], " to ", chunk[-1], ": ", quoteErr)
+            print(Fore.BLACK, end="")
+            continue
+        except requests.RequestException as sendErr:  # its message has the url, api key included
+            print(Fore.RED, "Share prices not found for ", chunk[0], " to ", chunk[-1], ": financial modeling prep "
+                  "not reachable (", type(sendErr).__name__, ")")
+            print(Fore.BLACK, end="")
+            continue
+        # form is [{"symbol": "AAPL", "name": "Apple Inc.", "price": 145.86, ...}, {"symbol": "MSFT", ...
+        for quote in quoteList:
+            if quote.get("price") is not None:
+                prices[quote["symbol"].upper()] = float(quote["price"])
+    return prices
 
-# ---------------------------------------------------------main----------------------------------------------------
-# -----------------------------------------------------user input//////////////////////////////////////////////////
-# access key for financial modeling prep dot com
 
-myApiKey = "<Insert your API key here>"  # <---- insert your API key here
+# --------------------------------------------------------------------------------------------------------------------
+def screenUniverse(newestYear):
+    """
+    Screening mode: the EPS growth, NPV, IRR and breakeven growth of every SEC filer with a ticker, from a few frames
+    API requests per calendar year instead of requests per company, all stocks calculated at once.
 
-# ticker list and description.
-stockListInput = ['aapl', 'fts', 'wec', 'nvda', 'jpm', 'chd']
-listDescription: str = "test data"
+    Every filer is taken over the same calendar years, newestYear - yrsHistory to newestYear. The frames give EPS as
+    filed, not adjusted for later stock splits, so filers whose implied share count jumps between years are flagged
+    and should be checked with a normal run (the drill-down), which does adjust for splits.
 
-# stocks with market cap < minMarketCap will be ignored
-minMarketCap: float = 1000000000.0
+    Returns
+    -------
+    dataframe indexed by ticker, the best IRR first
+    """
 
-# years of EPS history to look for in SEC/Edgar
-yrsHistory: int = 10
+    years = list(range(newestYear - yrsHistory, newestYear + 1))
+    ciks, [epsMatrix, incMatrix], names = screenFrames([["USD/shares", [["us-gaap", "EarningsPerShareDiluted"]]],
+                                                        ["USD", netIncomeConcepts]], years)
+    # the first ticker listed for a CIK stands for the filer
+    cikToTicker: dict = {}
+    for ticker, cikStr in tickerToCik.items():
+        cikToTicker.setdefault(int(cikStr), ticker)
+    tickers = np.array([cikToTicker.get(cik, "") for cik in ciks.tolist()], dtype=object)
+
+    epsStats = growthStats(epsMatrix)
+    incStats = growthStats(incMatrix)
+    if growthMethod == "cagr":
+        epsGr = epsStats["cagr %"]
+        enoughHistory = np.isfinite(epsGr)
+    else:
+        epsGr = epsStats["regression %"]
+        enoughHistory = epsStats["points"] >= minRegressionYears
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharesMatrix = incMatrix / epsMatrix
+        shareJump = np.abs(np.diff(np.log(np.where(sharesMatrix > 0, sharesMatrix, np.nan)), axis=1))
+    possibleSplit = np.nanmax(np.where(np.isfinite(shareJump), shareJump, 0.0), axis=1) > np.log(1.5)
+
+    candidates = (tickers != "") & (epsMatrix[:, -1] > 0) & enoughHistory & (epsGr >= 0) & (sharesMatrix[:, -1] >= 1)
+    print("Screening ", len(ciks), " SEC filers for ", years[0], " to ", years[-1], ", ", int(candidates.sum()),
+          " with a ticker and positive EPS and EPS growth")
+    prices = fetchQuotes(tickers[candidates].tolist(), quoteChunkSize)
+    price = np.array([prices.get(ticker, np.nan) for ticker in tickers.tolist()])
+    mktCap = price * sharesMatrix[:, -1]
+    valued = np.flatnonzero(candidates & np.isfinite(price) & (mktCap >= minMarketCap))
+
+    epsNPV = npvGeometric(epsMatrix[valued, -1], epsGr[valued], disctFactor, yrsDiscted)
+    shareIRR = batchIRR(projectCashflows(price[valued], epsMatrix[valued, -1], epsGr[valued], yrsDiscted))
+    reqGrowth, solverStatus = breakevenGrowth(price[valued], epsMatrix[valued, -1], disctFactor, yrsDiscted)[0:2]
+
+    screenResults = pd.DataFrame({
+        "Name": [names[cik] for cik in ciks[valued].tolist()], "CIK": [str(cik).zfill(10) for cik in ciks[valued]],
+        "EPS newest": epsMatrix[valued, -1], "Comprehensive Net Income gr % pa": incStats["cagr %"][valued],
+        "EPS gr % pa": epsGr[valued], "EPS CAGR % pa": epsStats["cagr %"][valued],
+        "EPS regression gr % pa": epsStats["regression %"][valued],
+        "EPS regression std err %": epsStats["std err %"][valued], "EPS yrs in regression": epsStats["points"][valued],
+        "Req gr % pa for NPV break-even": np.where(solverStatus == SOLVER_OK, reqGrowth, np.nan),
+        "Price": price[valued], "Shares out-standing": sharesMatrix[valued, -1], "Mkt Cap": mktCap[valued],
+        "NPV of Future EPS": epsNPV, "IRR %": shareIRR * 100,
+        "Warnings if any": np.where(possibleSplit[valued], "Implied share count jumps, possible split not adjusted "
+                                                           "for. Check with a normal run.", "")},
+        index=pd.Index(tickers[valued], name="Ticker"))
+    return screenResults.sort_values("IRR %", ascending=False)
 
-# npv discount factor and years of growth after purchase
-disctFactor: float = .06
-yrsDiscted: int = 15
 
-# administrator email address to be provided in any programmed url request header going to SEC Edgar, per their request
-myEmail = "<Insert your admin email here for inclusion in the SEC/Edgar url request header>"  # <---- insert
-# ----------------------------------------------------check and cleanse user input-------------------------------------
-
-if myApiKey == "<Insert your API key here>":
-    print("Error. You must obtain a valid API key from financialmodelingprep.com "
-          "and insert it into the code input section. The program will end.")
-    sys.exit()
-
-if myEmail == "<Insert your admin email here for inclusion in the SEC/Edgar url request header>":
-    print("Error. When a program automates access to the SEC/Edgar, it is required to give an admin email in the "
-          "URL request header. Please insert the email into the code input section. The program will end.")
-    sys.exit()
-
-# stocks must be uppercase
-stockList: list = []
-for stocks in stockListInput:
-    stockList = stockList + [stocks.upper()]
-
-# ----------------------------------------------------initialize misc. variables---------------------------------
-currentTime = datetime.now()
-currentYear = currentTime.year
-currentYearStr = str(int(currentYear))
-
-# prepare a dataframe to hold the results of the caclulations across all stocks in stocklist.
-# dataframe row index = stocklist names.
-# dataframe column names as follows:
-
-colNames = ["Name", "CIK", "Currency", "Newest yr history", "Oldest yr history", "EPS newest",
-            "Comprehensive Net Income gr % pa",
-            "EPS gr % pa", "Req gr % pa for NPV break-even", "Share gr % pa",
-            "Price", "Shares out-standing", "Mkt Cap", "NPV of Future EPS", "Disct rate %",
-            "IRR %", "Warnings if any", "Yrs discounted after purchase"]
-
-# npResults = np.zeros([len(stockList), len(colNames)])
-# pdResults = pd.DataFrame(data=npResults, index=stockList, columns=colNames)
-pdResults = pd.DataFrame(index=stockList, columns=colNames)
-
-# print gen info
-print("CIK provided by Financial Modeling Prep (see https://financialmodelingprep.com/developer/docs/)")
-print("This program is a Python learning exercise, not to be used for stock trading or financial advice. ")
-
-# --------------------------------------------loop through each stock--------------------------------------------
-for stock in stockList:
-    oldTimeStamp = datetime.now()  # baseline, allows a delay to be called later before repeat access to data provider
-
-    # initialize for each stock. EPS[0] is newest year, EPS[1] is oldest year of history series, e.g.
-    NetIncome: float = [0, 0]
-    EPS: float = [0, 0]
-    EPSsplit: float = 1.0
-    SharesOut: float = [0, 0]
-    Year = [0, 0]
-    seriesStart: datetime = datetime(1900, 1, 1)
-    seriesEnd: datetime = datetime(1900, 1, 1)
-    splitNumerator: float = 1.0
-    splitDenominator: float = 1.0
-
-    # print blank line, then ticker
-    print("")
-    print("Ticker = " + stock)
-
-    # --------------get the SEC CIK (central index key) and current share price from financial modeling prep----------
-    urlIncome = "https://financialmodelingprep.com/api/v3/income-statement/" + stock + "?apikey=" + myApiKey + \
-                "&limit=1"
-    urlSharePrice = "https://financialmodelingprep.com/api/v3/quote-short/" + stock + "?apikey=" + myApiKey
-    urlSplitHistory = "https://financialmodelingprep.com/api/v3/historical-price-full/stock_split/" + \
-                      stock + "?apikey=" + myApiKey
+# --------------------------------------------------------------------------------------------------------------------
+def refreshPrices(stocks):
+    """
+    Price refresh mode: revalue stocks at today's share prices from the results of earlier full runs kept in the
+    fundamentals store (newest EPS, the EPS growth used, shares outstanding), without any SEC request or split
+    history. The share prices come in batched requests and every stock is recalculated at once, at the current
+    disctFactor and yrsDiscted.
+
+    Returns
+    -------
+    dataframe indexed by ticker, in the order of stocks, with the new market cap, NPV, IRR and breakeven growth next
+    to their values at the stored valuation
+    """
+
+    stored = fundamentalsStore.valuations(stocks)
+    tickers = [stock for stock in stocks if stock in stored]
+    print("Refreshing the prices of ", len(tickers), " stocks valued in earlier runs, ", len(stocks) - len(tickers),
+          " never valued")
+    storedRows = [stored[ticker][0] for ticker in tickers]
+
+    def storedColumn(column):
+        return np.array([row.get(column, np.nan) for row in storedRows], dtype=float)
+
+    epsNewest, epsGr, sharesOut = storedColumn("EPS newest"), storedColumn("EPS gr % pa"), \
+        storedColumn("Shares out-standing")
+    prices = fetchQuotes(tickers, quoteChunkSize)
+    price = np.array([prices.get(ticker, np.nan) for ticker in tickers])
+    mktCap = price * sharesOut
+    valued = np.flatnonzero(np.isfinite(price) & (sharesOut > 0) & (mktCap >= minMarketCap))
+
+    # stocks left out of the revaluation keep a not ok status, only the solver sets the others'
+    shareIRR = np.full(len(tickers), np.nan)
+    reqGrowth = np.full(len(tickers), np.nan)
+    solverStatus = np.full(len(tickers), SOLVER_BAD_INPUT)
+    shareIRR[valued] = batchIRR(projectCashflows(price[valued], epsNewest[valued], epsGr[valued], yrsDiscted)) * 100
+    reqGrowth[valued], solverStatus[valued] = \
+        breakevenGrowth(price[valued], epsNewest[valued], disctFactor, yrsDiscted)[0:2]
+    reqGrowth = np.where(solverStatus == SOLVER_OK, reqGrowth, np.nan)
+    warnings = np.where(np.isnan(price), "No share price found",
+                        np.where(~(sharesOut > 0), "No shares outstanding; IRR not recomputed.",
+                                 np.where(mktCap < minMarketCap, "Market cap is less than $" + str(minMarketCap) + ".",
+                                          [solverStatusText[status] for status in solverStatus.tolist()])))
+
+    refreshResults = pd.DataFrame({
+        "Name": [row.get("Name") for row in storedRows], "CIK": [row.get("CIK") for row in storedRows],
+        "Currency": [row.get("Currency") for row in storedRows],
+        "Valued on": [datetime.fromtimestamp(stored[ticker][1]).strftime("%d-%b-%Y %H:%M") for ticker in tickers],
+        "EPS newest": epsNewest, "EPS gr % pa": epsGr, "Shares out-standing": sharesOut,
+        "Price at valuation": storedColumn("Price"), "Price": price,
+        "Price change %": (price / storedColumn("Price") - 1.0) * 100, "Mkt Cap": mktCap,
+        "NPV of Future EPS": npvGeometric(epsNewest, epsGr, disctFactor, yrsDiscted),
+        "IRR % at valuation": storedColumn("IRR %"), "IRR %": shareIRR,
+        "IRR change % pts": shareIRR - storedColumn("IRR %"),
+        "Req gr % pa at valuation": storedColumn("Req gr % pa for NPV break-even"),
+        "Req gr % pa for NPV break-even": reqGrowth,
+        "Req gr change % pts": reqGrowth - storedColumn("Req gr % pa for NPV break-even"),
+        "Disct rate %": disctFactor * 100, "Yrs discounted after purchase": yrsDiscted, "Warnings if any": warnings},
+        index=pd.Index(tickers, name="Ticker"))
+    refreshResults = refreshResults.reindex(pd.Index(stocks, name="Ticker"))
+    refreshResults["Warnings if any"] = refreshResults["Warnings if any"].fillna("Not valued in an earlier full run.")
+    return refreshResults
+
 
+# --------------------------------------------------------------------------------------------------------------------
+# the SEC CIK (central index key) of a ticker from the SEC's ticker list, or from financial modeling prep if needed.
+# Returns [error message or "", CIK]
+def lookupCik(stock):
+    cikStr = tickerToCik.get(stock, "")
+    if cikStr != "":
+        return ["", cikStr]
+
+    urlIncome = fmpURL + "/api/v3/income-statement/" + stock + "?apikey=" + myApiKey + "&limit=1"
     # load url for stock income statement
     try:
         bigDict = dict(get_jsonparsed_data(urlIncome)[0])
     except:
         # above will throw an error if e.g. the ticker symbol is invalid
-        print(Fore.RED, "Ticker symbol ", stock, " not found in financial modeling prep")
-        pdResults.loc[stock, "Warnings if any"] = "Ticker symbol not found in financial modeling prep."
-        print(Fore.BLACK, end="")
-        continue  # move on to next stock
+        return ["Ticker symbol not found in SEC ticker list or financial modeling prep.", ""]
 
     # form of bigDict is
-    # [{ #   "date" : "2021-09-25", "symbol" : "AAPL", "reportedCurrency" : "USD", "cik" : "0000320193",.....   ...},
+    # [{ #   "date" : "2021-09-25", "symbol" : "AAPL", "reportedCurrency" : "USD", "cik" : "0000320193",.....},
     #   { "date" : "2020-09-26", "symbol" : "AAPL", "reportedCurrency" : "USD", "cik" : "0000320193", ......
 
     if bigDict == {}:
-        print(Fore.RED, "No income statement for ", stock, "in financial modeling prep")
-        pdResults.loc[stock, "Warnings if any"] = "No income statement found in financial modeling prep."
-        print(Fore.BLACK, end="")
-        continue  # move on to next stock
+        return ["No income statement found in financial modeling prep.", ""]
+    if bigDict['cik'] == "":
+        return ["CIK not found in financial modelling prep.", ""]
+    return ["", bigDict['cik']]
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# the SEC facts of one filer, from the company facts archive, the fundamentals store or a download. Returns a dictionary
+# with an error message ("" if none), the packed facts of the storedConcepts and the net income resolution.
+def fetchFacts(cikStr):
+    fetched = {"error": "", "facts": None, "netIncome": None}
+
+    # with a local company facts archive the facts are read from the archive, nothing is downloaded or stored
+    if factsArchive is not None:
+        myList2: list = factsArchive.get(cikStr)
+        if myList2[0]:  # element 0 is error flag, if true the CIK is not in the archive
+            fetched["error"] = myList2[1]
+            return fetched
+        fetched["facts"] = myList2[1]
+        fetched["netIncome"] = resolveConcepts(fetched["facts"], netIncomeConcepts)
+    else:
+        # the company facts are only downloaded again if the company has filed a report since they were last stored
+        latestAccession = get_latest_accession(cikStr)
+        syncedAccession = fundamentalsStore.syncedAccession(cikStr)
+        if syncedAccession != "" and (latestAccession == syncedAccession or (latestAccession == "" and offlineMode)):
+            fetched["facts"] = fundamentalsStore.load(cikStr)
+        else:
+            # one companyfacts download holds every concept the company has filed, EPS and net income included
+            myList2: list = get_sec_facts(cikStr, revalidate=latestAccession != "")
+            if myList2[0]:  # element 0 is error flag, if true the CIK was not found
+                fetched["error"] = myList2[1]
+                return fetched
+            fetched["facts"] = myList2[1]
+            if latestAccession != "":
+                fundamentalsStore.save(cikStr, fetched["facts"], latestAccession)
+
+        # which net income concept each year comes from, worked out once per filing and kept with the stored facts.
+        # If the newest filing isn't known the facts can't be matched to a stored resolution, so they are resolved anew
+        fetched["netIncome"] = fundamentalsStore.resolution(cikStr, netIncomeConcepts) if latestAccession != "" \
+            else None
+        if fetched["netIncome"] is None:
+            fetched["netIncome"] = resolveConcepts(fetched["facts"], netIncomeConcepts)
+            if latestAccession != "":
+                fundamentalsStore.saveResolution(cikStr, netIncomeConcepts, fetched["netIncome"])
+
+    # only the packed concepts the valuation reads are handed on, so the stocks in flight don't each hold on to a
+    # whole company facts payload
+    fetched["facts"] = fetched["facts"].select(storedConcepts)
+    return fetched
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# the split history of a ticker from financial modeling prep, parsed. Returns [error message or "", splits]
+def fetchSplits(stock):
+    urlSplitHistory = fmpURL + "/api/v3/historical-price-full/stock_split/" + stock + "?apikey=" + myApiKey
+    try:
+        return ["", parseSplits(get_jsonparsed_data(urlSplitHistory))]
+    except OfflineCacheMiss:
+        return ["Split history not in offline cache.", parseSplits({})]
+    except HTTPError as splitErr:  # e.g. 429 too many requests
+        return ["Split history not available from financial modeling prep: " + str(splitErr), parseSplits({})]
+    except requests.RequestException as sendErr:  # still unreachable or timing out after httpRetries retries
+        return ["Split history not available, financial modeling prep not reachable (" + type(sendErr).__name__ +
+                ").", parseSplits({})]
+
 
-    # get the SEC CIK (central index key)
-    cikStr = bigDict['cik']
+# --------------------------------------------------------------------------------------------------------------------
+# the fetch stage: download (or take from the cache) everything needed to value one stock. Runs in a worker thread,
+# so it doesn't touch the results or print. Returns a dictionary with the CIK, the SEC fact store and the split
+# history, or with an error message if the stock can't be valued. Share prices are fetched for all stocks beforehand.
+def fetchStock(stock):
+    fetched = {"error": "", "cik": "", "facts": None, "netIncome": None, "splits": parseSplits({})}
+    fetched["error"], fetched["cik"] = lookupCik(stock)
+    if fetched["error"] != "":
+        return fetched
+    fetched.update(fetchFacts(fetched["cik"]))
+    if fetched["error"] != "":
+        return fetched
+    fetched["error"], fetched["splits"] = fetchSplits(stock)
+    return fetched
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# runs fetchStock for the stocks in a pool of worker threads and yields (stock, fetched) in stock list order. At most
+# maxInFlight stocks are fetched ahead of the valuation loop consuming them, so a slow valuation holds back the
+# fetching instead of piling up downloaded data. The rate limiters, not the threads, decide how fast requests go out.
+def fetchPipeline(stocks, maxInFlight):
+    # fetchStock in a worker thread, with the thread's metrics going to the stock
+    def fetchTimed(stock):
+        metrics.setTicker(stock)
+        startTime = time.perf_counter()
+        try:
+            return fetchStock(stock)
+        finally:
+            metrics.observe("stage_seconds", time.perf_counter() - startTime, stage="fetch")
+            metrics.setTicker(None)
+
+    stockIter = iter(stocks)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=maxInFlight) as pool:
+        for stock in stockIter:
+            pending.append((stock, pool.submit(fetchTimed, stock)))
+            if len(pending) >= maxInFlight:
+                break
+        while pending:
+            stock, future = pending.popleft()
+            fetched = future.result()
+            nextStock = next(stockIter, None)
+            if nextStock is not None:
+                pending.append((nextStock, pool.submit(fetchTimed, nextStock)))
+            yield stock, fetched
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# the gather stage of one stock: check what the fetch stage brought back and, for a stock that can be valued, add its
+# annual EPS, net income and period ends to gathered. Problems are printed and noted in results[stock].
+def gatherStock(stock, fetched, gathered):
+    # initialize for each stock. Year[0] is newest year, Year[1] is oldest year of history series
+    Year = [0, 0]
 
-    if cikStr == "":
-        print(Fore.RED, "CIK not found in fin. modelling prep for ", stock)
-        pdResults.loc[stock, "Warnings if any"] = "CIK not found in financial modelling prep."
+    # the CIK, SEC facts, split history and share price have been fetched by the fetch stage
+    if fetched["error"] != "":
+        print(Fore.RED, fetched["error"], " (", stock, ")")
+        results[stock].warn(fetched["error"])
         print(Fore.BLACK, end="")
-        continue  # move on to next stock
+        return  # move on to next stock
+
+    cikStr = fetched["cik"]
 
-    # ---------------------------------search SEC for most recent full year EPS info-----------------------------------
+    # ---------------------------------search SEC for most recent full year EPS info--------------------------------
     # because financial modeling prep only provides 5 years free history.
     # (If 5 years history is sufficent, use the alternative program that is purely financial modeling prep-based.)
-    secEPSURL = "https://data.sec.gov/api/xbrl/companyconcept/CIK" + cikStr + "/us-gaap/EarningsPerShareDiluted.json"
-    myList2: list = get_sec_json(secEPSURL)
-    if myList2[0]:  # element 0 is error flag, if true cikstr was not found, move on to next stock
-        continue
+    secFacts: CompanyFacts = fetched["facts"]
+    # units the EPS is reported in, normally only ["USD/shares"]
+    epsUnits: list = secFacts.units("us-gaap", "EarningsPerShareDiluted")
 
-    EPSbigDict: dict = myList2[1]  # get_sec_json return list element 1 is the dictionary
-    # dictionary format. Format is
-    # {"cik": ... ,"units":{"USD/shares":[{"start":"2006-10-01","end":"2007-09-29","val":3.93, ....
-
-    if EPSbigDict == {}:
+    if len(epsUnits) == 0:
         print(Fore.RED, "No SEC EPS entry for ", stock, " with CIK = ", cikStr)
-        pdResults.loc[stock, "Warnings if any"] = "CIK not found in SEC EPS link."
+        results[stock].warn("No diluted EPS found in SEC company facts.")
         print(Fore.BLACK, end="")
-        continue  # move on to next stock
+        return  # move on to next stock
 
-    print("CIK = ", cikStr)
-    pdResults.loc[stock, "CIK"] = cikStr
-    pdResults.loc[stock, "Name"] = EPSbigDict["entityName"]
+    print(stock, " CIK = ", cikStr)
+    results[stock].cik = cikStr
+    results[stock].name = secFacts.entityName
 
     # find out which currency/shares is being used
-    keylist = list(EPSbigDict["units"].keys())
-    currencyPerShare = keylist[0]
-
-    EPSCoreDict: dict = EPSbigDict["units"][currencyPerShare]  # normally this is USD/share, but could be CAD/share etc
-    # search for the newest reported full year EPS in SEC. Search from bottom of file backwards (i.e. search from
-    # newest entries first) for picking up any amendments following the original filings. Don't know in advance what
-    # the newest year will be it could be this yr or this yr -1.
-
-    # Find out what the most recent full year data is. Go to end of file for most recent, search backwards.
-    targetFrameMostRecent: str = ""
-    for i in range(len(EPSCoreDict) - 1, -1, -1):
-        if "frame" in EPSCoreDict[i] and not ("Q" in EPSCoreDict[i]["frame"]):
-            targetFrameMostRecent = EPSCoreDict[i]["frame"]
-            Year[0] = int(EPSCoreDict[i]["end"][0:4])  # first 4 characters
-            EPS[0] = EPSCoreDict[i]["val"]  # EPS newest year
-            seriesEnd = datetime.strptime(EPSCoreDict[i]["end"], "%Y-%m-%d")
-            break  # break out of for i loop once you have a match
-
-    if targetFrameMostRecent == "":
+    currencyPerShare = epsUnits[0]
+
+    # index of the EPS records by frame. normally the unit is USD/share, but could be CAD/share etc
+    EPSIndex: FrameIndex = secFacts.frameIndex("us-gaap", "EarningsPerShareDiluted", currencyPerShare)
+    # the newest reported full year EPS in SEC, taking any amendments following the original filings. Don't know in
+    # advance what the newest year will be it could be this yr or this yr -1.
+    newestRecord = EPSIndex.latestAnnual()
+    if newestRecord is None:
         print(Fore.RED, "No newest year EPS found in SEC data for", stock, " with CIK = ", cikStr)
         print(Fore.BLACK, end="")
-        continue  # move on to next stock
-
-    # print("EPS for ", Year[0], " =  ", EPS[0])
-
-    # --------------------search SEC for most recent full year reported comprehensive net income----------------------
-    # taxonomy (reported item, definition and labelling) for net income changes in SEC over the years
-    # use comprehensive income instead
-    secIncURL = "https://data.sec.gov/api/xbrl/companyconcept/CIK" + \
-                cikStr + "/us-gaap/ComprehensiveIncomeNetOfTax.json"
-
-    IncBigDict: dict = get_sec_json(secIncURL)[1]   # returns json.loads(r.text) with r.text a string as dictionary
-    # format is
-    # {"cik": ... ,"units":{"USD:[{"start":"2006-10-01","end":"2007-09-29","val":3.93, ....
-
-    if IncBigDict == {}:
-        print(Fore.RED, "No SEC comprehensive net income entry for ", stock, " with CIK = ", cikStr)
-        pdResults.loc[stock, "Warnings if any"] = "Comprehensive net income not found in SEC."
+        return  # move on to next stock
+
+    targetFrameMostRecent: str = newestRecord["frame"]
+    # the year of the frame, not of the end date: a fiscal year ending in January 2022 is the SEC's frame CY2021
+    Year[0] = FactColumns.frameCode(targetFrameMostRecent) // 100
+
+    # --------------------search SEC for most recent full year reported comprehensive net income--------------------
+    # taxonomy (reported item, definition and labelling) for net income changes in SEC over the years. Use
+    # comprehensive income, or for the years where it isn't reported the next concept in netIncomeConcepts,
+    # as resolved by the fetch stage from the same download
+    resolution: dict = fetched["netIncome"]
+    if resolution["unit"] == "":
+        print(Fore.RED, "No SEC comprehensive net income or fallback net income entry for ", stock, " with CIK = ",
+              cikStr)
+        results[stock].warn("Comprehensive net income not found in SEC.")
         print(Fore.BLACK, end="")
-        continue  # move on to next stock
+        return  # move on to next stock
 
-    # find out which currency is being used
-    keylist = list(IncBigDict["units"].keys())
-    currency = keylist[0]
-    pdResults.loc[stock, "Currency"] = currency
+    # the currency is the unit of the resolved concepts
+    currency = resolution["unit"]
+    results[stock].currency = currency
     # print("Currency is ", currency)
 
-    IncCoreDict: dict = IncBigDict["units"][currency]
+    IncIndex: FrameIndex = stitchedIndex(secFacts, netIncomeConcepts, resolution)
     # look for comprehensive net income with frame containing CY targetyearmosrecent
-    lookUP1: list = dictsearch(IncCoreDict, "frame", targetFrameMostRecent, "val", "comprehensive net income")
-    if lookUP1[2]:  # if errorflag returned by dictsearch = True dictsearch failed, possibly no value found
-        continue    # move on to next stock
+    lookUP1 = framesearch(IncIndex, targetFrameMostRecent, "comprehensive net income", stock)
+    if lookUP1 is None:  # framesearch failed, no value found
+        return  # move on to next stock
+    results[stock].incomeConcept = lookUP1["concept"]
 
-    NetIncome[0] = lookUP1[1]
-
-    # ----------Search SEC for a full year EPS report that is yrshistory (usually 10) years older than the above-------
+    # ------the whole annual EPS and comprehensive net income series from yrsHistory (usually 10) years before the
+    # newest year to the newest year. Element j of each series is year Year[1] + j, nan where it isn't in the SEC.
     Year[1] = Year[0] - yrsHistory  # looking for 10 years history (typically) prior to newest year
-    targetFrameOld = "CY" + str(Year[1])
-    lookUP2: list = dictsearch(EPSCoreDict, "frame", targetFrameOld, "val", "EPS unadjusted for subsequent splits")
-    
-    if lookUP2[2]:  # if errorflag returned by dictsearch = True dictsearch failed, possibly no value found
-        continue    # move on to next stock
-    
-    i = lookUP2[0]
-    EPS[1] = EPSCoreDict[i]["val"]  # EPS for 10 yrs (or whatever) ago
-    seriesStart = datetime.strptime(EPSCoreDict[i]["end"], "%Y-%m-%d")
-
-    # --------------look up stock splits in interval between history seriesStart and seriesEnd------------------------
-    # load url for split history as dict
-    splitBigDict = get_jsonparsed_data(urlSplitHistory)
-    # form of bigDict is
-    # { "symbol": "AAPL", "historical": [{
-    #        "date": "2020-08-31", ...
-
-    if splitBigDict != {}:
-        splitDict = splitBigDict["historical"]
-        # get number of dictionary entries and loop through them
-        for i in range(0, len(splitDict)):
-            splitDate: datetime = datetime.strptime(splitDict[i]["date"], "%Y-%m-%d")
-            if seriesEnd > splitDate > seriesStart:
-                splitNumerator = splitNumerator * strToFloat(splitDict[i]["numerator"])
-                splitDenominator = splitDenominator * strToFloat(splitDict[i]["denominator"])
-
-        if splitDenominator == 0 or splitNumerator == 0:
+    epsSeries, endSeries = annualRow(EPSIndex, Year[1], Year[0])
+    incSeries = annualRow(IncIndex, Year[1], Year[0])[0]
+
+    if growthMethod == "cagr":
+        # the two point CAGR needs the EPS and comprehensive net income of the oldest year as well
+        targetFrameOld = "CY" + str(Year[1])
+        if framesearch(EPSIndex, targetFrameOld, "EPS unadjusted for subsequent splits", stock) is None:
+            return  # move on to next stock
+        if framesearch(IncIndex, targetFrameOld, " comprehensive net income ", stock) is None:
+            return  # move on to next stock
+
+    # ------------stock splits, parsed by the fetch stage. The EPS are adjusted for them after the loop------------
+    gathered["splits"].append(fetched["splits"])
+    gathered["stocks"].append(stock)
+    gathered["cik"].append(cikStr)
+    gathered["year"].append(Year[0])
+    gathered["eps"].append(epsSeries)
+    gathered["inc"].append(incSeries)
+    gathered["ends"].append(endSeries)
+    gathered["newestEnd"].append(newestRecord["end"][0:10])
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# the annual history gathered in the per-stock loop for a batch of stocks, one list element per stock. "splits" holds
+# the [dates, ratios] of each stock's split history.
+def newGathered():
+    return {"stocks": [], "cik": [], "year": [], "eps": [], "inc": [], "ends": [], "newestEnd": [], "splits": []}
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# value a batch of gathered stocks: split adjust, growth, checks, NPV, IRR and breakeven growth, all stocks of the
+# batch at once. Prints as it goes and fills in the stocks' results.
+def valueGathered(gathered):
+    # inputs to the breakeven growth solver, collected for every stock that gets that far
+    solverStocks: list = []
+    solverPrice: list = []
+    solverEPS: list = []
+    solverHistGr: list = []
+
+    # ------------split adjust the EPS series of all stocks and calculate their growth in one pass----------------------
+    nSeriesYears = yrsHistory + 1
+    epsMatrix = np.array(gathered["eps"]).reshape(-1, nSeriesYears)
+    incMatrix = np.array(gathered["inc"]).reshape(-1, nSeriesYears)
+    endMatrix = np.array(gathered["ends"], dtype="datetime64[D]").reshape(-1, nSeriesYears)
+    # the splits after each year's end and before the newest year's end, for every stock and year in one lookup
+    newestEnds = np.array(gathered["newestEnd"], dtype="datetime64[D]")
+    splitMatrix = SplitIndex(gathered["splits"]).factors(np.arange(len(newestEnds))[:, None], endMatrix,
+                                                         newestEnds[:, None])
+    epsAdjMatrix = epsMatrix / splitMatrix
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharesMatrix = incMatrix / epsAdjMatrix
+    epsStats = growthStats(epsAdjMatrix)
+    incStats = growthStats(incMatrix)
+    sharesStats = growthStats(sharesMatrix)
+
+    # ------------------------------------check and print the history of each stock------------------------------------
+    for k in range(len(gathered["stocks"])):
+        stock = gathered["stocks"][k]
+        cikStr = gathered["cik"][k]
+        Year = [gathered["year"][k], gathered["year"][k] - yrsHistory]
+        EPS = [epsAdjMatrix[k, -1], epsAdjMatrix[k, 0]]  # newest, oldest (adjusted for subsequent splits)
+        NetIncome = [incMatrix[k, -1], incMatrix[k, 0]]
+        SharesOut = [sharesMatrix[k, -1], sharesMatrix[k, 0]]
+
+        print("")
+        print("Ticker = " + stock)
+        if np.isnan(splitMatrix[k]).any():  # a split with a zero numerator or denominator in the history period
             print(Fore.RED, "Error in split adj. calculation for ", stock, " CIK ", cikStr)
             print(Fore.BLACK, end="")
-            pdResults.loc[stock, "Warnings if any"] = "Error in split adjustment calculation."
+            results[stock].warn("Error in split adjustment calculation.")
             continue  # move on to next stock
 
-        splitMultiplier: float = splitNumerator/splitDenominator
-        print("Cumulative stock splits between ", Year[1], " and ", Year[0], "= ", str(splitMultiplier))
-        EPS[1] = EPS[1] / splitMultiplier
-        # print("EPS in ", Year[1], " adjusted for subsequent splits throught to ", Year[0], " is ", EPS[1])
-
-    # --------------look for the yrshistory (usually 10) years prior for comprehensive net income---------------------
-    lookUP3: list = dictsearch(IncCoreDict, "frame", targetFrameOld, "val", " comprehensive net income ")
-    if lookUP3[2]:  # dictsearch returns errorflag because fails to find value, move on to next stock
-        continue
-   
-    j = lookUP3[0]
-    NetIncome[1] = IncCoreDict[j]["val"]  # EPS for 10 yrs (or whatever) ago
-
-    # print years
-    print("..................................Newest Year................Oldest year")
-    print("                                     " + str(Year[0]) + "                       " + str(Year[1]))
-
-    # check newest year data
-    if EPS[0] < 0:
-        print(Fore.RED, "EPS is negative in most recent history in SEC for ",
-              stock, " CIK ", cikStr)
-        print(Fore.BLACK, end="")
-        pdResults.loc[stock, "Warnings if any"] = "EPS is negative in SEC for most recent history year."
-        continue
-
-    # if either old or new EPS is non-positive print warning and advance to next stock in stocklist
-    if (EPS[0] <= 0) or (EPS[1] <= 0):
-        print(Fore.RED, "Oldest or newest comprehensive net income, or both, were non-positive for ", stock,
-              " CIK ", cikStr)
-        pdResults.loc[stock, "Warnings if any"] = "Oldest or newest EPS was non-positive."
-        continue
-
-    # from here on both old and new EPS are positive
-    # calculate % compound annual growth rate from oldest year to newest year
-    SharesOut[0] = NetIncome[0] / EPS[0]
-    SharesOut[1] = NetIncome[1] / EPS[1]
-
-    if SharesOut[0] < 1 or SharesOut[1] < 1:
-        print(Fore.RED, "Shares outstanding estimation has resulted in negative shares.")
-        print(Fore.BLACK, end="")
-        pdResults.loc[stock, "Warnings if any"] = "Estimate of shares outstanding is negative."
-        continue  # move on to next stock.
-
-    Sharesgr: float = (SharesOut[0] / SharesOut[1]) ** (1 / (Year[0] - Year[1])) * 100 - 100
-    NIgr: float = (NetIncome[0] / NetIncome[1]) ** (1 / (Year[0] - Year[1])) * 100 - 100
-    EPSgr: float = (EPS[0] / EPS[1]) ** (1 / (Year[0] - Year[1])) * 100 - 100
-    pdResults.loc[stock,
-                  ["Newest yr history", "Oldest yr history", "EPS newest", "Comprehensive Net Income gr % pa",
-                   "EPS gr % pa", "Shares out-standing", "Share gr % pa"]] = \
-        [Year[0], Year[1], EPS[0], NIgr, EPSgr, SharesOut[0], Sharesgr]
-
-    # print new and old values and growth for comprehensive net income, EPS (diluted) and shares outstanding
-    print("comprehensive net income ", "${:19,.0f}".format(NetIncome[0]), "    ", "${:19,.0f}".format(NetIncome[1]),
-          "    CAGR = ", "{:6.1f}%".format(NIgr))
-    print("Dil. EPS adj for spl     ", "${:19,.2f}".format(EPS[0]), "    ", "${:19,.2f}".format(EPS[1]),
-          "    CAGR = ", "{:6.1f}%".format(EPSgr))
-    print("Shares                    ", "{:19,.0f}".format(SharesOut[0]), "     ", "{:19,.0f}".format(SharesOut[1]),
-          "    CAGR = ", "{:6.1f}%".format(Sharesgr))
-    print(Fore.BLACK, end="")  # resets printing to black, in case previous was red. no line feed
-
-    if EPSgr < 0:
-        print(Fore.RED, "EPS growth during past 5 years was negative.")
+        if splitMatrix[k, 0] != 1.0:
+            print("Cumulative stock splits between ", Year[1], " and ", Year[0], "= ", str(splitMatrix[k, 0]))
+
+        # print years
+        print("..................................Newest Year................Oldest year")
+        print("                                     " + str(Year[0]) + "                       " + str(Year[1]))
+
+        # check newest year data. NaN would slip through every comparison below
+        if not (np.isfinite(EPS[0]) and np.isfinite(SharesOut[0])):
+            print(Fore.RED, "Newest year EPS or comprehensive net income missing in SEC for ", stock, " CIK ", cikStr)
+            print(Fore.BLACK, end="")
+            results[stock].warn("EPS or comprehensive net income missing in SEC for most recent history year.")
+            continue
+
+        if EPS[0] < 0:
+            print(Fore.RED, "EPS is negative in most recent history in SEC for ",
+                  stock, " CIK ", cikStr)
+            print(Fore.BLACK, end="")
+            results[stock].warn("EPS is negative in SEC for most recent history year.")
+            continue
+
+        # if either old or new EPS is non-positive print warning and advance to next stock in stocklist
+        if growthMethod == "cagr" and ((EPS[0] <= 0) or (EPS[1] <= 0)):
+            print(Fore.RED, "Oldest or newest comprehensive net income, or both, were non-positive for ", stock,
+                  " CIK ", cikStr)
+            results[stock].warn("Oldest or newest EPS was non-positive.")
+            continue
+
+        if growthMethod == "regression" and ((EPS[0] <= 0) or (epsStats["points"][k] < minRegressionYears)):
+            print(Fore.RED, "Newest EPS non-positive or fewer than ", minRegressionYears,
+                  " years with positive EPS for ", stock, " CIK ", cikStr)
+            print(Fore.BLACK, end="")
+            results[stock].warn("Too few years of positive EPS for the regression growth.")
+            continue
+
+        # from here on the EPS the growth is based on are positive
+        if SharesOut[0] < 1 or SharesOut[1] < 1:
+            print(Fore.RED, "Shares outstanding estimation has resulted in negative shares.")
+            print(Fore.BLACK, end="")
+            results[stock].warn("Estimate of shares outstanding is negative.")
+            continue  # move on to next stock.
+
+        # % compound annual growth rate from oldest year to newest year, and the regression growth over all years
+        Sharesgr: float = sharesStats["cagr %"][k]
+        NIgr: float = incStats["cagr %"][k]
+        EPScagr: float = epsStats["cagr %"][k]
+        EPSregr: float = epsStats["regression %"][k]
+        EPSgr: float = EPScagr if growthMethod == "cagr" else EPSregr
+        result: StockResult = results[stock]
+        result.newestYear, result.oldestYear = Year[0], Year[1]
+        result.epsNewest, result.sharesOut = EPS[0], SharesOut[0]
+        result.incomeGr, result.epsGr, result.epsCagr, result.sharesGr = NIgr, EPSgr, EPScagr, Sharesgr
+        result.epsRegrGr, result.epsRegrErr, result.epsRegrYears = EPSregr, epsStats["std err %"][k], \
+            epsStats["points"][k]
+        result.epsYoyStd = epsStats["yoy std %"][k]
+
+        # print new and old values and growth for comprehensive net income, EPS (diluted) and shares outstanding
+        print("comprehensive net income ", "${:19,.0f}".format(NetIncome[0]), "    ", "${:19,.0f}".format(NetIncome[1]),
+              "    CAGR = ", "{:6.1f}%".format(NIgr))
+        print("Dil. EPS adj for spl     ", "${:19,.2f}".format(EPS[0]), "    ", "${:19,.2f}".format(EPS[1]),
+              "    CAGR = ", "{:6.1f}%".format(EPScagr))
+        print("Shares                    ", "{:19,.0f}".format(SharesOut[0]), "     ", "{:19,.0f}".format(SharesOut[1]),
+              "    CAGR = ", "{:6.1f}%".format(Sharesgr))
+        print("Dil. EPS regression growth over ", epsStats["points"][k], " yrs = ", "{:6.1f}%".format(EPSregr),
+              " +/- ", "{:4.1f}%".format(epsStats["std err %"][k]), " (std err)")
         print(Fore.BLACK, end="")  # resets printing to black, in case previous was red. no line feed
-        pdResults.loc[stock, "Warnings if any"] = "EPS growth during past 5 years was negative."
-        continue  # advance to next stock analysis
-
-    # look up current stock price if income is positive in both oldest and newest year.
-    quoteRet = get_jsonparsed_data(urlSharePrice)
-    if len(quoteRet) == 0:
-        print("no shareprice found for ", stock)
-        pdResults[stock, "Warnings if any"] = "No share price found"
-        continue
-
-    quoteDic = dict(quoteRet[0])
-    if quoteDic == {}:
-        print("no shareprice found for ", stock)
-        pdResults[stock, "Warnings if any"] = "No share price found"
-        continue
-
-    shPrice: float = float(quoteDic["price"])
-    # estimate market cap
-    mktCap: float = shPrice * SharesOut[0]
-    print("price = ", "${:6.2f}".format(shPrice), "and est. market cap = ", "${:,.2f}".format(mktCap))
-    pdResults.loc[stock, ["Price", "Mkt Cap"]] = [shPrice, mktCap]
-    # form is ticker, price, volume
-
-    if mktCap < minMarketCap:
-        print(Fore.RED, "market cap is less than $ ", minMarketCap, " for ", stock)
-        print(Fore.BLACK, end="")
-        pdResults[stock, "Warnings if any"] = "Market cap is less than $1 Billion."
-        continue  # continue with next stock in list
-
-    # project out EPS and share buyer's cashflow for yrsDiscted number of  years
-    # after purchase year using the EPS CAGR history
-    epsProj = np.zeros(yrsDiscted + 1)
-    cashflProj = np.zeros(yrsDiscted + 1)
-    epsProj[0] = 0  # conservative assumption, buy shares late in year, no earnings this year
-    epsProj[1] = EPS[0] * (1 + EPSgr / 100)  # next years eps is this year times growth
-    for count in range(2, yrsDiscted + 1):  # from 2 to 20 or whatever yrsDiscted is
-        epsProj[count] = epsProj[count - 1] * (1 + EPSgr / 100)  # grow by EPSgr every year
-
-    # share purchaser's cashflow projection is same as EPS projection except purchase price in year 0
-    cashflProj = copy.deepcopy(epsProj)  # the two items are independent after copying
-    cashflProj[0] = -shPrice
-
-    epsNPV = npf.npv(disctFactor, epsProj)
-    shareIRR = npf.irr(cashflProj)
-    print("npv of eps projected out ", yrsDiscted, " years from next yr at gr ", "{:3.1f}%".format(EPSgr),
-          " and discounted at ", "{:3.1%}".format(disctFactor), " = ", "${:6.2f}".format(epsNPV))
-    print("irr of share purchase with these EPSs and current share price = ", "{:4.2%}".format(shareIRR))
-    pdResults.loc[stock, ["NPV of Future EPS", "Disct rate %", "Yrs discounted after purchase", "IRR %"]] = \
-        [epsNPV, disctFactor * 100, yrsDiscted, shareIRR * 100]  # as percents
-
-    # find iteratively the min growth needed for an NPV on buyer's cashflow breakeven with the given disct rate
-    # iteration will use up to 20 steps, so put into a pdframe of 20 cols by 23 rows
-    # the rows will be the purchase price, EPS growth values for the next yrsDiscted years, the trial growth on EPS,
-    # the NPV at the given disct rate, and finally the slope (npv2-npv1)/(trial growth2-trial growth1)
-    # i.e. slope this col vs. last col
-    dfColumns: int = list(range(0, 20))
-    dfRows = ["purchase price"] + list(range(1, yrsDiscted + 1)) + ["trial growth", "trial npv", "slope"]
-    dfIterate = pd.DataFrame(columns=dfColumns, index=dfRows)
-    dfIterate.iloc[:, :] = 0  # initialize to zero each time for new stock in stock list
-
-    # for every col (iteration) the purchase price is the same
-    dfIterate.loc["purchase price", :] = -shPrice
-
-    # 1st column of dfIterate is cashflow as previously calculated, EPSgr, and epsNPV as prev calc
-    for row in range(0, yrsDiscted + 1):  # stops at yrsDiscted
-        dfIterate.iloc[row, 0] = cashflProj[row]
-    dfIterate.loc["trial growth", 0] = EPSgr
-    dfIterate.loc["trial npv", 0] = epsNPV
-
-    # for 2nd iteration, stored in col 1, use 0.2 times the growth rate of col 0 to project EPS out
-    # yrsDisct years beyond the initial purchase year
-    dfIterate.loc['trial growth', 1] = EPSgr * 0.2
-    dfIterate.loc[1, 1] = EPS[0] * (1 + .2 * EPSgr / 100)  # EPS in 1st yr after share purchase
-    for row in range(2, yrsDiscted + 1):  # stops in yrsDiscted
-        dfIterate.loc[row, 1] = dfIterate.loc[row - 1, 1] * (1 + 0.2 * EPSgr / 100)
-
-    # note +1 in iloc endpoint below, because endpoint is excluded
-    dfIterate.loc["trial npv", 1] = npf.npv(disctFactor, dfIterate.iloc[0:yrsDiscted + 1, 1])
-    # calc slope for col 2
-    fname = "min req grwth fail for " + stock + ".csv"  # print iterations here in case of failure
-    if (dfIterate.loc["trial growth", 1] - dfIterate.loc["trial growth", 0]) != 0:
-        dfIterate.loc["slope", 1] = (dfIterate.loc["trial npv", 1] - dfIterate.loc["trial npv", 0]) / \
-                                    (dfIterate.loc["trial growth", 1] - dfIterate.loc["trial growth", 0])
-    else:
-        print("Slope denom. = 0. required growth not found for stock", stock)
-        pdResults.loc[stock, "Warnings if any"] = "Required growth not found. Slope denom. = 0"
-        dfIterate.to_csv(fname)
-        break  # on 0 slope go to next stock
-
-    if dfIterate.loc["slope", 1] == 0:
-        print("Slope = 0. Required growth not found for stock", stock)
-        pdResults.loc[stock, "Warnings if any"] = "Required growth not found. Slope = 0"
-        dfIterate.to_csv(fname)
-        break  # min. growth not found, go to next stock
-
-    # with the first two cols in place can iterate to find the required growth for npv to be 0 - breakeven
-    # growth
-    for col in range(2, 20):  # iterate cols 2 to 19
-        if dfIterate.loc["slope", col - 1] == 0:
-            print("Minimum required growth could not be found for ", stock)
-            pdResults.loc[stock, "Warnings if any"] = "Required growth not found. Prev slope = 0"
-            dfIterate.to_csv(fname)
-            # print(dfIterate)
-            break  # min. growth not found, go to next stock
-
-        dfIterate.loc["trial growth", col] = \
-            dfIterate.loc["trial growth", col - 1] - dfIterate.loc["trial npv", col - 1] / dfIterate.loc[
-                "slope", col - 1]
-        dfIterate.loc[1, col] = EPS[0] * \
-                                (1 + dfIterate.loc["trial growth", col] / 100)  # 1st yr of earnings after purchase
-
-        for row in range(2, yrsDiscted + 1):
-            dfIterate.iloc[row, col] = dfIterate.iloc[row - 1, col] * \
-                                       (1 + dfIterate.loc["trial growth", col] / 100)  # all other earning yrs
-
-        # take the npv of the cashflow at the trial growth, note +1 in iloc because endpoint is excluded
-        dfIterate.loc["trial npv", col] = npf.npv(disctFactor, dfIterate.iloc[0:yrsDiscted + 1, col])
-        # calc new slope
-        if (dfIterate.loc["trial growth", col] - dfIterate.loc["trial growth", col - 1]) == 0:
-            print("Slope = 0. Minimum required growth could not be found for ", stock)
-            pdResults.loc[stock, "Warnings if any"] = "Required growth not found. Slope = 0"
-            dfIterate.to_csv(fname)
-            # print(dfIterate)
-            break  # slope not found, go to next stock
-
-        dfIterate.loc["slope", col] = \
-            (dfIterate.loc["trial npv", col] - dfIterate.loc["trial npv", col - 1]) / \
-            (dfIterate.loc["trial growth", col] - dfIterate.loc["trial growth", col - 1])
-
-        if (abs(dfIterate.loc["trial npv", col]) < 0.01) and (col <= 19):  # iteration has come to a successful end
-            # dfIterate.to_csv(fname)
-            if dfIterate.loc["trial growth", col] <= EPSgr:
+
+        if not np.isfinite(EPSgr):
+            print(Fore.RED, "EPS growth could not be calculated for ", stock)
+            print(Fore.BLACK, end="")
+            results[stock].warn("EPS growth could not be calculated.")
+            continue  # advance to next stock analysis
+
+        if EPSgr < 0:
+            print(Fore.RED, "EPS growth during past 5 years was negative.")
+            print(Fore.BLACK, end="")  # resets printing to black, in case previous was red. no line feed
+            results[stock].warn("EPS growth during past 5 years was negative.")
+            continue  # advance to next stock analysis
+
+        # current stock price, from the fetch stage
+        if stock not in quotePrices:
+            print("no shareprice found for ", stock)
+            results[stock].warn("No share price found")
+            continue
+
+        shPrice: float = quotePrices[stock]
+        # estimate market cap
+        mktCap: float = shPrice * SharesOut[0]
+        print("price = ", "${:6.2f}".format(shPrice), "and est. market cap = ", "${:,.2f}".format(mktCap))
+        result.price, result.mktCap = shPrice, mktCap
+
+        if mktCap < minMarketCap:
+            print(Fore.RED, "market cap is less than $ ", minMarketCap, " for ", stock)
+            print(Fore.BLACK, end="")
+            results[stock].warn("Market cap is less than $1 Billion.")
+            continue  # continue with next stock in list
+
+        # the NPV, IRR and min growth needed for an NPV on buyer's cashflow breakeven are calculated for all stocks at
+        # once, after the loop
+        solverStocks.append(stock)
+        solverPrice.append(shPrice)
+        solverEPS.append(EPS[0])
+        solverHistGr.append(EPSgr)
+
+    # ------------------find the min growth needed for an NPV on buyer's cashflow breakeven with the given disct rate---
+    # one batched call each for every stock of the batch that made it through the checks above
+    # project out EPS and share buyer's cashflow for yrsDiscted number of years after purchase year using the EPS
+    # CAGR history. conservative assumption, buy shares late in year, no earnings this year
+    cashflProj = projectCashflows(solverPrice, solverEPS, solverHistGr, yrsDiscted)
+    epsNPV = npvGeometric(np.array(solverEPS), np.array(solverHistGr), disctFactor, yrsDiscted)
+    shareIRR = batchIRR(cashflProj)
+    reqGrowth, solverStatus, solverIter, solverResidual = \
+        breakevenGrowth(np.array(solverPrice), np.array(solverEPS), disctFactor, yrsDiscted)
+    for k in range(len(solverStocks)):
+        stock = solverStocks[k]
+        metrics.observe("solver_iterations", solverIter[k], ticker=stock)
+        metrics.count("solver_results_total", ticker=stock, status=solverStatusNames[solverStatus[k]])
+        print("")
+        print(stock, ": npv of eps projected out ", yrsDiscted, " years from next yr at gr ",
+              "{:3.1f}%".format(solverHistGr[k]), " and discounted at ", "{:3.1%}".format(disctFactor), " = ",
+              "${:6.2f}".format(epsNPV[k]))
+        print("irr of share purchase with these EPSs and current share price = ", "{:4.2%}".format(shareIRR[k]))
+        result: StockResult = results[stock]
+        result.npv, result.disctRate, result.yrsDiscted, result.irr = \
+            epsNPV[k], disctFactor * 100, yrsDiscted, shareIRR[k] * 100  # as percents
+
+        if solverStatus[k] == SOLVER_OK:
+            if reqGrowth[k] <= solverHistGr[k]:
                 print(Fore.GREEN, end="")
             else:
                 print(Fore.RED, end="")
-            print("The min. required EPS growth for breakeven is    ",
-                  "{:4.1f}".format(dfIterate.loc["trial growth", col]),
+            print(stock, ": the min. required EPS growth for breakeven is    ", "{:4.1f}".format(reqGrowth[k]),
                   "% at a dsct rate of ", "{:4.1f}".format(100 * disctFactor), " %")
-            print("The actual ", yrsHistory, " year historical comp ann EPS grwth = ", "{:4.1f}".format(EPSgr), "%")
+            print("The actual ", yrsHistory, " year historical comp ann EPS grwth = ",
+                  "{:4.1f}".format(solverHistGr[k]), "%")
             print(Fore.BLACK, end="")  # reset print to black
-            pdResults.loc[stock, "Req gr % pa for NPV break-even"] = dfIterate.loc["trial growth", col]
-            break  # no need to iterate further.
+            result.reqGr = reqGrowth[k]
+        else:
+            print("Minimum required EPS growth not found for ", stock)
+            results[stock].warn(solverStatusText[solverStatus[k]])
+            # keep the solver's end state for inspection, it goes to the solver failures file with the report
+            result.solver = {"price": float(solverPrice[k]), "EPS newest": float(solverEPS[k]),
+                             "disct rate": disctFactor, "yrs discounted": yrsDiscted, "status": int(solverStatus[k]),
+                             "status text": solverStatusText[solverStatus[k]], "iterations": int(solverIter[k]),
+                             "npv less price at last trial": float(solverResidual[k])}
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# value a batch of stocks from the per-stock loop, append their finished results to the journal and let go of them
+def valueBatch(batchStocks, gathered):
+    startTime = time.perf_counter()
+    valueGathered(gathered)
+    metrics.observe("stage_seconds", time.perf_counter() - startTime, stage="valuation")
+    startTime = time.perf_counter()
+    journal.append([[stock, results.pop(stock).row()] for stock in batchStocks])
+    metrics.observe("stage_seconds", time.perf_counter() - startTime, stage="journal")
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# fetch and value a list of stocks into the journal journalFileName, a batch of journalEvery stocks at a time. With
+# resume, the stocks already in a journal of the same stocks and parameters are skipped.
+def valueStocks(stocks, journalFileName, resume):
+    global results, journal, quotePrices
+
+    # the results of each stock in progress, as a StockResult per ticker, until its batch goes to the journal
+    results = {}
+
+    # finished stocks go to the journal a batch at a time. A resumed run only fetches the stocks not in it yet
+    journal = ResultJournal(journalFileName, {"stocks": stocks, "disctFactor": disctFactor, "yrsDiscted": yrsDiscted,
+                                              "yrsHistory": yrsHistory, "growthMethod": growthMethod,
+                                              "netIncomeConcepts": netIncomeConcepts}, resume)
+    fetchList = [stock for stock in stocks if stock not in journal.done]
+    if len(fetchList) < len(stocks):
+        print("Resuming: ", len(stocks) - len(fetchList), " stocks already valued in the journal ", journalFileName)
+
+    # the share prices of all stocks still to value in a few batched requests
+    stageStart = time.perf_counter()
+    quotePrices = fetchQuotes(fetchList, quoteChunkSize)
+    metrics.observe("stage_seconds", time.perf_counter() - stageStart, stage="quotes")
+
+    # annual history of every stock of the current batch that has one, gathered in the per-stock loop
+    gathered = newGathered()
+    batchStocks = []
+
+    # --------------------------------------------loop through each stock--------------------------------------------
+    for stock, fetched in fetchPipeline(fetchList, fetchInFlight):
+        # every journalEvery stocks, value the batch so far and put it in the journal
+        if len(batchStocks) >= journalEvery:
+            valueBatch(batchStocks, gathered)
+            gathered = newGathered()
+            batchStocks = []
+        batchStocks.append(stock)
+        results[stock] = StockResult()
+
+        gatherStock(stock, fetched, gathered)
+
+    # value the last batch
+    valueBatch(batchStocks, gathered)
+    journal.close()
+
+
+# --------------------------------------------------------------------------------------------------------------------
+class WarmCache:
+    """
+    In-memory cache of values that are slow to load, for the valuation service. An entry expires ttl seconds after it
+    was loaded, and expired entries are dropped as new ones come in. A thread asking for a key that another thread is
+    already loading waits for that load instead of repeating it, so concurrent requests for the same filer cost one
+    fetch.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}  # key -> [value, time loaded]
+        self.loading = {}  # key -> threading.Event, set when the load has finished
+        self.lastSweep = time.monotonic()
+
+    # the value for key, loaded with load(key) if it isn't cached or has expired. A loaded value for which keep(value)
+    # is False, e.g. a failed download, is handed back but not cached. Returns [value, True if it came from the cache]
+    def get(self, key, load, keep=lambda value: True):
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                    return [entry[0], True]
+                event = self.loading.get(key)
+                if event is None:
+                    event = self.loading[key] = threading.Event()
+                    break
+            event.wait()  # then look again. If that load wasn't kept this thread loads the key itself
+        try:
+            value = load(key)
+            with self.lock:
+                now = time.monotonic()
+                if keep(value):
+                    self.entries[key] = [value, now]
+                if now - self.lastSweep > self.ttl:
+                    self.entries = {key: entry for key, entry in self.entries.items() if now - entry[1] < self.ttl}
+                    self.lastSweep = now
+        finally:
+            with self.lock:
+                del self.loading[key]
+            event.set()
+        return [value, False]
+
+
+# --------------------------------------------------------------------------------------------------------------------
+class ValuationService:
+    """
+    Service mode: values single tickers on request, for other tools to query ad hoc over a local http/json endpoint
+    (see ServiceHandler). The program stays loaded, and the CIK and split history of each ticker, the packed facts of
+    each filer (with their frame indexes) and each ticker's valuation at the current share price are kept warm in
+    WarmCaches, so a repeat query is answered from memory.
+    """
+
+    def __init__(self, factsTTL, quoteTTL):
+        self.ciks = WarmCache(factsTTL)
+        self.facts = WarmCache(factsTTL)  # by CIK, shared by the share classes of a filer
+        self.splits = WarmCache(factsTTL)
+        self.valuations = WarmCache(quoteTTL)  # by ticker, so the share price is at most quoteTTL seconds old
+        self.valueLock = threading.Lock()  # the valuation uses the global results and quotePrices
+
+    # the valuation of a ticker as a dictionary, and True if it came from memory
+    def value(self, stock):
+        return self.valuations.get(stock, self.valueNow, keep=lambda valuation: valuation["fetch error"] == "")
+
+    def valueNow(self, stock):
+        fetched = {"error": "", "cik": "", "facts": None, "netIncome": None, "splits": parseSplits({})}
+        fetched["error"], fetched["cik"] = self.ciks.get(stock, lookupCik, keep=lambda found: found[0] == "")[0]
+        if fetched["error"] == "":
+            fetched.update(self.facts.get(fetched["cik"], fetchFacts, keep=lambda facts: facts["error"] == "")[0])
+        if fetched["error"] == "":
+            fetched["error"], fetched["splits"] = self.splits.get(stock, fetchSplits,
+                                                                  keep=lambda split: split[0] == "")[0]
+        price = fetchQuotes([stock], 1).get(stock) if fetched["error"] == "" else None
+
+        with self.valueLock:
+            results[stock] = StockResult()
+            if price is not None:
+                quotePrices[stock] = price
+            gathered = newGathered()
+            gatherStock(stock, fetched, gathered)
+            valueGathered(gathered)
+            quotePrices.pop(stock, None)
+            row = results.pop(stock).row()
+        return {"ticker": stock, "valued at": datetime.now().isoformat(), "fetch error": fetched["error"], "row": row}
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# http handler of the valuation service. GET /value/<ticker> answers with the ticker's valuation as json, i.e.
+# {"ticker": ..., "valued at": ..., "fetch error": ..., "row": {column: value, ...}, "cached": ..., "seconds": ...}
+# with the columns of the Excel report. GET /metrics answers with the run metrics in the Prometheus text format.
+class ServiceHandler(BaseHTTPRequestHandler):
+    service = None  # the ValuationService, set before the server starts
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path.startswith("/value/") and len(path) > len("/value/"):
+            startTime = time.perf_counter()
+            valuation, cached = self.service.value(path[len("/value/"):].upper())
+            reply = dict(valuation, cached=cached, seconds=time.perf_counter() - startTime)
+            metrics.observe("service_request_seconds", reply["seconds"], cached=cached)
+            self.respond(200, json.dumps(reply, default=lambda value: value.item()).encode("utf-8"),
+                         "application/json")
+        elif path == "/metrics":
+            self.respond(200, metrics.prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self.respond(404, json.dumps({"error": "Not found. Ask for /value/<ticker> or /metrics."}).encode("utf-8"),
+                         "application/json")
+
+    def respond(self, status, body, contentType):
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # the valuations print their own lines
+        pass
+
+
+# runs the valuation service until it is stopped with Ctrl-C
+def serveValuations(host, port):
+    ServiceHandler.service = ValuationService(serviceFactsTTL, serviceQuoteTTL)
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    print("Valuation service at http://" + host + ":" + str(port) + "/value/<ticker>, stop with Ctrl-C")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
 
-        if (abs(dfIterate.loc["trial npv", col]) >= 0.01) and (col == 19):  # iteration ended unsuccessfully
-            print("Minimum required EPS growth not found.")
-            pdResults.loc[stock, "Warnings if any"] = "Minimum required growth not found after 20th iteration."
-            dfIterate.to_csv(fname)
+# --------------------------------------------------------------------------------------------------------------------
+class ResultJournal:
+    """
+    Append-only journal of finished results, one json line per stock, written to disk as each batch of stocks is
+    valued. A run that crashes, is banned by a rate limit or is stopped with Ctrl-C can be resumed (resumeRun or
+    --resume), skipping the stocks already in the journal, and the final report is read back from it. The first line
+    holds the run parameters; a journal written with other parameters is started afresh instead of resumed.
+    """
 
+    def __init__(self, fileName, runParameters, resume):
+        self.done = set()
+        header = json.dumps({"run": runParameters}) + "\n"
+        resumable = False
+        if resume and os.path.exists(fileName):
+            with open(fileName, "r", encoding="utf-8") as journalFile:
+                resumable = journalFile.readline() == header
+            if resumable:
+                self.done = set(stock for stock, row in self.rows(fileName))
+            else:
+                print(Fore.RED, "The journal ", fileName, " is from a run with other parameters, starting afresh.")
+                print(Fore.BLACK, end="")
+        if resumable:
+            self.file = open(fileName, "a", encoding="utf-8")
+            if self.file.tell() > 0:
+                with open(fileName, "rb") as journalFile:
+                    journalFile.seek(-1, os.SEEK_END)
+                    if journalFile.read(1) != b"\n":  # a line cut short by a crash
+                        self.file.write("\n")
+        else:
+            self.file = open(fileName, "w", encoding="utf-8")
+            self.file.write(header)
+        self.file.flush()
+
+    # rows is a list of [stock, dict of column -> value]. Returns once the rows are on disk.
+    def append(self, rows):
+        for stock, row in rows:
+            self.file.write(json.dumps({"stock": stock, "row": row}, default=lambda value: value.item()) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.done.update(stock for stock, row in rows)
+
+    def close(self):
+        self.file.close()
+
+    # the [stock, row] entries of a journal file, one at a time and in the order written. Lines cut short by a crash
+    # are skipped.
+    @staticmethod
+    def rows(fileName):
+        with open(fileName, "r", encoding="utf-8") as journalFile:
+            for line in journalFile:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if "stock" in entry:
+                    yield [entry["stock"], entry["row"]]
 
-# print(pdResults)
 
-dateTimeObj = datetime.now()
-timestampStr = dateTimeObj.strftime("%d-%b-%Y (%H-%M.%f)")
+# --------------------------------------------------------------------------------------------------------------------
+# sharded runs: the coordinator deals the stocks out to shardCount worker processes, one stock to each in turn. The
+# shards share the response cache and the fundamentals store (sqlite in WAL mode, so all shards must run on the same
+# machine) and, through SharedTokenBucket, one rate budget per data provider. Each shard values its stocks into its
+# own journal, and the coordinator builds the report from all of them.
+
+# the journal (or other file) of one shard, e.g. "sec dcf journal shard 2 of 4.jsonl"
+def shardFileName(fileName, shardNo, shardCount):
+    base, extension = os.path.splitext(fileName)
+    return base + " shard " + str(shardNo + 1) + " of " + str(shardCount) + extension
+
+
+# names runShard sets up afresh in each shard process instead of taking them from the coordinator
+shardOwnNames = {"metrics", "responseCache", "fundamentalsStore", "factsArchive", "secLimiter", "fmpLimiter",
+                 "hostSessions", "hostSessionsLock", "results", "journal", "quotePrices"}
+
+
+# the module's settings as they stand in the coordinator, for the shard processes: the user inputs with any command
+# line flags applied, the ticker map, and whatever an importing script changed (e.g. the benchmark's stand-in urls).
+# A shard process is started afresh and imports the program anew, so it would otherwise only see the defaults.
+def shardSettings():
+    return {name: value for name, value in globals().items()
+            if not name.startswith("_") and name not in shardOwnNames and
+            isinstance(value, (bool, int, float, str, list, tuple, dict))}
+
+
+# runs in each shard process as it starts: take the coordinator's settings (see shardSettings), and requests from its
+# shared rate budget
+def joinRun(settings, secState, fmpState):
+    global secLimiter, fmpLimiter
+    globals().update(settings)
+    secLimiter = SharedTokenBucket(secRequestsPerSec, secState)
+    fmpLimiter = SharedTokenBucket(fmpRequestsPerSec, fmpState)
+
+
+# one shard: value stocks into journalFileName with the shard's own connections to the shared cache and store.
+# Returns the shard's run metrics, as RunMetrics.summary().
+def runShard(stocks, journalFileName, resume):
+    global metrics, responseCache, fundamentalsStore, factsArchive
+    metrics = RunMetrics()
+    responseCache = ResponseCache(cacheDir, cacheMaxBytes, cacheTTL, cacheDefaultTTL, offline=offlineMode)
+    fundamentalsStore = FundamentalsStore(fundamentalsFile, storedConcepts)
+    factsArchive = FactsArchive(companyFactsZip) if companyFactsZip != "" else None
+    valueStocks(stocks, journalFileName, resume)
+    return metrics.summary()
+
+
+# value stocks over shardCount shard processes and merge their metrics into the run's. Returns the list of the shard
+# journal file names. A shard that fails is reported, the others carry on; its finished stocks stay in its journal
+# for a resumed run. The shards are started afresh (spawn) rather than forked, so none of them inherits the
+# coordinator's sqlite connections, http sessions or threads, and each opens its own.
+def runShards(stocks, shardCount, resume):
+    context = multiprocessing.get_context("spawn")
+    rateBudget = [SharedTokenBucket.newState(secRequestsPerSec, context),
+                  SharedTokenBucket.newState(fmpRequestsPerSec, context)]
+    journalFiles = [shardFileName(journalFile, shardNo, shardCount) for shardNo in range(shardCount)]
+    with ProcessPoolExecutor(max_workers=shardCount, mp_context=context, initializer=joinRun,
+                             initargs=[shardSettings()] + rateBudget) as pool:
+        futures = [pool.submit(runShard, stocks[shardNo::shardCount], journalFiles[shardNo], resume)
+                   for shardNo in range(shardCount)]
+        for shardNo, future in enumerate(futures):
+            try:
+                metrics.merge(future.result())
+            except Exception as shardErr:
+                print(Fore.RED, "Shard ", shardNo + 1, " of ", shardCount, " stopped: ", repr(shardErr),
+                      ". Run again with --resume to value the rest of its stocks.")
+                print(Fore.BLACK, end="")
+    return journalFiles
+
 
-fileName: str = "SEC DCF at " + str(disctFactor) + " " + listDescription + " over " + str(yrsDiscted) \
-                + " yrs from " + stockList[0] + " to " + stockList[-1] + " on " + timestampStr + ".xlsx"
-text2 = "Raw data provided by Financial Modeling Prep (see https://financialmodelingprep.com/developer/docs/) " \
-        "and SEC/Edgar (see https://www.sec.gov/edgar/sec-api-documentation). All other data are " \
-        "either user inputs or calculated by program. "
+# --------------------------------------------------------------------------------------------------------------------
+# the report rows of a run, [stock, values in the order of columns], read a stock at a time from the run's journal
+# file(s), including stocks finished in earlier runs. The shards were dealt the stocks in turn, so taking an entry
+# from each shard journal in turn gives back the order of the stock list. On the way, the rows of valued stocks are
+# kept in the fundamentals store for later price refreshes, the columns named in valuedInputs (a dictionary of
+# column -> list) of the valued stocks are appended to those lists, and the solver's end state of each stock it
+# failed on goes into solverFailures (stock -> dict). Nothing else is kept, so the whole table is never in memory.
+def journalReport(journalFiles, columns, valuedInputs, solverFailures):
+    # a shard that failed at the start has no journal
+    journals = [ResultJournal.rows(fileName) for fileName in journalFiles if os.path.exists(fileName)]
+    valued = []
+    while len(journals) > 0:
+        for journalRows in list(journals):
+            entry = next(journalRows, None)
+            if entry is None:
+                journals.remove(journalRows)
+                continue
+            stock, row = entry
+            if "NPV of Future EPS" in row:
+                valued.append([stock, row])
+                for column, inputs in valuedInputs.items():
+                    inputs.append(stock if column == "Ticker" else row.get(column, np.nan))
+                if len(valued) >= journalEvery:
+                    fundamentalsStore.saveValuations(valued)
+                    valued = []
+            if "Solver diagnostics" in row:
+                solverFailures[stock] = row["Solver diagnostics"]
+            yield [stock, [row.get(column) for column in columns]]
+    fundamentalsStore.saveValuations(valued)
 
-text3 = "The program is for Python programming training only, not for trading or stock advice or any other purpose."
 
-writer = pd.ExcelWriter(fileName, engine="xlsxwriter")
-pdResults.to_excel(writer, startrow=4, startcol=0, sheet_name='NPV etc. results')
-worksheet = writer.sheets['NPV etc. results']
-worksheet.write(0, 0, fileName)
-worksheet.write(1, 0, text2)
-worksheet.write(2, 0, text3)
-writer.save()
-print("The results have been saved to an Excel file named ", fileName,
-      "\nThe file is in the same directory as the program.")
+# --------------------------------------------------------------------------------------------------------------------
+class ReportWriter:
+    """
+    Writes a results table a row at a time to an Excel (.xlsx), csv (.csv or gzipped .csv.gz) or Parquet (.parquet)
+    file, by the file name's extension. The writer holds no more than one row (a row group for Parquet) whatever the
+    number of stocks, so the memory a report takes is that of wherever its rows come from. Excel files are written by
+    xlsxwriter in constant_memory mode, which puts each row on disk as soon as the next one starts.
+    Parquet files are written a row group of parquetRowGroup rows at a time and need pyarrow; without it the writer
+    raises ImportError before creating the file.
+
+    Excel and csv files have the layout of the original Excel report: the header lines (file name, data sources and
+    disclaimer) in the first column, a blank line, the column names and then one row per stock, with the ticker in
+    the first column. A Parquet file keeps the header lines in its metadata, under "header".
+    """
+
+    def __init__(self, fileName, headerLines, indexName, columns, textColumns, sheetName):
+        self.fileName = fileName
+        self.columns = list(columns)
+        self.textColumns = set(textColumns)
+        lowerName = fileName.lower()
+        self.kind = "csv" if lowerName.endswith(".csv") or lowerName.endswith(".csv.gz") else \
+            os.path.splitext(lowerName)[1][1:]
+        if self.kind == "xlsx":
+            self.workbook = xlsxwriter.Workbook(fileName, {"constant_memory": True, "nan_inf_to_errors": True})
+            self.sheet = self.workbook.add_worksheet(sheetName)
+            # bold and boxed column names and tickers, as pandas' to_excel had them
+            self.headFormat = self.workbook.add_format({"bold": True, "border": 1, "align": "center",
+                                                        "valign": "top"})
+            for lineNo, line in enumerate(headerLines):
+                self.sheet.write_string(lineNo, 0, line)
+            self.rowNo = len(headerLines) + 1
+            self.sheet.write_row(self.rowNo, 0, [indexName] + self.columns, self.headFormat)
+        elif self.kind == "csv":
+            if lowerName.endswith(".gz"):
+                self.file = gzip.open(fileName, "wt", encoding="utf-8", newline="")
+            else:
+                self.file = open(fileName, "w", encoding="utf-8", newline="")
+            self.csvWriter = csv.writer(self.file)
+            self.csvWriter.writerows([[line] for line in headerLines] + [[], [indexName] + self.columns])
+        elif self.kind == "parquet":
+            import pyarrow
+            import pyarrow.parquet
+            self.pyarrow = pyarrow
+            self.schema = pyarrow.schema([(indexName or "Ticker", pyarrow.string())] +
+                                         [(column, pyarrow.string() if column in self.textColumns else
+                                           pyarrow.float64()) for column in self.columns],
+                                         metadata={"header": "\n".join(headerLines)})
+            self.parquetWriter = pyarrow.parquet.ParquetWriter(fileName, self.schema)
+            self.pending = []
+        else:
+            raise ValueError("Report files can be .xlsx, .csv, .csv.gz or .parquet, not " + fileName)
+
+    # one row: the ticker (or other index value) and the values in column order. None and NaN leave the cell empty.
+    def write(self, index, values):
+        values = [None if value is None or value != value else (value.item() if isinstance(value, np.generic)
+                                                                else value) for value in values]
+        if self.kind == "xlsx":
+            self.rowNo = self.rowNo + 1
+            self.sheet.write_string(self.rowNo, 0, str(index), self.headFormat)
+            for columnNo, value in enumerate(values):
+                if value is not None:
+                    self.sheet.write(self.rowNo, columnNo + 1, value)
+        elif self.kind == "csv":
+            self.csvWriter.writerow([index] + ["" if value is None else value for value in values])
+        else:
+            self.pending.append([str(index)] + [str(value) if value is not None and column in self.textColumns
+                                                else value for column, value in zip(self.columns, values)])
+            if len(self.pending) >= parquetRowGroup:
+                self.flush()
+
+    # writes the rows waiting for a Parquet row group
+    def flush(self):
+        if len(self.pending) > 0:
+            self.parquetWriter.write_table(self.pyarrow.Table.from_pylist(
+                [dict(zip(self.schema.names, row)) for row in self.pending], schema=self.schema))
+            self.pending = []
+
+    def close(self):
+        if self.kind == "xlsx":
+            self.workbook.close()
+        elif self.kind == "csv":
+            self.file.close()
+        else:
+            self.flush()
+            self.parquetWriter.close()
+
+    # after a failed write: close the file as far as it goes and delete it, so no partial report is left behind
+    def abort(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+        if os.path.exists(self.fileName):
+            os.remove(self.fileName)
+
+
+# the columns of a dataframe that are text in a Parquet file: all but the numeric ones, whether object or string dtype
+def textColumnsOf(table):
+    return [column for column in table.columns if not pd.api.types.is_numeric_dtype(table[column])]
+
+
+# writes a dataframe through a ReportWriter, row by row
+def writeTable(fileName, headerLines, table, sheetName):
+    writer = ReportWriter(fileName, headerLines, table.index.name or "", table.columns, textColumnsOf(table),
+                          sheetName)
+    try:
+        for row in table.itertuples(name=None):
+            writer.write(row[0], row[1:])
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+# saves rows, an iterable of [index, values in column order], as baseName plus the extension of each of the formats
+# (e.g. ["xlsx", "parquet"]), with the header lines on top (see ReportWriter). The rows are read once, each going to
+# every file as it comes, so they can be streamed from disk. A Parquet file becomes a gzipped csv file if pyarrow
+# isn't installed. If a write fails, every file is deleted. Returns the list of file names written.
+def saveRows(baseName, formats, headerLines, indexName, columns, textColumns, sheetName, rows):
+    writers = []
+    try:
+        for fileFormat in formats:
+            fileName = baseName + "." + fileFormat
+            try:
+                if fileName in [writer.fileName for writer in writers]:  # a Parquet file became this already
+                    continue
+                writer = ReportWriter(fileName, [fileName] + headerLines, indexName, columns, textColumns, sheetName)
+            except ImportError:
+                fileName = baseName + ".csv.gz"
+                if fileName in [writer.fileName for writer in writers]:  # "csv.gz" was asked for as well
+                    continue
+                writer = ReportWriter(fileName, [fileName] + headerLines, indexName, columns, textColumns, sheetName)
+            writers.append(writer)
+        for index, values in rows:
+            for writer in writers:
+                writer.write(index, values)
+        for writer in writers:
+            writer.close()
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+    return [writer.fileName for writer in writers]
+
+
+# saves a dataframe through saveRows
+def saveTable(baseName, formats, headerLines, table, sheetName):
+    return saveRows(baseName, formats, headerLines, table.index.name or "", table.columns, textColumnsOf(table),
+                    sheetName, ([row[0], row[1:]] for row in table.itertuples(name=None)))
+
+
+# ---------------------------------------------------------main----------------------------------------------------
+# -----------------------------------------------------user input//////////////////////////////////////////////////
+# access key for financial modeling prep dot com
+
+myApiKey = "<Insert your API key here>"  # <---- insert your API key here
+
+# ticker list and description.
+stockListInput = ['aapl', 'fts', 'wec', 'nvda', 'jpm', 'chd']
+listDescription: str = "test data"
+
+# stocks with market cap < minMarketCap will be ignored
+minMarketCap: float = 1000000000.0
+
+# years of EPS history to look for in SEC/Edgar
+yrsHistory: int = 10
+
+# the historic EPS growth carried forward into the NPV and IRR: "cagr" for the compound annual growth from the oldest
+# to the newest year (both years must be reported), or "regression" for the growth fitted to every year in between,
+# which needs at least minRegressionYears years with a positive EPS. Both are always calculated and shown.
+growthMethod: str = "cagr"
+minRegressionYears: int = 5
+
+# npv discount factor and years of growth after purchase
+disctFactor: float = .06
+yrsDiscted: int = 15
+
+# administrator email address to be provided in any programmed url request header going to SEC Edgar, per their request
+myEmail = "<Insert your admin email here for inclusion in the SEC/Edgar url request header>"  # <---- insert
+
+# responses from the SEC and financial modeling prep are cached on disk, so re-running the same stock list with
+# e.g. a different discount rate doesn't download everything again. The api key is not part of the cache key.
+cacheDir: str = "sec dcf cache"  # folder in the same directory as the program
+cacheMaxBytes: int = 2 * 1024 ** 3  # least recently used responses are dropped beyond this size (2 GB)
+offlineMode: bool = False  # True = use only cached responses and never go to the network
+
+# seconds a cached response stays fresh, by endpoint. The first entry whose text is in the url applies. Stale
+# responses are revalidated with the data provider (ETag/Last-Modified) rather than downloaded again if unchanged.
+cacheTTL: dict = {"companyfacts": 7 * 86400, "companyconcept": 7 * 86400, "company_tickers": 86400,
+                  "income-statement": 30 * 86400, "stock_split": 7 * 86400, "/quote/": 15 * 60}
+cacheDefaultTTL: int = 86400
+
+# request rates allowed by the data providers. The SEC publishes a maximum of 10 requests per second. Set the
+# financial modeling prep rate to your plan's quota (e.g. 300 calls per minute = 5 per second).
+secRequestsPerSec: float = 10.0
+fmpRequestsPerSec: float = 5.0
+# number of stocks being downloaded at the same time, ahead of the stock being valued
+fetchInFlight: int = 16
+# 429 (too many requests) and 5xx responses are retried this many times, after the wait the data provider asks for
+# in its Retry-After header or else an exponential backoff starting at httpBackoff seconds
+httpRetries: int = 4
+httpBackoff: float = 1.0
+httpTimeout: float = 60.0  # seconds without a response before a request is given up (and retried)
+# share prices are requested from financial modeling prep for this many stocks at a time
+quoteChunkSize: int = 100
+
+# a locally downloaded copy of the SEC's nightly bulk archive of all company facts
+# (https://www.sec.gov/Archives/edgar/daily-index/xbrl/companyfacts.zip). If given, the company facts are read from
+# it instead of the SEC api, so fundamentals need no network. With archiveUniverse every ticker whose CIK is in the
+# archive is valued instead of stockListInput. companyTickersFile is an optional local copy of the SEC's
+# company_tickers.json for the ticker -> CIK map.
+companyFactsZip: str = ""
+archiveUniverse: bool = False
+companyTickersFile: str = ""
+
+# each batch of journalEvery valued stocks is appended to the journal file as soon as it is done. With resumeRun (or
+# --resume on the command line) a run picks up where the journal of an interrupted run with the same stock list and
+# parameters left off.
+journalFile: str = "sec dcf journal.jsonl"
+journalEvery: int = 25
+resumeRun: bool = False
+
+# a sharded run splits the stock list over shardCount worker processes (also set by --shards N on the command line).
+# The shards share the cache, the fundamentals store and the request rates above, and each keeps its own journal
+# (journalFile with " shard 1 of 4" etc. added). A single report is built from all of them. Worth it for long stock
+# lists, until the SEC's request rate is the limit.
+shardCount: int = 1
+
+# price refresh mode revalues the stocks in the stock list at today's share prices from the EPS, EPS growth and shares
+# kept in the fundamentals store by the last full run that valued them, without any SEC request, and saves the new
+# figures next to the stored ones. Also switched on by --refresh-prices on the command line.
+priceRefreshMode: bool = False
+
+# service mode keeps the program running as a local http/json service that values single tickers on request, e.g.
+# http://127.0.0.1:8765/value/AAPL, for other tools to query ad hoc. Also switched on by --serve on the command line.
+# Tickers' CIKs and split histories and filers' facts stay in memory for serviceFactsTTL seconds, valuations (and so
+# the share prices in them) for serviceQuoteTTL seconds. Share prices are also subject to the cacheTTL above.
+serviceMode: bool = False
+serviceHost: str = "127.0.0.1"
+servicePort: int = 8765
+serviceFactsTTL: float = 6 * 3600
+serviceQuoteTTL: float = 15 * 60
+
+# screening mode values every SEC filer with a ticker over the calendar years screenNewestYear - yrsHistory to
+# screenNewestYear (0 means last year) from the SEC frames API, a few requests per year for the whole market. The
+# screenShortlist stocks with the best IRR then get a normal run (the drill-down), which replaces stockListInput.
+# With screenShortlist = 0 only the screen is saved.
+screeningMode: bool = False
+screenNewestYear: int = 0
+screenShortlist: int = 20
+
+# net income is taken, year by year, from the first of these concepts a company reports for the year. Companies switch
+# tags over the years (e.g. WEC), and some never report comprehensive income.
+netIncomeConcepts: list = [["us-gaap", "ComprehensiveIncomeNetOfTax"], ["us-gaap", "NetIncomeLoss"],
+                           ["us-gaap", "NetIncomeLossAvailableToCommonStockholdersDiluted"]]
+
+# base urls of the SEC data api, the SEC web site and financial modeling prep. Only changed to run the program against
+# a local stand-in server, see "sec dcf benchmark.py".
+secDataURL: str = "https://data.sec.gov"
+secWebURL: str = "https://www.sec.gov"
+fmpURL: str = "https://financialmodelingprep.com"
+
+# the annual facts of these concepts are kept in a local sqlite file. A company's facts are only downloaded from the
+# SEC again once its SEC submissions show a report filed since the last download.
+fundamentalsFile: str = "sec dcf fundamentals.sqlite"
+storedConcepts: list = [["us-gaap", "EarningsPerShareDiluted"]] + netIncomeConcepts
+
+# timers and counters of the run (request latency and bytes per endpoint, cache hits, rate limiter waits, parse and
+# solver effort, time per stage), saved at the end of the run as a json summary, with per stock figures, and a
+# Prometheus text format file (e.g. for the node exporter's textfile collector). "" leaves a file out.
+metricsJsonFile: str = "sec dcf metrics.json"
+metricsPromFile: str = "sec dcf metrics.prom"
+
+# the results (and the price refresh and screen results) are saved in each of these formats: "xlsx" (Excel), "csv",
+# "csv.gz" (gzipped csv) or "parquet" (needs pyarrow, else gzipped csv). The results are written a row at a time as
+# they are read from the journal, so the table is never held in memory as a whole. Parquet files are written
+# parquetRowGroup rows at a time. The breakeven solver's end state for every stock it failed on goes to one
+# "SEC DCF solver failures" Parquet file.
+reportFormats: list = ["xlsx"]
+parquetRowGroup: int = 10000
+
+# sensitivity mode: in addition to the results at disctFactor and yrsDiscted above, calculate the NPV, IRR and
+# breakeven growth of every stock at every combination of the discount rates, years discounted and growth haircuts
+# below (the haircut is the fraction taken off the historic EPS growth). Saved as one long format table in a Parquet
+# file (or a compressed csv if no Parquet engine such as pyarrow is installed).
+sensitivityMode: bool = False
+sensDisctRates: list = [0.04, 0.05, 0.06, 0.07, 0.08, 0.10]
+sensYrsDiscted: list = [5, 10, 15, 20, 25]
+sensGrowthHaircuts: list = [0.0, 0.25, 0.5]
+
+# Monte Carlo mode: in addition to the valuation at the historic EPS growth, value every valued stock over mcPaths
+# simulated EPS paths of yrsDiscted years. Each year's EPS growth is drawn at random around the stock's EPS growth
+# (EPS gr % pa) with the spread of its own year over year EPS growth history (EPS yoy gr std dev %). Gives NPV and IRR
+# percentiles and the probability that the NPV exceeds the share price, saved like the sensitivity results. The
+# stocks are spread over mcWorkers processes, each simulating as many stocks at a time as fit in mcMemoryMB.
+monteCarloMode: bool = False
+mcPaths: int = 20000
+mcWorkers: int = 4
+mcMemoryMB: float = 256
+mcSeed: int = 2023
+
+# the program itself only runs when started as a script. Other scripts (e.g. the benchmark) can import its functions.
+if __name__ == "__main__":
+    # ----------------------------------------------------check and cleanse user input----------------------------------
+
+    if myApiKey == "<Insert your API key here>" and not offlineMode:
+        print("Error. You must obtain a valid API key from financialmodelingprep.com "
+              "and insert it into the code input section. The program will end.")
+        sys.exit()
+
+    if myEmail == "<Insert your admin email here for inclusion in the SEC/Edgar url request header>" and \
+            not offlineMode and (companyFactsZip == "" or companyTickersFile == ""):
+        print("Error. When a program automates access to the SEC/Edgar, it is required to give an admin email in the "
+              "URL request header. Please insert the email into the code input section. The program will end.")
+        sys.exit()
+
+    if "--resume" in sys.argv[1:]:
+        resumeRun = True
+    if "--refresh-prices" in sys.argv[1:]:
+        priceRefreshMode = True
+    if "--serve" in sys.argv[1:]:
+        serviceMode = True
+    if "--shards" in sys.argv[1:-1]:
+        shardCount = int(sys.argv[sys.argv.index("--shards") + 1])
+
+    # stocks must be uppercase
+    stockList: list = []
+    for stocks in stockListInput:
+        stockList = stockList + [stocks.upper()]
+
+    # ----------------------------------------------------initialize misc. variables---------------------------------
+    currentTime = datetime.now()
+    currentYear = currentTime.year
+    currentYearStr = str(int(currentYear))
+
+    metrics = RunMetrics()
+    responseCache = ResponseCache(cacheDir, cacheMaxBytes, cacheTTL, cacheDefaultTTL, offline=offlineMode)
+    secLimiter = TokenBucket(secRequestsPerSec)
+    fmpLimiter = TokenBucket(fmpRequestsPerSec)
+    fundamentalsStore = FundamentalsStore(fundamentalsFile, storedConcepts)
+    factsArchive = FactsArchive(companyFactsZip) if companyFactsZip != "" else None
+
+    # ----------------------------------------revalue stored results at today's share prices-------------------------
+    if priceRefreshMode:
+        stageStart = time.perf_counter()
+        refreshResults = refreshPrices(stockList)
+        metrics.observe("stage_seconds", time.perf_counter() - stageStart, stage="price refresh")
+        refreshFileName = "SEC DCF price refresh at " + str(disctFactor) + " " + listDescription + " over " + \
+                          str(yrsDiscted) + " yrs on " + currentTime.strftime("%d-%b-%Y (%H-%M.%f)")
+        refreshFiles = saveTable(refreshFileName, reportFormats, ["Share prices provided by Financial Modeling Prep. "
+                                                                  "EPS, EPS growth and shares as of each stock's last "
+                                                                  "full run."], refreshResults, 'Price refresh')
+        print("The price refresh of ", len(refreshResults), " stocks has been saved to ", ", ".join(refreshFiles))
+        metrics.write(metricsJsonFile, metricsPromFile)
+        sys.exit()
+
+    # ticker -> CIK map from the SEC
+    stageStart = time.perf_counter()
+    tickerToCik: dict = loadTickerMap()
+    metrics.observe("stage_seconds", time.perf_counter() - stageStart, stage="ticker map")
+    if factsArchive is not None and archiveUniverse:
+        archiveCiks = set(factsArchive.ciks())
+        stockList = sorted(ticker for ticker, cikStr in tickerToCik.items() if cikStr in archiveCiks)
+        listDescription = "company facts archive"
+
+    # ----------------------------------------value single tickers on request---------------------------------------
+    if serviceMode:
+        results: dict = {}
+        quotePrices: dict = {}
+        serveValuations(serviceHost, servicePort)
+        metrics.write(metricsJsonFile, metricsPromFile)
+        sys.exit()
+
+    # ----------------------------------------screen the whole market from the SEC frames----------------------------
+    if screeningMode:
+        if screenNewestYear == 0:
+            screenNewestYear = currentYear - 1
+        screenResults = screenUniverse(screenNewestYear)
+        screenFileName = "SEC DCF screen at " + str(disctFactor) + " over " + str(yrsDiscted) + " yrs for CY" + \
+                         str(screenNewestYear) + " on " + currentTime.strftime("%d-%b-%Y (%H-%M.%f)")
+        screenFiles = saveTable(screenFileName, reportFormats, ["Raw data provided by SEC/Edgar frames (see "
+                                                                "https://www.sec.gov/edgar/sec-api-documentation) and "
+                                                                "Financial Modeling Prep. EPS not adjusted for "
+                                                                "splits."], screenResults, 'Screen results')
+        print("The screen of ", len(screenResults), " stocks has been saved to ", ", ".join(screenFiles))
+        if screenShortlist <= 0 or len(screenResults) == 0:
+            metrics.write(metricsJsonFile, metricsPromFile)
+            sys.exit()
+        stockList = screenResults.index[0:screenShortlist].tolist()
+        listDescription = "screen shortlist"
+
+    # print gen info
+    print("CIK provided by the SEC (see https://www.sec.gov/files/company_tickers.json) or, for tickers not found "
+          "there, by Financial Modeling Prep (see https://financialmodelingprep.com/developer/docs/)")
+    print("This program is a Python learning exercise, not to be used for stock trading or financial advice. ")
+
+    # --------------------------------------fetch and value the stocks into the journal(s)---------------------------
+    if shardCount > 1:
+        stageStart = time.perf_counter()
+        journalFiles: list = runShards(stockList, shardCount, resumeRun)
+        metrics.observe("stage_seconds", time.perf_counter() - stageStart, stage="shards")
+    else:
+        valueStocks(stockList, journalFile, resumeRun)
+        journalFiles: list = [journalFile]
+
+    dateTimeObj = datetime.now()
+    timestampStr = dateTimeObj.strftime("%d-%b-%Y (%H-%M.%f)")
+    text2 = "Raw data provided by Financial Modeling Prep (see https://financialmodelingprep.com/developer/docs/) " \
+            "and SEC/Edgar (see https://www.sec.gov/edgar/sec-api-documentation). All other data are " \
+            "either user inputs or calculated by program. "
+
+    text3 = "The program is for Python programming training only, not for trading or stock advice or any other purpose."
+
+    # the report is written straight from the journal(s), a stock at a time. Only the inputs of the valued stocks,
+    # which the sensitivity and Monte Carlo files need, and the solver failures are kept on the way.
+    stageStart = time.perf_counter()
+    valuedInputs: dict = {column: [] for column in ["Ticker", "Price", "EPS newest", "EPS gr % pa",
+                                                    "EPS yoy gr std dev %"]}
+    solverFailures: dict = {}
+    fileName: str = "SEC DCF at " + str(disctFactor) + " " + listDescription + " over " + str(yrsDiscted) \
+                    + " yrs from " + stockList[0] + " to " + stockList[-1] + " on " + timestampStr
+    reportColumns: list = [column for attribute, column in StockResult.columns]
+    reportFiles: list = saveRows(fileName, reportFormats, [text2, text3], "", reportColumns, StockResult.textColumns,
+                                 'NPV etc. results', journalReport(journalFiles, reportColumns, valuedInputs,
+                                                                   solverFailures))
+    print("The results have been saved to ", ", ".join(reportFiles),
+          "\nThe files are in the same directory as the program.")
+    metrics.count("stocks_total", len(valuedInputs["Ticker"]), outcome="valued")
+    metrics.count("stocks_total", len(stockList) - len(valuedInputs["Ticker"]), outcome="not valued")
+
+    solverStocks: list = valuedInputs["Ticker"]
+    solverPrice: list = [float(value) for value in valuedInputs["Price"]]
+    solverEPS: list = [float(value) for value in valuedInputs["EPS newest"]]
+    solverHistGr: list = [float(value) for value in valuedInputs["EPS gr % pa"]]
+
+    # ------------------------------------sensitivity of the results to the disct rate, yrs and growth--------------
+    if sensitivityMode and len(solverStocks) > 0:
+        sensCube = sensitivityCube(solverPrice, solverEPS, solverHistGr, sensDisctRates, sensYrsDiscted,
+                                   sensGrowthHaircuts)
+        sensTable = cubeToLong(solverStocks, sensCube, sensDisctRates, sensYrsDiscted, sensGrowthHaircuts)
+        sensFiles = saveTable("SEC DCF sensitivity " + listDescription + " on " + timestampStr, ["parquet"],
+                              ["NPV, IRR and breakeven growth by disct rate, yrs discounted and growth haircut.", text2,
+                               text3], sensTable.set_index("Ticker"), "Sensitivity")
+        print("The sensitivity results for ", len(sensTable), " stock/scenario combinations have been saved to ",
+              ", ".join(sensFiles))
+
+    # ------------------------------------Monte Carlo spread of the NPV and IRR--------------------------------------
+    if monteCarloMode and len(solverStocks) > 0:
+        mcStart = time.perf_counter()
+        mcResults = monteCarlo(solverStocks, np.array(solverPrice), np.array(solverEPS), np.array(solverHistGr),
+                               np.array(valuedInputs["EPS yoy gr std dev %"], dtype=float), mcPaths, yrsDiscted,
+                               disctFactor, mcWorkers, mcMemoryMB)
+        metrics.observe("stage_seconds", time.perf_counter() - mcStart, stage="monte carlo")
+        mcFiles = saveTable("SEC DCF monte carlo " + listDescription + " on " + timestampStr, ["parquet"],
+                            ["NPV and IRR percentiles over " + str(mcPaths) + " simulated EPS paths per stock.", text2,
+                             text3], mcResults, "Monte Carlo")
+        print("The Monte Carlo results of ", len(mcResults), " stocks over ", mcPaths, " paths each have been saved "
+              "to ", ", ".join(mcFiles))
+
+    # the breakeven solver's end state for every stock it failed on, in one file
+    if len(solverFailures) > 0:
+        failureTable = pd.DataFrame.from_dict(solverFailures, orient="index")
+        failureTable.index.name = "Ticker"
+        failureFiles = saveTable("SEC DCF solver failures " + listDescription + " on " + timestampStr, ["parquet"],
+                                 ["Breakeven growth solver end state for the stocks it failed on.", text3],
+                                 failureTable, "Solver failures")
+        print("The breakeven solver failed for ", len(solverFailures), " stocks, see ", ", ".join(failureFiles))
+    metrics.observe("stage_seconds", time.perf_counter() - stageStart, stage="report")
+    metrics.write(metricsJsonFile, metricsPromFile)
@@ -0,0 +1,36 @@
+# The main program, "sec dcf v3 with user key and mail blank.py", loaded as a module for the tests. Loading it defines
+# its functions and reads its user input section without running it. Run the tests with "python -m pytest" from the
+# repository's top directory. The helpers at the end make company facts for the tests, e.g. from conftest import
+# record.
+
+import importlib.util
+import json
+import os
+import pytest
+
+
+mainProgramFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                               "sec dcf v3 with user key and mail blank.py")
+
+
+@pytest.fixture(scope="module")
+def secdcf():
+    spec = importlib.util.spec_from_file_location("secdcf", mainProgramFile)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.metrics = module.RunMetrics()  # set up by the main program's main block
+    return module
+
+
+# a fact record in the form of the SEC companyfacts api
+def record(frame, end, val, filed):
+    fact = {"end": end, "val": val, "fy": int(end[0:4]), "fp": "FY", "form": "10-K", "filed": filed}
+    if frame != "":
+        fact["frame"] = frame
+    return fact
+
+
+# company facts made from a dictionary of concept -> {unit: [records]}, parsed as the program parses a download
+def companyFacts(secdcf, concepts):
+    usGaap = {concept: {"label": concept, "description": "", "units": units} for concept, units in concepts.items()}
+    return secdcf.CompanyFacts(json.dumps({"cik": 5, "entityName": "Test Co", "facts": {"us-gaap": usGaap}}))
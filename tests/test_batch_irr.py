@@ -0,0 +1,29 @@
+# Tests of the batched IRR (batchIRR) against numpy_financial's per-stock npf.irr.
+
+import numpy as np
+import numpy_financial as npf
+import pytest
+
+
+def testBatchIRRMatchesNpf(secdcf):
+    rng = np.random.default_rng(0)
+    cashflows = secdcf.projectCashflows(rng.uniform(5, 500, 50), rng.uniform(0.1, 20, 50), rng.uniform(-20, 40, 50),
+                                        15)
+    cashflows[3, 7] = -2.0  # a loss later on, not a plain share purchase, falls back to npf.irr
+    expected = np.array([npf.irr(row) for row in cashflows])
+    np.testing.assert_allclose(secdcf.batchIRR(cashflows), expected, rtol=1e-9, atol=1e-12)
+
+
+def testBatchIRRNonFiniteRows(secdcf):
+    cashflows = np.array([[-100.0, 10.0, 10.0, 110.0], [-100.0, np.nan, 10.0, 110.0], [np.inf, 10.0, 10.0, 10.0],
+                          [-100.0, 10.0, -5.0, np.nan]])
+    irr = secdcf.batchIRR(cashflows)
+    assert irr[0] == pytest.approx(0.1)
+    assert np.isnan(irr[1:]).all()
+
+
+def testBatchIRRNoSignChange(secdcf):
+    # a share that pays back less than its price has a negative irr, one with no cost has none
+    irr = secdcf.batchIRR(np.array([[-100.0, 5.0, 5.0, 5.0], [0.0, 5.0, 5.0, 5.0]]))
+    assert irr[0] == pytest.approx(npf.irr([-100.0, 5.0, 5.0, 5.0]))
+    assert np.isnan(irr[1])
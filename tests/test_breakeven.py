@@ -0,0 +1,34 @@
+# Tests of the breakeven growth solver (breakevenGrowth) and the closed form NPV it solves (npvGeometric).
+
+import numpy as np
+import pytest
+
+
+def testBreakevenGrowth(secdcf):
+    price = np.array([100.0, 50.0, 100.0, -5.0, 100.0])
+    epsNewest = np.array([5.0, 4.0, -1.0, 2.0, 0.01])
+    growth, status, iterations, residual = secdcf.breakevenGrowth(price, epsNewest, 0.07, 15)
+    assert status.tolist() == [secdcf.SOLVER_OK, secdcf.SOLVER_OK, secdcf.SOLVER_EPS_NOT_POSITIVE,
+                               secdcf.SOLVER_BAD_INPUT, secdcf.SOLVER_OK]
+    np.testing.assert_allclose(secdcf.npvGeometric(epsNewest[[0, 1, 4]], growth[[0, 1, 4]], 0.07, 15),
+                               price[[0, 1, 4]], rtol=1e-9)
+    assert np.isnan(growth[2]) and np.isnan(growth[3])
+
+
+def testNpvGeometricMatchesSum(secdcf):
+    # growth equal to the disct rate is the q = 1 case of the closed form, worth years * eps
+    for growthPct in [-30.0, 0.0, 7.0, 7.0 + 1e-7, 25.0]:
+        years = np.arange(1, 16)
+        expected = np.sum(4.0 * (1 + growthPct / 100) ** years / 1.07 ** years)
+        assert secdcf.npvGeometric(4.0, growthPct, 0.07, 15) == pytest.approx(expected, rel=1e-9)
+
+
+def testBreakevenGrowthOverGrids(secdcf):
+    # one stock solved for every disct rate and number of years at once, as the sensitivity mode does
+    disctRates = np.array([0.03, 0.07, 0.12])[:, None]
+    years = np.array([5, 10, 30])[None, :]
+    growth, status, iterations, residual = secdcf.breakevenGrowth(80.0, 3.0, disctRates, years)
+    assert growth.shape == (3, 3) and (status == secdcf.SOLVER_OK).all()
+    np.testing.assert_allclose(secdcf.npvGeometric(3.0, growth, disctRates, years), 80.0, rtol=1e-9)
+    assert (np.diff(growth, axis=0) > 0).all()  # a higher disct rate needs more growth
+    assert (np.diff(growth, axis=1) < 0).all()  # more years need less
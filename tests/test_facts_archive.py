@@ -0,0 +1,41 @@
+# Tests of the company facts bulk archive (FactsArchive): members are read straight from the zip, whether stored,
+# deflated or compressed some other way.
+
+import json
+import zipfile
+import pytest
+from conftest import record
+
+
+def factsJson(cik, name, value):
+    return json.dumps({"cik": cik, "entityName": name, "facts": {"us-gaap": {"NetIncomeLoss": {
+        "label": "Net Income (Loss)", "description": "", "units": {"USD": [
+            record("CY2021", "2021-12-31", value, "2022-02-10")]}}}}})
+
+
+@pytest.fixture
+def archiveFile(tmp_path):
+    fileName = str(tmp_path / "companyfacts.zip")
+    with zipfile.ZipFile(fileName, "w") as archive:
+        archive.writestr("CIK0000320193.json", factsJson(320193, "Apple Inc.", 94.7), zipfile.ZIP_DEFLATED)
+        archive.writestr("CIK0000789019.json", factsJson(789019, "Microsoft Corp", 61.3), zipfile.ZIP_STORED)
+        archive.writestr("CIK0001018724.json", factsJson(1018724, "Amazon.com, Inc.", 33.4), zipfile.ZIP_BZIP2)
+        archive.writestr("README.txt", "not a filer")
+    return fileName
+
+
+def testReadsEveryCompression(secdcf, archiveFile):
+    archive = secdcf.FactsArchive(archiveFile)
+    assert archive.ciks() == ["0000320193", "0000789019", "0001018724"]
+    for cik, name, value in [["0000320193", "Apple Inc.", 94.7], ["0000789019", "Microsoft Corp", 61.3],
+                             ["0001018724", "Amazon.com, Inc.", 33.4]]:
+        errorFlag, facts = archive.get(cik)
+        assert not errorFlag
+        assert facts.cik == cik and facts.entityName == name
+        assert facts.frameIndex("us-gaap", "NetIncomeLoss", "USD").frame("CY2021")["val"] == value
+
+
+def testMissingCik(secdcf, archiveFile):
+    errorFlag, message = secdcf.FactsArchive(archiveFile).get("0000000001")
+    assert errorFlag
+    assert "0000000001" in message
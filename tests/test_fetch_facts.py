@@ -0,0 +1,60 @@
+# Tests of fetching a filer's facts (fetchFacts): stored facts are reused while the filer hasn't filed anything new,
+# and the net income concepts resolved for them are only reused with them.
+
+import pytest
+from conftest import record, companyFacts
+
+
+netIncomeChain = [["us-gaap", "ComprehensiveIncomeNetOfTax"], ["us-gaap", "NetIncomeLoss"]]
+
+
+@pytest.fixture
+def sec(secdcf, tmp_path, monkeypatch):
+    store = secdcf.FundamentalsStore(str(tmp_path / "fundamentals.sqlite"), netIncomeChain)
+    # what the SEC answers: the newest accession in the submissions ("" if they can't be read) and the company facts
+    answers = {"accession": "0000000000-22-000001", "downloads": 0, "facts": companyFacts(secdcf, {
+        "NetIncomeLoss": {"USD": [record("CY2021", "2021-12-31", 100, "2022-02-10")]}})}
+
+    def getSecFacts(cikStr, revalidate=False):
+        answers["downloads"] = answers["downloads"] + 1
+        return [False, answers["facts"]]
+
+    monkeypatch.setattr(secdcf, "factsArchive", None, raising=False)
+    monkeypatch.setattr(secdcf, "fundamentalsStore", store, raising=False)
+    monkeypatch.setattr(secdcf, "offlineMode", False)
+    monkeypatch.setattr(secdcf, "netIncomeConcepts", netIncomeChain)
+    monkeypatch.setattr(secdcf, "storedConcepts", netIncomeChain)
+    monkeypatch.setattr(secdcf, "get_latest_accession", lambda cikStr: answers["accession"])
+    monkeypatch.setattr(secdcf, "get_sec_facts", getSecFacts)
+    return answers
+
+
+def testStoredFactsReusedUntilNewFiling(secdcf, sec):
+    first = secdcf.fetchFacts("0000000005")
+    assert first["netIncome"] == {"unit": "USD", "frames": {"CY2021": 1}}
+    assert secdcf.fetchFacts("0000000005")["netIncome"] == first["netIncome"]
+    assert sec["downloads"] == 1
+
+    sec["accession"] = "0000000000-23-000001"
+    sec["facts"] = companyFacts(secdcf, {
+        "ComprehensiveIncomeNetOfTax": {"USD": [record("CY2022", "2022-12-31", 130, "2023-02-10")]},
+        "NetIncomeLoss": {"USD": [record("CY2021", "2021-12-31", 100, "2022-02-10"),
+                                  record("CY2022", "2022-12-31", 120, "2023-02-10")]}})
+    assert secdcf.fetchFacts("0000000005")["netIncome"] == {"unit": "USD", "frames": {"CY2022": 0, "CY2021": 1}}
+    assert sec["downloads"] == 2
+
+
+def testUnknownAccessionResolvesAfresh(secdcf, sec):
+    secdcf.fetchFacts("0000000005")  # stored, with its resolution, at the first accession
+    # the submissions can't be read, so the facts are downloaded again, and they have a newer year
+    sec["accession"] = ""
+    sec["facts"] = companyFacts(secdcf, {
+        "NetIncomeLoss": {"USD": [record("CY2021", "2021-12-31", 100, "2022-02-10"),
+                                  record("CY2022", "2022-12-31", 120, "2023-02-10")]}})
+    fetched = secdcf.fetchFacts("0000000005")
+    assert sec["downloads"] == 2
+    assert fetched["netIncome"] == {"unit": "USD", "frames": {"CY2021": 1, "CY2022": 1}}
+    # nothing is stored against an unknown filing
+    assert secdcf.fundamentalsStore.syncedAccession("0000000005") == "0000000000-22-000001"
+    assert secdcf.fundamentalsStore.resolution("0000000005", netIncomeChain) == {"unit": "USD",
+                                                                                "frames": {"CY2021": 1}}
@@ -0,0 +1,80 @@
+# Tests of the frame index (FrameIndex) and the packed records it is built from (FactColumns): each frame and each
+# fiscal period maps to its most recently filed record, and the annual frames make up the yearly series.
+
+from conftest import record
+
+
+def testFrameCodes(secdcf):
+    for frame, code in [["CY2012", 201200], ["CY2012Q3", 201230], ["CY2012Q3I", 201231]]:
+        assert secdcf.FactColumns.frameCode(frame) == code
+        assert secdcf.FactColumns.frameName(code) == frame
+    assert secdcf.FactColumns.frameCode("") == -1
+
+
+def testFrameIndexKeepsNewestFiled(secdcf):
+    columns = secdcf.FactColumns.fromRecords([
+        record("CY2020", "2020-12-31", 1.0, "2021-02-10"),
+        record("CY2020", "2020-12-31", 1.5, "2022-02-10"),  # restated in the next year's report
+        record("CY2021", "2021-12-31", 2.0, "2022-02-10"),
+        record("CY2021", "2021-12-31", 2.5, "2022-02-10"),  # amendment filed the same day, listed later
+        record("CY2021Q4", "2021-12-31", 0.6, "2022-02-10"),
+        record("", "2022-12-31", 9.0, "2023-02-10")])  # no frame, not indexed
+    index = secdcf.FrameIndex(columns)
+    assert index.frame("CY2020")["val"] == 1.5
+    assert index.frame("CY2021")["val"] == 2.5
+    assert index.frame("CY2021Q4")["val"] == 0.6
+    assert index.frame("CY2022") is None
+    assert index.annualYears == [2020, 2021]
+    assert index.latestAnnual()["frame"] == "CY2021"
+    assert [year for year, annual in index.annualSeries(2021)] == [2021]
+
+
+def testFrameIndexEmpty(secdcf):
+    index = secdcf.FrameIndex(secdcf.FactColumns.fromRecords([]))
+    assert index.latestAnnual() is None
+    assert index.annualSeries() == []
+
+
+def testAnnualSeriesRange(secdcf):
+    records = [record("CY" + str(year), str(year) + "-12-31", float(year), str(year + 1) + "-02-10")
+               for year in [2015, 2016, 2018, 2019]]  # no 2017
+    records.append(dict(record("CY2016", "2016-12-31", 99.0, ""), filed="NaT"))  # no filed date, loses to any filed
+    index = secdcf.FrameIndex(secdcf.FactColumns.fromRecords(records))
+    assert [[year, annual["val"]] for year, annual in index.annualSeries(2016, 2018)] == [[2016, 2016.0],
+                                                                                            [2018, 2018.0]]
+    assert [year for year, annual in index.annualSeries(lastYear=2016)] == [2015, 2016]
+    assert index.frame("CY2017") is None
+
+
+def testPeriodIndex(secdcf):
+    records = [record("CY2020", "2020-12-31", 1.0, "2021-02-10"),
+               dict(record("", "2020-12-31", 1.5, "2022-02-10"), fy=2021),  # comparative in the fiscal 2021 10-K
+               record("CY2021", "2021-12-31", 2.0, "2022-02-10"),  # same report, listed later
+               dict(record("", "2021-12-31", 2.2, "2022-05-02"), form="10-K/A"),
+               dict(record("CY2021Q3", "2021-09-30", 0.5, "2021-11-01"), fp="Q3", form="10-Q"),
+               {"end": "2022-12-31", "val": 9.0, "filed": "2023-02-10"}]  # no fiscal period, not indexed
+    index = secdcf.FrameIndex(secdcf.FactColumns.fromRecords(records))
+    assert index.period(2020)["val"] == 1.0
+    assert index.period(2021) is index.frame("CY2021")
+    assert index.period(2021, form="10-K/A") == {"end": "2021-12-31", "val": 2.2, "filed": "2022-05-02", "fy": 2021,
+                                                 "fp": "FY", "form": "10-K/A"}
+    assert index.period(2021, "Q3", "10-Q")["frame"] == "CY2021Q3"
+    assert index.period(2022) is None
+    assert len(index.byPeriod) == 4
+
+
+def testPeriodIndexMatchesFiltering(secdcf):
+    # what a walk through the records filtering on fy, fp and form finds: the last of the most recently filed
+    records = []
+    for position in range(60):
+        fy, fp = 2015 + position % 4, ["FY", "Q1", "Q2"][position % 3]
+        filed = str(fy + 1 + position % 2) + "-0" + str(1 + position % 5) + "-10"
+        records.append(dict(record("", str(fy) + "-12-31", float(position), filed), fy=fy, fp=fp,
+                            form=["10-K", "10-K/A", "10-Q"][position % 7 % 3]))
+    index = secdcf.FrameIndex(secdcf.FactColumns.fromRecords(records))
+    periods = {(fact["fy"], fact["fp"], fact["form"]) for fact in records}
+    assert len(index.byPeriod) == len(periods)
+    for fy, fp, form in periods:
+        matches = [[fact["filed"], position] for position, fact in enumerate(records)
+                   if fact["fy"] == fy and fact["fp"] == fp and fact["form"] == form]
+        assert index.period(fy, fp, form)["val"] == records[max(matches)[1]]["val"]
@@ -0,0 +1,55 @@
+# Tests of the fundamentals store (FundamentalsStore): the annual facts of a filer are kept with the accession they
+# were synced at, and come back as they were downloaded.
+
+from conftest import record, companyFacts
+
+
+netIncome = [["us-gaap", "NetIncomeLoss"]]
+
+
+def testSyncedAccession(secdcf, tmp_path):
+    fileName = str(tmp_path / "fundamentals.sqlite")
+    store = secdcf.FundamentalsStore(fileName, netIncome)
+    assert store.syncedAccession("0000000005") == ""
+    facts = companyFacts(secdcf, {"NetIncomeLoss": {"USD": [record("CY2021", "2021-12-31", 100, "2022-02-10")]}})
+    store.save("0000000005", facts, "0000000000-22-000001")
+    assert store.syncedAccession("0000000005") == "0000000000-22-000001"
+    assert secdcf.FundamentalsStore(fileName, netIncome).syncedAccession("0000000005") == "0000000000-22-000001"
+    # a different concept list means the stored facts don't have every concept the run needs
+    wider = secdcf.FundamentalsStore(fileName, netIncome + [["us-gaap", "Revenues"]])
+    assert wider.syncedAccession("0000000005") == ""
+
+
+def testSaveKeepsAnnualFramesAndReplaces(secdcf, tmp_path):
+    store = secdcf.FundamentalsStore(str(tmp_path / "fundamentals.sqlite"), netIncome)
+    facts = companyFacts(secdcf, {"NetIncomeLoss": {"USD": [record("CY2020", "2020-12-31", 90, "2021-02-10"),
+                                                            record("CY2021Q3", "2021-09-30", 30, "2021-11-01"),
+                                                            record("CY2021", "2021-12-31", 100, "2022-02-10")]},
+                                  "Revenues": {"USD": [record("CY2021", "2021-12-31", 900, "2022-02-10")]}})
+    store.save("0000000005", facts, "0000000000-22-000001")
+    store.saveResolution("0000000005", netIncome, {"unit": "USD", "frames": {"CY2021": 0, "CY2020": 0}})
+    loaded = store.load("0000000005")
+    assert loaded.entityName == "Test Co"
+    assert list(loaded.frameIndex("us-gaap", "NetIncomeLoss", "USD").byFrame.keys()) == ["CY2020", "CY2021"]
+    assert not loaded.has("us-gaap", "Revenues")  # not in the store's concept list
+    assert store.resolution("0000000005", netIncome)["unit"] == "USD"
+
+    restated = companyFacts(secdcf, {"NetIncomeLoss": {"USD": [record("CY2021", "2021-12-31", 105, "2023-02-10"),
+                                                               record("CY2022", "2022-12-31", 120, "2023-02-10")]}})
+    store.save("0000000005", restated, "0000000000-23-000001")
+    index = store.load("0000000005").frameIndex("us-gaap", "NetIncomeLoss", "USD")
+    assert [[frame, annual["val"]] for frame, annual in index.byFrame.items()] == [["CY2021", 105.0],
+                                                                                   ["CY2022", 120.0]]
+    assert index.period(2022)["val"] == 120.0  # the fiscal periods of the stored records are kept with them
+    assert store.resolution("0000000005", netIncome) is None  # resolved from the replaced facts
+
+
+def testFundamentalsStoreKeepsUnitOrder(secdcf, tmp_path):
+    facts = companyFacts(secdcf, {"NetIncomeLoss": {"USD": [record("CY2021", "2021-12-31", 100, "2022-02-10")],
+                                                    "CAD": [record("CY2021", "2021-12-31", 130, "2022-02-10")]}})
+    store = secdcf.FundamentalsStore(str(tmp_path / "fundamentals.sqlite"), [["us-gaap", "NetIncomeLoss"]])
+    store.save("0000000005", facts, "0000000000-22-000001")
+    loaded = store.load("0000000005")
+    assert loaded.units("us-gaap", "NetIncomeLoss") == ["USD", "CAD"]
+    assert secdcf.resolveConcepts(loaded, netIncome)["unit"] == "USD"
+    assert store.load("0000000006") is None
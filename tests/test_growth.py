@@ -0,0 +1,38 @@
+# Tests of the EPS growth statistics (growthStats) and of the annual rows they are computed from (annualRow).
+
+import numpy as np
+from conftest import record
+
+
+def testGrowthStats(secdcf):
+    steady = 2.0 * 1.1 ** np.arange(6)
+    gappy = steady.copy()
+    gappy[[1, 3]] = [np.nan, -1.0]  # a missing year and a loss, both left out of the fit
+    stats = secdcf.growthStats(np.array([steady, gappy, [np.nan, np.nan, np.nan, np.nan, np.nan, 3.0]]))
+    np.testing.assert_allclose(stats["cagr %"][0:2], 10.0)
+    np.testing.assert_allclose(stats["regression %"][0:2], 10.0)
+    np.testing.assert_allclose(stats["std err %"][0:2], 0.0, atol=1e-9)
+    np.testing.assert_allclose(stats["yoy std %"][0], 0.0, atol=1e-9)
+    assert stats["points"].tolist() == [6, 4, 1]
+    assert np.isnan(stats["yoy std %"][1])  # only one pair of consecutive years left
+    assert np.isnan(stats["cagr %"][2]) and np.isnan(stats["regression %"][2])
+
+
+def testGrowthStatsNoisyHistory(secdcf):
+    # the regression is the growth of the log-linear least squares fit, compared with numpy's polyfit
+    history = np.array([[1.0, 1.3, 1.2, 1.6, 1.5, 2.1, 2.0]])
+    stats = secdcf.growthStats(history)
+    slope = np.polyfit(np.arange(7), np.log(history[0]), 1)[0]
+    np.testing.assert_allclose(stats["regression %"], np.expm1(slope) * 100)
+    np.testing.assert_allclose(stats["cagr %"], (2.0 ** (1 / 6) - 1) * 100)
+    np.testing.assert_allclose(stats["yoy std %"], np.std(np.diff(np.log(history[0])), ddof=1) * 100)
+    assert stats["std err %"][0] > 0
+
+
+def testAnnualRow(secdcf):
+    index = secdcf.FrameIndex(secdcf.FactColumns.fromRecords([
+        record("CY2019", "2019-09-28", 3.0, "2019-10-30"), record("CY2021", "2021-09-25", 5.0, "2021-10-29")]))
+    values, ends = secdcf.annualRow(index, 2018, 2021)
+    np.testing.assert_array_equal(values, [np.nan, 3.0, np.nan, 5.0])
+    assert ends.tolist()[1].isoformat() == "2019-09-28"
+    assert np.isnat(ends[[0, 2]]).all()
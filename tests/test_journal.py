@@ -0,0 +1,53 @@
+# Tests of the result journal (ResultJournal) and of the report read back from the journals of a run.
+
+import numpy as np
+
+
+def testJournalResume(secdcf, tmp_path):
+    fileName = str(tmp_path / "journal.jsonl")
+    parameters = {"stocks": ["AAA", "BBB", "CCC"], "disctFactor": 0.07}
+    journal = secdcf.ResultJournal(fileName, parameters, resume=False)
+    journal.append([["AAA", {"IRR %": 9.5}], ["BBB", {"IRR %": np.float64(3.25)}]])
+    journal.close()
+    with open(fileName, "a", encoding="utf-8") as journalFile:
+        journalFile.write('{"stock": "CCC", "row": {"IRR')  # cut short by a crash
+
+    resumed = secdcf.ResultJournal(fileName, parameters, resume=True)
+    assert resumed.done == {"AAA", "BBB"}
+    resumed.append([["CCC", {"IRR %": 1.0}], ["AAA", {"IRR %": 9.75}]])
+    resumed.close()
+    assert dict(secdcf.ResultJournal.rows(fileName)) == {"AAA": {"IRR %": 9.75}, "BBB": {"IRR %": 3.25},
+                                                         "CCC": {"IRR %": 1.0}}
+
+    restarted = secdcf.ResultJournal(fileName, dict(parameters, disctFactor=0.08), resume=True)
+    restarted.close()
+    assert restarted.done == set()
+    assert list(secdcf.ResultJournal.rows(fileName)) == []
+
+
+def testJournalReportStreamsShardsInStockOrder(secdcf, tmp_path):
+    # two shards, dealt AAA, CCC, EEE and BBB, DDD in turn
+    shardJournals = [str(tmp_path / "shard 1.jsonl"), str(tmp_path / "shard 2.jsonl"), str(tmp_path / "missing.jsonl")]
+    for fileName, rows in zip(shardJournals, [
+            [["AAA", {"Price": 10.0, "EPS newest": 1.0, "EPS gr % pa": 5.0, "NPV of Future EPS": 12.0}],
+             ["CCC", {"Warnings if any": "No EPS history."}],
+             ["EEE", {"Price": 30.0, "EPS newest": 2.0, "EPS gr % pa": 1.0, "NPV of Future EPS": 20.0,
+                      "Solver diagnostics": {"status": 3}}]],
+            [["BBB", {"Price": 20.0, "EPS newest": 0.5, "EPS gr % pa": -1.0, "NPV of Future EPS": 4.0}],
+             ["DDD", {"Warnings if any": "Share price not found."}]]]):
+        journal = secdcf.ResultJournal(fileName, {"stocks": []}, resume=False)
+        journal.append(rows)
+        journal.close()
+
+    secdcf.fundamentalsStore = secdcf.FundamentalsStore(str(tmp_path / "fundamentals.sqlite"), [])
+    valuedInputs = {"Ticker": [], "Price": [], "EPS gr % pa": []}
+    solverFailures = {}
+    report = secdcf.journalReport(shardJournals, ["Price", "Warnings if any"], valuedInputs, solverFailures)
+    assert next(report) == ["AAA", [10.0, None]]
+    assert valuedInputs["Ticker"] == ["AAA"]  # filled as the rows go by, not up front
+    assert list(report) == [["BBB", [20.0, None]], ["CCC", [None, "No EPS history."]],
+                            ["DDD", [None, "Share price not found."]], ["EEE", [30.0, None]]]
+    assert valuedInputs == {"Ticker": ["AAA", "BBB", "EEE"], "Price": [10.0, 20.0, 30.0],
+                            "EPS gr % pa": [5.0, -1.0, 1.0]}
+    assert solverFailures == {"EEE": {"status": 3}}
+    assert sorted(secdcf.fundamentalsStore.valuations(["AAA", "BBB", "CCC", "EEE"]).keys()) == ["AAA", "BBB", "EEE"]
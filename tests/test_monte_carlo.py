@@ -0,0 +1,42 @@
+# Tests of the Monte Carlo mode (simulateValuations and monteCarlo): without any spread in the growth every path is
+# the plain valuation, and a stock's paths don't depend on the batch it is simulated in.
+
+import numpy as np
+import pytest
+
+
+def testNoSpreadIsThePlainValuation(secdcf):
+    price, epsNewest, growthPct = np.array([100.0, 30.0]), np.array([5.0, 1.0]), np.array([8.0, 2.0])
+    simulated = secdcf.simulateValuations(price, epsNewest, growthPct, np.array([0.0, np.nan]), [[1, 2], [1, 3]],
+                                          50, 15, 0.07)
+    npv = secdcf.npvGeometric(epsNewest, growthPct, 0.07, 15)
+    irr = secdcf.batchIRR(secdcf.projectCashflows(price, epsNewest, growthPct, 15)) * 100
+    for percentile in secdcf.mcPercentiles:
+        np.testing.assert_allclose(simulated["NPV p" + str(percentile)], npv, rtol=1e-9)
+        np.testing.assert_allclose(simulated["IRR % p" + str(percentile)], irr, rtol=1e-7)
+    np.testing.assert_array_equal(simulated["P(NPV > price)"], npv > price)
+
+
+def testSpreadWidensThePercentiles(secdcf):
+    simulated = secdcf.simulateValuations(np.array([100.0]), np.array([5.0]), np.array([8.0]), np.array([15.0]),
+                                          [[1, 2]], 4000, 15, 0.07)
+    npvs = [simulated["NPV p" + str(percentile)][0] for percentile in secdcf.mcPercentiles]
+    assert npvs == sorted(npvs) and npvs[0] < npvs[-1]
+    # the median path grows at the stock's growth, so the median NPV is near the plain valuation
+    assert simulated["NPV p50"][0] == pytest.approx(secdcf.npvGeometric(5.0, 8.0, 0.07, 15), rel=0.05)
+    assert 0.0 < simulated["P(NPV > price)"][0] < 1.0
+
+
+def testBatchesDontChangeResults(secdcf):
+    stocks = ["AAA", "BBB", "CCC", "DDD", "EEE"]
+    inputs = [np.array([100.0, 50.0, 20.0, 80.0, 10.0]), np.array([5.0, 2.0, 1.5, 4.0, 0.5]),
+              np.array([8.0, 3.0, 12.0, -2.0, 5.0]), np.array([10.0, 20.0, 5.0, 15.0, np.nan])]
+    oneBatch = secdcf.monteCarlo(stocks, *inputs, 200, 10, 0.07, 1, 64)
+    smallBatches = secdcf.monteCarlo(stocks, *inputs, 200, 10, 0.07, 1, 0.05)  # one stock per batch
+    assert oneBatch.index.tolist() == stocks
+    assert oneBatch.columns[0:3].tolist() == ["Price", "EPS gr % pa", "EPS yoy gr std dev %"]
+    np.testing.assert_allclose(smallBatches.to_numpy(dtype=float), oneBatch.to_numpy(dtype=float), rtol=1e-12)
+    # the stocks' paths depend on their tickers, not on their place in the list
+    reordered = secdcf.monteCarlo(stocks[::-1], *[values[::-1] for values in inputs], 200, 10, 0.07, 1, 64)
+    np.testing.assert_allclose(reordered.loc[stocks].to_numpy(dtype=float), oneBatch.to_numpy(dtype=float),
+                               rtol=1e-12)
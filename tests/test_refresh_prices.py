@@ -0,0 +1,69 @@
+# Tests of the price refresh mode (refreshPrices): stocks valued in earlier runs are revalued at today's prices from
+# the results kept in the fundamentals store, without any SEC request.
+
+import numpy as np
+import pytest
+
+
+# a stored result row, as StockResult.row gives it
+def storedRow(name, price, epsNewest, epsGrowth, shares, irr):
+    return {"Name": name, "CIK": "0000000001", "Currency": "USD", "Price": price, "EPS newest": epsNewest,
+            "EPS gr % pa": epsGrowth, "Shares out-standing": shares, "IRR %": irr,
+            "Req gr % pa for NPV break-even": 5.0}
+
+
+@pytest.fixture
+def refresh(secdcf, tmp_path, monkeypatch):
+    store = secdcf.FundamentalsStore(str(tmp_path / "fundamentals.sqlite"), [["us-gaap", "NetIncomeLoss"]])
+    store.saveValuations([["AAA", storedRow("Aaa Inc.", 100.0, 5.0, 8.0, 1e9, 9.0)],
+                          ["BBB", storedRow("Bbb Corp", 20.0, 1.0, 4.0, 1e9, 6.0)],
+                          ["SML", storedRow("Small Co", 10.0, 1.0, 4.0, 1e6, 12.0)],
+                          ["NSH", storedRow("No Shares Co", 30.0, 2.0, 6.0, None, 7.0)]])
+    quotes = {"AAA": 80.0, "SML": 10.0, "NSH": 35.0}
+    requested = []
+
+    def fetchQuotes(stocks, chunkSize):
+        requested.append(list(stocks))
+        return {stock: quotes[stock] for stock in stocks if stock in quotes}
+
+    monkeypatch.setattr(secdcf, "fundamentalsStore", store, raising=False)
+    monkeypatch.setattr(secdcf, "fetchQuotes", fetchQuotes)
+    monkeypatch.setattr(secdcf, "disctFactor", 0.06)
+    monkeypatch.setattr(secdcf, "yrsDiscted", 15)
+    monkeypatch.setattr(secdcf, "minMarketCap", 1e9)
+    return [store, requested]
+
+
+def testRevaluesAtTodaysPrice(secdcf, refresh):
+    store, requested = refresh
+    results = secdcf.refreshPrices(["AAA", "NEW", "BBB", "SML"])
+    assert results.index.tolist() == ["AAA", "NEW", "BBB", "SML"]
+    assert requested == [["AAA", "BBB", "SML"]]  # only the stocks valued before
+
+    aaa = results.loc["AAA"]
+    assert aaa["Price at valuation"] == 100.0 and aaa["Price"] == 80.0
+    assert aaa["Price change %"] == pytest.approx(-20.0)
+    assert aaa["Mkt Cap"] == pytest.approx(8e10)
+    cashflows = secdcf.projectCashflows(80.0, 5.0, 8.0, 15)
+    assert aaa["IRR %"] == pytest.approx(secdcf.batchIRR(cashflows)[0] * 100)
+    assert aaa["IRR change % pts"] == pytest.approx(aaa["IRR %"] - 9.0)
+    assert secdcf.npvGeometric(5.0, aaa["Req gr % pa for NPV break-even"], 0.06, 15) == pytest.approx(80.0)
+    assert aaa["Warnings if any"] == ""
+
+
+def testStocksNotRevalued(secdcf, refresh):
+    results = secdcf.refreshPrices(["AAA", "NEW", "BBB", "SML"])
+    assert results.loc["NEW", "Warnings if any"] == "Not valued in an earlier full run."
+    assert results.loc["BBB", "Warnings if any"] == "No share price found"
+    assert results.loc["SML", "Warnings if any"].startswith("Market cap is less than")
+    for stock in ["NEW", "BBB", "SML"]:
+        assert np.isnan(results.loc[stock, "IRR %"])
+
+
+def testNoSharesOutstanding(secdcf, refresh):
+    # without shares there is no market cap to check against the floor, so the stock isn't revalued
+    results = secdcf.refreshPrices(["NSH"])
+    assert results.loc["NSH", "Price"] == 35.0
+    assert np.isnan(results.loc["NSH", "Mkt Cap"]) and np.isnan(results.loc["NSH", "IRR %"])
+    assert np.isnan(results.loc["NSH", "Req gr % pa for NPV break-even"])
+    assert results.loc["NSH", "Warnings if any"] == "No shares outstanding; IRR not recomputed."
@@ -0,0 +1,109 @@
+# Tests of the report writer (ReportWriter, writeTable and saveTable): every format gives back the table it was
+# handed, with text columns as text.
+
+import csv
+import gzip
+import importlib.util
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+
+# a small results table with a text column, numeric columns, an empty cell and the ticker as the index
+def resultsTable():
+    table = pd.DataFrame({"Name": ["Apple Inc.", "Wec Energy Group, Inc."], "CIK": ["0000320193", "0000783325"],
+                          "IRR %": [9.82, np.nan], "EPS yrs in regression": [10, 9]},
+                         index=pd.Index(["AAPL", "WEC"], name="Ticker"))
+    return table
+
+
+header = ["Raw data provided by the SEC.", "For Python programming training only."]
+
+
+# the header lines, blank line, column names and rows of a csv report with headerCount header lines
+def readCsv(fileName, headerCount):
+    with (gzip.open(fileName, "rt", encoding="utf-8", newline="") if fileName.endswith(".gz") else
+          open(fileName, "r", encoding="utf-8", newline="")) as reportFile:
+        lines = list(csv.reader(reportFile))
+    return lines[0:headerCount], lines[headerCount], lines[headerCount + 1], lines[headerCount + 2:]
+
+
+@pytest.mark.parametrize("extension", ["csv", "csv.gz"])
+def testCsvRoundTrip(secdcf, tmp_path, extension):
+    fileName = str(tmp_path / ("report." + extension))
+    secdcf.writeTable(fileName, header, resultsTable(), "Results")
+    headerLines, blank, columnNames, rows = readCsv(fileName, len(header))
+    assert headerLines == [[line] for line in header]
+    assert blank == []
+    assert columnNames == ["Ticker", "Name", "CIK", "IRR %", "EPS yrs in regression"]
+    assert rows == [["AAPL", "Apple Inc.", "0000320193", "9.82", "10"], ["WEC", "Wec Energy Group, Inc.",
+                                                                          "0000783325", "", "9"]]
+
+
+def testXlsxRoundTrip(secdcf, tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    fileName = str(tmp_path / "report.xlsx")
+    secdcf.writeTable(fileName, header, resultsTable(), "Results")
+    sheet = openpyxl.load_workbook(fileName)["Results"]
+    values = [list(row) for row in sheet.iter_rows(values_only=True)]
+    assert [row[0] for row in values[0:2]] == header
+    assert values[3] == ["Ticker", "Name", "CIK", "IRR %", "EPS yrs in regression"]
+    assert values[4] == ["AAPL", "Apple Inc.", "0000320193", 9.82, 10]
+    assert values[5] == ["WEC", "Wec Energy Group, Inc.", "0000783325", None, 9]
+
+
+def testParquetRoundTrip(secdcf, tmp_path):
+    pyarrowParquet = pytest.importorskip("pyarrow.parquet")
+    fileName = str(tmp_path / "report.parquet")
+    secdcf.writeTable(fileName, header, resultsTable(), "Results")
+    parquetTable = pyarrowParquet.read_table(fileName)
+    assert parquetTable.schema.metadata[b"header"].decode() == "\n".join(header)
+    assert parquetTable.schema.field("Name").type == "string"
+    assert parquetTable.schema.field("IRR %").type == "double"
+    assert parquetTable.to_pylist() == [
+        {"Ticker": "AAPL", "Name": "Apple Inc.", "CIK": "0000320193", "IRR %": 9.82, "EPS yrs in regression": 10.0},
+        {"Ticker": "WEC", "Name": "Wec Energy Group, Inc.", "CIK": "0000783325", "IRR %": None,
+         "EPS yrs in regression": 9.0}]
+
+
+def testFailedWriteLeavesNoFile(secdcf, tmp_path, monkeypatch):
+    def failingWrite(self, index, values):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(secdcf.ReportWriter, "write", failingWrite)
+    for extension in ["csv"] + (["xlsx"] if importlib.util.find_spec("openpyxl") else []) + \
+            (["parquet"] if importlib.util.find_spec("pyarrow") else []):
+        fileName = tmp_path / ("report." + extension)
+        with pytest.raises(RuntimeError):
+            secdcf.writeTable(str(fileName), header, resultsTable(), "Results")
+        assert not fileName.exists()
+
+
+def testSaveTableWritesEveryFormat(secdcf, tmp_path):
+    pytest.importorskip("openpyxl")
+    baseName = str(tmp_path / "report")
+    fileNames = secdcf.saveTable(baseName, ["xlsx", "csv"], header, resultsTable(), "Results")
+    assert fileNames == [baseName + ".xlsx", baseName + ".csv"]
+    headerLines, blank, columnNames, rows = readCsv(baseName + ".csv", len(header) + 1)
+    assert headerLines[0] == [baseName + ".csv"]  # the file name heads the header lines
+    assert len(rows) == 2
+
+
+def testSaveRowsReadsRowsOnce(secdcf, tmp_path):
+    baseName = str(tmp_path / "report")
+    rows = ([ticker, [ticker + " Holdings", float(number)]] for number, ticker in enumerate(["AAA", "BBB", "CCC"]))
+    fileNames = secdcf.saveRows(baseName, ["csv", "csv.gz"], header, "Ticker", ["Name", "IRR %"], ["Name"], "Results",
+                                rows)
+    for fileName in fileNames:
+        headerLines, blank, columnNames, written = readCsv(fileName, len(header) + 1)
+        assert written == [["AAA", "AAA Holdings", "0.0"], ["BBB", "BBB Holdings", "1.0"],
+                           ["CCC", "CCC Holdings", "2.0"]]
+
+
+def testParquetFallsBackToGzippedCsv(secdcf, tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)  # import pyarrow raises ImportError
+    baseName = str(tmp_path / "report")
+    fileNames = secdcf.saveTable(baseName, ["parquet", "csv.gz"], header, resultsTable(), "Results")
+    assert fileNames == [baseName + ".csv.gz"]
+    assert not (tmp_path / "report.parquet").exists()
@@ -0,0 +1,52 @@
+# Tests of the net income concept chain (resolveConcepts and stitchedIndex): each year comes from the first concept
+# in the chain that has it, in the unit of the first concept the filer reports.
+
+from conftest import record, companyFacts
+
+
+netIncomeChain = [["us-gaap", "ComprehensiveIncomeNetOfTax"], ["us-gaap", "NetIncomeLoss"]]
+
+
+def testResolveConceptsFillsGapsFromLaterConcepts(secdcf):
+    facts = companyFacts(secdcf, {
+        "ComprehensiveIncomeNetOfTax": {"USD": [record("CY2021", "2021-12-31", 110, "2022-02-10")]},
+        "NetIncomeLoss": {"USD": [record("CY2020", "2020-12-31", 90, "2021-02-10"),
+                                  record("CY2021", "2021-12-31", 100, "2022-02-10")],
+                          "EUR": [record("CY2019", "2019-12-31", 80, "2020-02-10")]}})
+    resolution = secdcf.resolveConcepts(facts, netIncomeChain)
+    assert resolution == {"unit": "USD", "frames": {"CY2021": 0, "CY2020": 1}}
+
+    index = secdcf.stitchedIndex(facts, netIncomeChain, resolution)
+    assert index.frame("CY2021")["val"] == 110
+    assert index.frame("CY2021")["concept"] == "ComprehensiveIncomeNetOfTax"
+    assert index.frame("CY2020")["concept"] == "NetIncomeLoss"
+
+
+def testResolveConceptsOnlyAnnualFrames(secdcf):
+    # quarterly frames aren't in the fundamentals store, so a resolution with them can't be stitched from it
+    facts = companyFacts(secdcf, {"NetIncomeLoss": {"USD": [record("CY2021", "2021-12-31", 100, "2022-02-10"),
+                                                            record("CY2021Q3", "2021-09-30", 30, "2021-11-01")]}})
+    resolution = secdcf.resolveConcepts(facts, netIncomeChain)
+    assert resolution["frames"] == {"CY2021": 1}
+
+    older = {"unit": "USD", "frames": {"CY2021": 1, "CY2021Q3": 1}}  # as saved by an older version
+    stored = secdcf.StoredFacts("0000000005", "Test Co", {
+        ("us-gaap", "NetIncomeLoss", "USD"): secdcf.FactColumns.fromRecords([facts.frameIndex(
+            "us-gaap", "NetIncomeLoss", "USD").frame("CY2021")])})
+    index = secdcf.stitchedIndex(stored, netIncomeChain, older)
+    assert list(index.byFrame.keys()) == ["CY2021"]
+
+
+def testResolveConceptsNoConcept(secdcf):
+    facts = companyFacts(secdcf, {"Revenues": {"USD": [record("CY2021", "2021-12-31", 100, "2022-02-10")]}})
+    assert secdcf.resolveConcepts(facts, netIncomeChain) == {"unit": "", "frames": {}}
+
+
+def testResolveConceptsKeepsFirstUnit(secdcf):
+    # a later concept in another currency doesn't fill gaps in figures reported in USD
+    facts = companyFacts(secdcf, {
+        "ComprehensiveIncomeNetOfTax": {"USD": [record("CY2021", "2021-12-31", 110, "2022-02-10")]},
+        "NetIncomeLoss": {"EUR": [record("CY2020", "2020-12-31", 80, "2021-02-10")]}})
+    resolution = secdcf.resolveConcepts(facts, netIncomeChain)
+    assert resolution == {"unit": "USD", "frames": {"CY2021": 0}}
+    assert list(secdcf.stitchedIndex(facts, netIncomeChain, resolution).byFrame.keys()) == ["CY2021"]
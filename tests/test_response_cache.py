@@ -0,0 +1,138 @@
+# Tests of the response cache (ResponseCache): fresh entries are served from disk, stale ones are revalidated with
+# their ETag, offline mode never calls the server and the least recently used entries go once the cache is full.
+
+import os
+import threading
+import pytest
+
+
+# a stand-in for the server: serves the bodies of a dictionary url -> [body, ETag], answers 304 when the ETag
+# sent matches, and records each request with its conditional headers
+class Server:
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.requests = []
+
+    def transport(self, url, headers):
+        self.requests.append([url, headers])
+        body, etag = self.bodies[url]
+        if headers.get("If-None-Match") == etag:
+            return 304, b"", {}
+        return 200, body, {"ETag": etag}
+
+
+def newCache(secdcf, tmp_path, maxBytes=10 ** 6, offline=False):
+    return secdcf.ResponseCache(str(tmp_path / "cache"), maxBytes, {"/submissions/": 0}, 3600, offline=offline)
+
+
+def testFreshEntryServedFromCache(secdcf, tmp_path):
+    url = "https://data.sec.gov/api/xbrl/companyfacts/CIK0000320193.json"
+    server = Server({url: [b"facts", '"v1"']})
+    cache = newCache(secdcf, tmp_path)
+    assert cache.get(url, server.transport) == [200, b"facts"]
+    assert cache.get(url, server.transport) == [200, b"facts"]
+    assert len(server.requests) == 1
+    assert newCache(secdcf, tmp_path).get(url, server.transport) == [200, b"facts"]  # kept on disk
+    assert len(server.requests) == 1
+
+
+def testApiKeyNotInCacheKey(secdcf, tmp_path):
+    server = Server({"https://fmp/quote/AAPL?apikey=one": [b"quote", '"q"'],
+                     "https://fmp/quote/AAPL?apikey=two": [b"other", '"q"']})
+    cache = newCache(secdcf, tmp_path)
+    cache.get("https://fmp/quote/AAPL?apikey=one", server.transport)
+    assert cache.get("https://fmp/quote/AAPL?apikey=two", server.transport) == [200, b"quote"]
+    assert len(server.requests) == 1
+
+
+def testStaleEntryRevalidatedWithETag(secdcf, tmp_path):
+    url = "https://data.sec.gov/submissions/CIK0000320193.json"  # time to live 0, always stale
+    server = Server({url: [b"filings", '"v1"']})
+    cache = newCache(secdcf, tmp_path)
+    assert cache.get(url, server.transport) == [200, b"filings"]
+    assert cache.get(url, server.transport) == [200, b"filings"]  # 304, body from the cache
+    assert server.requests[1][1]["If-None-Match"] == '"v1"'
+
+    server.bodies[url] = [b"new filings", '"v2"']
+    assert cache.get(url, server.transport) == [200, b"new filings"]
+    assert cache.get(url, server.transport) == [200, b"new filings"]
+    assert server.requests[3][1]["If-None-Match"] == '"v2"'
+    assert cache.totalBytes == len(b"new filings")  # the old body no longer counts
+
+
+def testRevalidateFreshEntry(secdcf, tmp_path):
+    url = "https://data.sec.gov/api/xbrl/companyfacts/CIK0000320193.json"
+    server = Server({url: [b"facts", '"v1"']})
+    cache = newCache(secdcf, tmp_path)
+    cache.get(url, server.transport)
+    assert cache.get(url, server.transport, revalidate=True) == [200, b"facts"]
+    assert server.requests[1][1]["If-None-Match"] == '"v1"'
+
+
+def testOfflineMode(secdcf, tmp_path):
+    cached = "https://data.sec.gov/submissions/CIK0000320193.json"
+    server = Server({cached: [b"filings", '"v1"']})
+    newCache(secdcf, tmp_path).get(cached, server.transport)
+
+    offline = newCache(secdcf, tmp_path, offline=True)
+    assert offline.get(cached, server.transport) == [200, b"filings"]  # stale, but served without asking
+    with pytest.raises(secdcf.OfflineCacheMiss):
+        offline.get("https://data.sec.gov/submissions/CIK0000789019.json", server.transport)
+    assert len(server.requests) == 1
+
+
+def testLeastRecentlyUsedEvicted(secdcf, tmp_path, monkeypatch):
+    urls = ["https://fmp/quote/" + ticker for ticker in ["AAA", "BBB", "CCC", "DDD"]]
+    server = Server({url: [url[-3:].encode() * 100, '"' + url[-3:] + '"'] for url in urls})  # 300 bytes each
+    cache = newCache(secdcf, tmp_path, maxBytes=1000)
+    clock = [1000.0]
+    monkeypatch.setattr(secdcf.time, "time", lambda: clock[0])
+    for url in urls[0:3]:
+        clock[0] = clock[0] + 1
+        cache.get(url, server.transport)
+    clock[0] = clock[0] + 1
+    cache.get(urls[0], server.transport)  # AAA is used again, so BBB is now the least recently used
+    assert cache.totalBytes == 900
+
+    clock[0] = clock[0] + 1
+    cache.get(urls[3], server.transport)
+    assert cache.totalBytes == 900 == cache.blobBytes()
+    blobs = os.listdir(tmp_path / "cache" / "blobs")
+    assert len([name for directory in blobs for name in os.listdir(tmp_path / "cache" / "blobs" / directory)]) == 3
+    requests = len(server.requests)
+    for url in [urls[0], urls[2], urls[3]]:
+        cache.get(url, server.transport)
+    assert len(server.requests) == requests
+    cache.get(urls[1], server.transport)
+    assert len(server.requests) == requests + 1
+
+
+def testSharedBlobCountedOnce(secdcf, tmp_path):
+    server = Server({"https://fmp/a": [b"x" * 300, '"x"'], "https://fmp/b": [b"x" * 300, '"x"']})
+    cache = newCache(secdcf, tmp_path)
+    cache.get("https://fmp/a", server.transport)
+    cache.get("https://fmp/b", server.transport)
+    assert cache.totalBytes == 300 == cache.blobBytes()
+
+
+def testSameBlobWrittenByThreads(secdcf, tmp_path):
+    # tickers without splits all get the same answer, so fetch threads write the same blob at the same time
+    cache = newCache(secdcf, tmp_path)
+    bodies = [("empty " + str(round)).encode() * 20000 for round in range(20)]
+    errors = []
+
+    def write():
+        try:
+            for body in bodies:
+                cache.writeBlob(body)
+        except OSError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=write) for thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    for body in bodies:
+        assert cache.readBlob(cache.writeBlob(body)) == body
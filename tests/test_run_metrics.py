@@ -0,0 +1,72 @@
+# Tests of the run metrics (RunMetrics): counters and summaries by label and by ticker, merged across shards and
+# written as json and in the Prometheus text format.
+
+import json
+import threading
+
+
+def testCountersSummariesAndTickers(secdcf):
+    metrics = secdcf.RunMetrics()
+    metrics.setTicker("AAPL")
+    metrics.count("http_requests_total", endpoint="quote", status="200")
+    metrics.count("http_requests_total", endpoint="quote", status="200")
+    metrics.observe("http_request_seconds", 0.25, endpoint="quote")
+    metrics.observe("http_request_seconds", 0.75, endpoint="quote")
+    metrics.count("stocks_total", ticker="WEC", outcome="valued")
+    metrics.setTicker(None)
+    metrics.count("stocks_total", outcome="not valued")
+
+    summary = metrics.summary()
+    assert {"name": "http_requests_total", "labels": {"endpoint": "quote", "status": "200"}, "value": 2} in \
+        summary["counters"]
+    assert summary["summaries"] == [{"name": "http_request_seconds", "labels": {"endpoint": "quote"}, "count": 2,
+                                     "sum": 1.0, "max": 0.75}]
+    assert summary["tickers"] == {"AAPL": {"http_requests_total": 2, "http_request_seconds": 1.0},
+                                  "WEC": {"stocks_total": 1}}
+
+
+def testTickerIsPerThread(secdcf):
+    metrics = secdcf.RunMetrics()
+    metrics.setTicker("AAPL")
+
+    def other():
+        metrics.setTicker("WEC")
+        metrics.count("http_retries_total", endpoint="quote")
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    thread.join()
+    metrics.count("http_retries_total", endpoint="quote")
+    assert metrics.summary()["tickers"] == {"WEC": {"http_retries_total": 1}, "AAPL": {"http_retries_total": 1}}
+
+
+def testMergeShards(secdcf):
+    shards = [secdcf.RunMetrics(), secdcf.RunMetrics()]
+    for shard, (ticker, seconds) in zip(shards, [["AAPL", 2.0], ["WEC", 5.0]]):
+        shard.count("stocks_total", ticker=ticker, outcome="valued")
+        shard.observe("stage_seconds", seconds, stage="fetch")
+    merged = secdcf.RunMetrics()
+    for shard in shards:
+        merged.merge(json.loads(json.dumps(shard.summary())))  # as handed back by a worker process
+    summary = merged.summary()
+    assert summary["counters"] == [{"name": "stocks_total", "labels": {"outcome": "valued"}, "value": 2}]
+    assert summary["summaries"] == [{"name": "stage_seconds", "labels": {"stage": "fetch"}, "count": 2, "sum": 7.0,
+                                     "max": 5.0}]
+    assert set(summary["tickers"]) == {"AAPL", "WEC"}
+
+
+def testWritesJsonAndPrometheus(secdcf, tmp_path):
+    metrics = secdcf.RunMetrics()
+    metrics.count("cache_lookups_total", endpoint="quote", result="hit")
+    metrics.observe("ratelimit_wait_seconds", 0.5, limiter='sec "shared"')
+    jsonFile, promFile = tmp_path / "metrics.json", tmp_path / "metrics.prom"
+    metrics.write(str(jsonFile), str(promFile))
+    assert json.loads(jsonFile.read_text())["counters"][0]["value"] == 1
+    lines = promFile.read_text().splitlines()
+    assert "# TYPE secdcf_cache_lookups_total counter" in lines
+    assert 'secdcf_cache_lookups_total{endpoint="quote",result="hit"} 1.0' in lines
+    assert "secdcf_ratelimit_wait_seconds_count{limiter=\"sec 'shared'\"} 1" in lines
+    assert "secdcf_ratelimit_wait_seconds_sum{limiter=\"sec 'shared'\"} 0.5" in lines
+    assert "# TYPE secdcf_ratelimit_wait_seconds_max gauge" in lines
+
+    metrics.write("", "")  # both files left out
@@ -0,0 +1,37 @@
+# Tests of the whole market screen (screenFrames): the frames of every filer are joined by CIK, with each figure
+# taken from the first concept in the chain the filer reported it under.
+
+import numpy as np
+
+
+# frames api responses: (concept, period) -> list of [cik, entity name, value]
+frames = {("EarningsPerShareDiluted", "CY2020"): [[320193, "Apple Inc.", 3.28], [789019, "Microsoft Corp", 5.76]],
+          ("EarningsPerShareDiluted", "CY2021"): [[789019, "Microsoft Corp", 8.05], [320193, "Apple Inc.", 5.61]],
+          ("ComprehensiveIncomeNetOfTax", "CY2021"): [[320193, "Apple Inc.", 95.0]],
+          ("NetIncomeLoss", "CY2020"): [[320193, "Apple Inc.", 57.0], [1018724, "Amazon.com, Inc.", 21.0]],
+          ("NetIncomeLoss", "CY2021"): [[320193, "Apple Inc.", 94.0], [1018724, "Amazon.com, Inc.", 33.0]]}
+
+
+def getFrame(taxonomy, concept, unit, period):
+    if (concept, period) not in frames:
+        return [True, "404 not found"]
+    return [False, [{"cik": cik, "entityName": name, "val": val} for cik, name, val in frames[(concept, period)]]]
+
+
+def testScreenFramesJoinsByCik(secdcf, monkeypatch):
+    monkeypatch.setattr(secdcf, "get_sec_frame", getFrame)
+    ciks, [eps, income], names = secdcf.screenFrames(
+        [["USD/shares", [["us-gaap", "EarningsPerShareDiluted"]]],
+         ["USD", [["us-gaap", "ComprehensiveIncomeNetOfTax"], ["us-gaap", "NetIncomeLoss"]]]], [2020, 2021])
+    assert ciks.tolist() == [320193, 789019, 1018724]
+    np.testing.assert_array_equal(eps, [[3.28, 5.61], [5.76, 8.05], [np.nan, np.nan]])
+    # Apple's 2021 figure comes from the first concept of the chain, the rest from the fallback
+    np.testing.assert_array_equal(income, [[57.0, 95.0], [np.nan, np.nan], [21.0, 33.0]])
+    assert names[1018724] == "Amazon.com, Inc."
+
+
+def testScreenFramesNoData(secdcf, monkeypatch):
+    monkeypatch.setattr(secdcf, "get_sec_frame", getFrame)
+    ciks, [revenues], names = secdcf.screenFrames([["USD", [["us-gaap", "Revenues"]]]], [2020, 2021])
+    assert len(ciks) == 0 and revenues.shape == (0, 2)
+    assert names == {}
@@ -0,0 +1,46 @@
+# Tests of the sensitivity mode (sensitivityCube and cubeToLong): every grid point matches a valuation of the stock
+# on its own at that disct rate, number of years and growth haircut.
+
+import numpy as np
+import numpy_financial as npf
+import pytest
+
+
+disctRates = [0.05, 0.07, 0.10]
+yearsList = [5, 15]
+haircuts = [0.0, 0.5]
+
+
+def testCubeMatchesSingleValuations(secdcf):
+    price, epsNewest, growthPct = np.array([100.0, 40.0]), np.array([5.0, 1.5]), np.array([8.0, 20.0])
+    cube = secdcf.sensitivityCube(price, epsNewest, growthPct, disctRates, yearsList, haircuts)
+    for name in ["growth % pa", "NPV", "IRR %", "Req gr % pa", "solver status"]:
+        assert cube[name].shape == (2, 3, 2, 2)
+
+    for stock in range(2):
+        for r, rate in enumerate(disctRates):
+            for y, years in enumerate(yearsList):
+                for h, haircut in enumerate(haircuts):
+                    growth = growthPct[stock] * (1 - haircut)
+                    earnings = epsNewest[stock] * (1 + growth / 100) ** np.arange(1, years + 1)
+                    assert cube["growth % pa"][stock, r, y, h] == pytest.approx(growth)
+                    assert cube["NPV"][stock, r, y, h] == pytest.approx(
+                        np.sum(earnings / (1 + rate) ** np.arange(1, years + 1)), rel=1e-9)
+                    assert cube["IRR %"][stock, r, y, h] == pytest.approx(
+                        100 * npf.irr(np.concatenate([[-price[stock]], earnings])), rel=1e-7)
+                    reqGrowth = cube["Req gr % pa"][stock, r, y, h]
+                    assert secdcf.npvGeometric(epsNewest[stock], reqGrowth, rate, years) == pytest.approx(
+                        price[stock], rel=1e-9)
+
+
+def testCubeToLong(secdcf):
+    cube = secdcf.sensitivityCube(np.array([100.0, 50.0]), np.array([5.0, -1.0]), np.array([8.0, 3.0]), disctRates,
+                                  yearsList, haircuts)
+    table = secdcf.cubeToLong(["AAA", "BBB"], cube, disctRates, yearsList, haircuts)
+    assert len(table) == 2 * 3 * 2 * 2
+    row = table[(table["Ticker"] == "AAA") & (table["Disct rate %"] == 10.0) &
+                (table["Yrs discounted after purchase"] == 15) & (table["Growth haircut %"] == 50.0)]
+    assert row["NPV"].item() == pytest.approx(cube["NPV"][0, 2, 1, 1])
+    negative = table[table["Ticker"] == "BBB"]  # newest EPS not positive, no breakeven growth
+    assert (negative["solver status"] == secdcf.SOLVER_EPS_NOT_POSITIVE).all()
+    assert negative["Req gr % pa"].isna().all()
@@ -0,0 +1,19 @@
+# Tests of the set-up of a sharded run: the shard processes are started afresh, so they are handed the coordinator's
+# settings, but not its connections.
+
+def testShardSettings(secdcf, monkeypatch):
+    monkeypatch.setattr(secdcf, "secDataURL", "http://127.0.0.1:8080")  # as the benchmark points it at a stand-in
+    monkeypatch.setattr(secdcf, "tickerToCik", {"AAPL": "0000320193"}, raising=False)
+    monkeypatch.setattr(secdcf, "resumeRun", True)  # as --resume sets it
+    monkeypatch.setattr(secdcf, "quotePrices", {"AAPL": 180.0}, raising=False)
+    settings = secdcf.shardSettings()
+    assert settings["secDataURL"] == "http://127.0.0.1:8080"
+    assert settings["tickerToCik"] == {"AAPL": "0000320193"}
+    assert settings["resumeRun"] is True
+    assert settings["cacheTTL"] == secdcf.cacheTTL
+    for name in ["metrics", "responseCache", "hostSessions", "quotePrices", "runShard", "np"]:
+        assert name not in settings
+
+
+def testShardFileName(secdcf):
+    assert secdcf.shardFileName("sec dcf journal.jsonl", 1, 4) == "sec dcf journal shard 2 of 4.jsonl"
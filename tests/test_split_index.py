@@ -0,0 +1,28 @@
+# Tests of split adjustment (parseSplits and SplitIndex): the factor for a period is the product of the stock's splits
+# dated after the period end and before the price date.
+
+import numpy as np
+
+
+def testSplitIndex(secdcf):
+    splits = secdcf.SplitIndex([
+        secdcf.parseSplits({"historical": [{"date": "2014-06-09", "numerator": 7.0, "denominator": 1.0},
+                                           {"date": "2020-08-31", "numerator": 4.0, "denominator": 1.0}]}),
+        secdcf.parseSplits({}),
+        secdcf.parseSplits({"historical": [{"date": "2018-01-02", "numerator": 2.0, "denominator": 0.0}]})])
+    factors = splits.factors([[0], [0], [0], [1], [2], [2]],
+                             np.array(["2013-12-31", "2015-12-31", "NaT", "2013-12-31", "2016-12-31", "2019-12-31"],
+                                      dtype="datetime64[D]")[:, None],
+                             np.array(["2023-01-01"], dtype="datetime64[D]"))
+    np.testing.assert_allclose(factors[[0, 1, 2, 3, 5], 0], [28.0, 4.0, 1.0, 1.0, 1.0])
+    assert np.isnan(factors[4, 0])  # a split with a zero denominator can't be adjusted for
+
+
+def testSplitOnPeriodEnd(secdcf):
+    # a split on the period end is already in the reported figure, one on the price date is not yet in the price
+    splits = secdcf.SplitIndex([secdcf.parseSplits({"historical": [
+        {"date": "2020-12-31", "numerator": 2.0, "denominator": 1.0},
+        {"date": "2022-06-30", "numerator": 3.0, "denominator": 1.0}]})])
+    factors = splits.factors(0, np.array(["2020-12-31", "2021-12-31"], dtype="datetime64[D]"),
+                             np.array(["2022-06-30", "2022-07-01"], dtype="datetime64[D]")[:, None])
+    np.testing.assert_allclose(factors, [[1.0, 1.0], [3.0, 3.0]])
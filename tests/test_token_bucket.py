@@ -0,0 +1,92 @@
+# Tests of the rate limiters (TokenBucket and SharedTokenBucket): a full bucket lets a burst through, after which
+# requests are spaced at the rate, and threads, or the processes of a sharded run, together keep to it.
+
+import multiprocessing
+import threading
+import time
+import pytest
+
+
+# a clock for time.monotonic that time.sleep moves on instead of sleeping, shared by all threads. Like a real sleep
+# it takes at least a little time, else a wait of a rounding error would leave the clock where it was.
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.lock = threading.Lock()
+
+    def monotonic(self):
+        with self.lock:
+            return self.now
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.now = self.now + max(seconds, 1e-6)
+
+
+@pytest.fixture
+def clock(secdcf, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(secdcf.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(secdcf.time, "sleep", clock.sleep)
+    return clock
+
+
+def testBurstThenSpacedAtRate(secdcf, clock):
+    bucket = secdcf.TokenBucket(4.0)
+    waits = [bucket.acquire() for request in range(8)]
+    assert waits[0:4] == [0.0, 0.0, 0.0, 0.0]  # capacity defaults to one second's worth
+    assert waits[4:8] == pytest.approx([0.25, 0.25, 0.25, 0.25])
+    assert clock.now == pytest.approx(1001.0)
+
+
+def testRefillsUpToCapacity(secdcf, clock):
+    bucket = secdcf.TokenBucket(2.0, capacity=3)
+    for request in range(3):
+        bucket.acquire()
+    clock.sleep(60.0)  # idle for a minute, but the bucket only holds 3 tokens
+    assert [bucket.acquire() for request in range(4)] == pytest.approx([0.0, 0.0, 0.0, 0.5])
+
+
+def testSlowRateBucketHoldsOneToken(secdcf, clock):
+    bucket = secdcf.TokenBucket(0.5)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(2.0)
+
+
+def testThreadsShareTheRate(secdcf, clock):
+    bucket = secdcf.TokenBucket(10.0)
+    threads = [threading.Thread(target=lambda: [bucket.acquire() for request in range(10)]) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 40 requests: 10 from the full bucket, then 30 at 10 a second
+    assert clock.now - 1000.0 >= 3.0 - 1e-9
+
+
+# ---------------------------------------------------------------------------------------------------
+def testSharedBucketsShareOneBudget(secdcf, clock):
+    # two shards' limiters on one state, as runShards hands it to each shard
+    state = secdcf.SharedTokenBucket.newState(4.0)
+    shards = [secdcf.SharedTokenBucket(4.0, state), secdcf.SharedTokenBucket(4.0, state)]
+    state[1] = clock.now
+    waits = [shards[request % 2].acquire() for request in range(8)]
+    assert waits[0:4] == [0.0, 0.0, 0.0, 0.0]
+    assert waits[4:8] == pytest.approx([0.25, 0.25, 0.25, 0.25])
+
+
+def testSharedBucketAcrossProcesses(secdcf):
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("needs fork to hand the bucket to a child process")
+    # the real clock: 150 requests at 100 a second from two processes, 100 of them from the full bucket
+    state = secdcf.SharedTokenBucket.newState(100.0)
+    started = time.monotonic()
+    context = multiprocessing.get_context("fork")
+    children = [context.Process(target=lambda: [secdcf.SharedTokenBucket(100.0, state).acquire()
+                                                for request in range(75)]) for child in range(2)]
+    for child in children:
+        child.start()
+    for child in children:
+        child.join()
+    assert [child.exitcode for child in children] == [0, 0]
+    assert time.monotonic() - started >= 0.5 - 0.01
@@ -0,0 +1,73 @@
+# Tests of the valuation service's in-memory cache (WarmCache): values are kept until they expire, failed loads are
+# not kept, and concurrent requests for one key share a single load.
+
+import threading
+import pytest
+
+
+@pytest.fixture
+def clock(secdcf, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(secdcf.time, "monotonic", lambda: now[0])
+    return now
+
+
+def testKeepsUntilExpired(secdcf, clock):
+    cache = secdcf.WarmCache(60)
+    loads = []
+
+    def load(key):
+        loads.append(key)
+        return key.lower() + str(len(loads))
+
+    assert cache.get("AAPL", load) == ["aapl1", False]
+    clock[0] = clock[0] + 59
+    assert cache.get("AAPL", load) == ["aapl1", True]
+    clock[0] = clock[0] + 2
+    assert cache.get("AAPL", load) == ["aapl2", False]
+    assert loads == ["AAPL", "AAPL"]
+
+
+def testExpiredEntriesSwept(secdcf, clock):
+    cache = secdcf.WarmCache(60)
+    cache.get("AAPL", str.lower)
+    clock[0] = clock[0] + 61
+    cache.get("WEC", str.lower)  # more than a ttl since the last sweep
+    assert list(cache.entries.keys()) == ["WEC"]
+
+
+def testFailedLoadNotKept(secdcf, clock):
+    cache = secdcf.WarmCache(60)
+    results = iter([["network down", None], ["", "0000320193"]])
+
+    def lookup(key):
+        return next(results)
+
+    assert cache.get("AAPL", lookup, keep=lambda found: found[0] == "") == [["network down", None], False]
+    assert cache.get("AAPL", lookup, keep=lambda found: found[0] == "") == [["", "0000320193"], False]
+    assert cache.get("AAPL", lookup, keep=lambda found: found[0] == "") == [["", "0000320193"], True]
+
+
+def testConcurrentRequestsShareOneLoad(secdcf):
+    cache = secdcf.WarmCache(60)
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def slowLoad(key):
+        loads.append(key)
+        started.set()
+        release.wait()
+        return "facts of " + key
+
+    answers = []
+    threads = [threading.Thread(target=lambda: answers.append(cache.get("0000320193", slowLoad)))
+               for thread in range(4)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert loads == ["0000320193"]
+    assert sorted(answers) == [["facts of 0000320193", False]] + [["facts of 0000320193", True]] * 3